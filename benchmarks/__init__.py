@@ -0,0 +1,5 @@
+"""
+Performance benchmarks for the TopicRNN training and inference hot paths.
+
+Run all of them with ``python -m benchmarks``; see ``benchmarks/__main__.py`` for options.
+"""
@@ -0,0 +1,135 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+from collections import OrderedDict
+
+import torch
+from allennlp.common.util import ensure_list
+from allennlp.data.vocabulary import Vocabulary
+
+from benchmarks.checkpointing import benchmark_activation_checkpointing
+from benchmarks.common import as_batches, build_model, environment
+from benchmarks.mixed_precision import benchmark_mixed_precision
+from benchmarks.model import (benchmark_inference_latency, benchmark_peak_memory,
+                              benchmark_perplexity, benchmark_stages, benchmark_training_step)
+from benchmarks.prefetching import benchmark_prefetching
+from benchmarks.readers import benchmark_readers
+from benchmarks.sparse_gradients import benchmark_sparse_gradients
+from benchmarks.synthetic import write_synthetic_corpus
+from benchmarks.vocabulary import benchmark_vocabulary
+from library.dataset_readers.imdb_review_reader import IMDBReviewReader
+
+SUITES = ["readers", "vocabulary", "training_step", "stages", "inference_latency", "perplexity", "peak_memory",
+          "activation_checkpointing", "mixed_precision", "sparse_gradients", "prefetching"]
+
+
+def main():
+    """
+    Runs the TopicRNN benchmarks and emits the results as JSON.
+
+    By default the benchmarks run on ``tests/fixtures/smoke.jsonl``. With ``--synthetic``, a
+    corpus of ``--num-documents`` reviews of ``--document-length`` words over a
+    ``--vocab-size``-word vocabulary is generated instead.
+    """
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--data-path", type=str, default="tests/fixtures/smoke.jsonl",
+                        help="The .jsonl corpus to benchmark on.")
+    parser.add_argument("--synthetic", action="store_true",
+                        help="Benchmark on a generated corpus instead of --data-path.")
+    parser.add_argument("--num-documents", type=int, default=200,
+                        help="Reviews in the synthetic corpus.")
+    parser.add_argument("--vocab-size", type=int, default=5000,
+                        help="Distinct words in the synthetic corpus.")
+    parser.add_argument("--document-length", type=int, default=250,
+                        help="Words per synthetic review.")
+    parser.add_argument("--max-vocab-size", type=int, default=10000,
+                        help="Maximum size of the model vocabulary.")
+    parser.add_argument("--words-per-instance", type=int, default=35,
+                        help="BPTT limit used by the readers.")
+    parser.add_argument("--batch-size", type=int, default=64,
+                        help="Batch size for training-step benchmarks.")
+    parser.add_argument("--topic-dim", type=int, default=10,
+                        help="Number of topics of the benchmarked model.")
+    parser.add_argument("--hidden-size", type=int, default=128,
+                        help="Hidden size of the benchmarked model's RNN.")
+    parser.add_argument("--repeat", type=int, default=10,
+                        help="Timed repetitions per measurement.")
+    parser.add_argument("--training-steps", type=int, default=50,
+                        help="Optimizer steps for benchmarks that compare loss curves.")
+    parser.add_argument("--suites", type=str, default=",".join(SUITES),
+                        help="Comma-separated subset of: " + ", ".join(SUITES))
+    parser.add_argument("--threads", type=int, default=None,
+                        help="Number of intra-op threads to use.")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Where to write the JSON results (stdout if omitted).")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(1337)
+
+    suites = args.suites.split(",")
+    data_path = args.data_path
+    if args.synthetic:
+        data_path = write_synthetic_corpus(os.path.join(tempfile.mkdtemp(), "synthetic.jsonl"),
+                                           num_documents=args.num_documents,
+                                           vocab_size=args.vocab_size,
+                                           document_length=args.document_length)
+
+    results = OrderedDict()
+    results["environment"] = environment()
+    results["config"] = vars(args)
+
+    if "readers" in suites:
+        results["readers"] = benchmark_readers(data_path, args.words_per_instance)
+    if "vocabulary" in suites:
+        results["vocabulary"] = benchmark_vocabulary(data_path, args.words_per_instance, args.max_vocab_size)
+
+    instances = ensure_list(IMDBReviewReader(words_per_instance=args.words_per_instance).read(data_path))
+    vocab = Vocabulary.from_instances(instances, max_vocab_size=args.max_vocab_size)
+    model = build_model(vocab, hidden_size=args.hidden_size, topic_dim=args.topic_dim)
+    batch = next(iter(as_batches(instances, vocab, args.batch_size)))
+    results["config"]["vocab_size"] = vocab.get_vocab_size("tokens")
+
+    if "training_step" in suites:
+        results["training_step"] = benchmark_training_step(model, batch, args.repeat)
+    if "stages" in suites:
+        results["stages"] = benchmark_stages(model, batch, args.repeat)
+    if "inference_latency" in suites:
+        results["inference_latency"] = benchmark_inference_latency(model, instances, repeat=args.repeat)
+    if "perplexity" in suites:
+        results["perplexity"] = benchmark_perplexity(vocab.get_vocab_size("tokens"), args.batch_size,
+                                                     args.words_per_instance, args.repeat)
+    if "peak_memory" in suites:
+        results["peak_memory"] = benchmark_peak_memory(model, batch)
+    if "activation_checkpointing" in suites:
+        results["activation_checkpointing"] = benchmark_activation_checkpointing(
+                vocab, batch, args.repeat, hidden_size=args.hidden_size, topic_dim=args.topic_dim)
+    if "mixed_precision" in suites:
+        results["mixed_precision"] = benchmark_mixed_precision(
+                vocab, list(as_batches(instances, vocab, args.batch_size)), args.training_steps, args.repeat,
+                hidden_size=args.hidden_size, topic_dim=args.topic_dim)
+    if "sparse_gradients" in suites:
+        results["sparse_gradients"] = benchmark_sparse_gradients(
+                vocab, batch, args.repeat, hidden_size=args.hidden_size, topic_dim=args.topic_dim)
+    if "prefetching" in suites:
+        results["prefetching"] = benchmark_prefetching(
+                data_path, vocab, args.words_per_instance, args.batch_size, args.training_steps,
+                hidden_size=args.hidden_size, topic_dim=args.topic_dim)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output)
+    else:
+        sys.stdout.write(output + "\n")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(name)s - %(message)s',
+                        level=logging.WARNING)
+    main()
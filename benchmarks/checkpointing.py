@@ -0,0 +1,39 @@
+"""
+The memory/time trade-off of ``TopicRNN``'s ``checkpoint_activations`` option.
+"""
+from collections import OrderedDict
+from typing import Any, Dict
+
+import torch
+from allennlp.data.vocabulary import Vocabulary
+
+from benchmarks.common import build_model, measure_peak_memory, timed
+
+
+def benchmark_activation_checkpointing(vocab: Vocabulary,
+                                       batch: Dict[str, Any],
+                                       repeat: int = 10,
+                                       **model_kwargs) -> Dict[str, Any]:
+    """
+    Training step time and peak RSS of a training step with and without activation
+    checkpointing, for identically initialized models.
+    """
+    results = OrderedDict()
+    for checkpoint_activations in (False, True):
+        torch.manual_seed(1337)
+        model = build_model(vocab, checkpoint_activations=checkpoint_activations, **model_kwargs)
+        model.train()
+
+        def training_step():
+            model.zero_grad()
+            model(**batch)['loss'].backward()  # pylint: disable=cell-var-from-loop
+
+        results["checkpointed" if checkpoint_activations else "baseline"] = {
+                "forward_backward": timed(training_step, repeat),
+                "peak_memory_bytes": measure_peak_memory(training_step),
+        }
+
+    baseline, checkpointed = results["baseline"], results["checkpointed"]
+    results["time_ratio"] = checkpointed["forward_backward"]["mean"] / baseline["forward_backward"]["mean"]
+    results["memory_ratio"] = checkpointed["peak_memory_bytes"] / baseline["peak_memory_bytes"]
+    return results
@@ -0,0 +1,112 @@
+"""
+Shared helpers for the benchmarks: timing, memory measurement and model construction.
+"""
+import gc
+import os
+import resource
+import statistics
+import subprocess
+import time
+from typing import Any, Callable, Dict, Iterable, List
+
+import torch
+from allennlp.data.dataset import Batch
+from allennlp.data.instance import Instance
+from allennlp.data.vocabulary import Vocabulary
+from allennlp.modules.seq2seq_encoders import PytorchSeq2SeqWrapper
+from allennlp.modules.text_field_embedders import BasicTextFieldEmbedder
+from allennlp.modules.token_embedders import Embedding
+
+from library.models.topic_rnn import TopicRNN
+from library.vocabulary.preparation import add_stopless_namespace
+
+
+def timed(function: Callable[[], Any], repeat: int = 10, warmup: int = 2) -> Dict[str, float]:
+    """
+    Calls ``function`` ``warmup + repeat`` times and summarizes the wall time of the last
+    ``repeat`` calls in seconds.
+    """
+    for _ in range(warmup):
+        function()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return summarize(times)
+
+
+def summarize(times: List[float]) -> Dict[str, float]:
+    ordered = sorted(times)
+    return {
+        "mean": statistics.mean(ordered),
+        "median": statistics.median(ordered),
+        "min": ordered[0],
+        "p90": ordered[min(len(ordered) - 1, int(0.9 * len(ordered)))],
+        "repeat": len(ordered),
+    }
+
+
+def peak_rss_bytes() -> int:
+    """ The peak resident set size of this process so far (Linux reports kilobytes). """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def measure_peak_memory(function: Callable[[], Any]) -> int:
+    """
+    Runs ``function`` once in a forked child and returns the child's peak RSS in bytes, so
+    that the measurement is not masked by the parent's own high-water mark.
+    """
+    gc.collect()
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:  # pragma: no cover
+        os.close(read_fd)
+        function()
+        os.write(write_fd, str(peak_rss_bytes()).encode())
+        os._exit(0)  # pylint: disable=protected-access
+    os.close(write_fd)
+    with os.fdopen(read_fd) as reader:
+        result = reader.read()
+    os.waitpid(pid, 0)
+    return int(result) if result else -1
+
+
+def environment() -> Dict[str, Any]:
+    """ Describes where a benchmark ran so that results can be compared across commits. """
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"],
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "torch": torch.__version__,
+        "num_threads": torch.get_num_threads(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def build_model(vocab: Vocabulary,
+                embedding_dim: int = 100,
+                hidden_size: int = 128,
+                num_layers: int = 2,
+                topic_dim: int = 10,
+                sparse: bool = False,
+                **kwargs) -> TopicRNN:
+    """ A ``TopicRNN`` shaped like ``tests/fixtures/smoke_imdb_unsupervised_training.json``. """
+    add_stopless_namespace(vocab)
+    embedder = BasicTextFieldEmbedder({
+            "tokens": Embedding(vocab.get_vocab_size("tokens"), embedding_dim, sparse=sparse)
+    })
+    encoder = PytorchSeq2SeqWrapper(torch.nn.RNN(embedding_dim, hidden_size,
+                                                 num_layers=num_layers, batch_first=True))
+    return TopicRNN(vocab, embedder, encoder, topic_dim=topic_dim, **kwargs)
+
+
+def as_batches(instances: List[Instance], vocab: Vocabulary, batch_size: int) -> Iterable[Dict[str, Any]]:
+    """ Indexes and tensorizes ``instances`` into consecutive batches. """
+    for start in range(0, len(instances), batch_size):
+        batch = Batch(instances[start:start + batch_size])
+        batch.index_instances(vocab)
+        yield batch.as_tensor_dict()
@@ -0,0 +1,86 @@
+"""
+Checkpoint size and save/load time of a classifier fine-tuned on a frozen pretrained archive,
+with full weights and with ``delta_checkpoints``.
+
+Run with ``python -m benchmarks.delta_checkpoints``; pass e.g.
+``--overrides '{"model": {"topic_dim": 200, "text_encoder": {"hidden_size": 300}}}'`` for a
+pretrained model of realistic size.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+from collections import OrderedDict
+
+import torch
+from allennlp.common import Params
+from allennlp.data.vocabulary import Vocabulary
+from allennlp.models.model import Model
+
+from benchmarks.common import environment, timed
+from benchmarks.startup import write_archive
+from library.common.archives import ExtractedArchive
+import library.models  # pylint: disable=unused-import
+
+
+def build_classifier(archive_file: str, delta_checkpoints: bool) -> Model:
+    """ A frozen-feature classifier initialized from ``archive_file``. """
+    overrides = json.dumps({"model": {"classification_mode": True,
+                                      "freeze_feature_extraction": True,
+                                      "pretrained_file": archive_file,
+                                      "delta_checkpoints": delta_checkpoints}})
+    with ExtractedArchive(archive_file) as archive_dir:
+        config = Params.from_file(os.path.join(archive_dir, "config.json"), overrides)
+        vocab = Vocabulary.from_files(os.path.join(archive_dir, "vocabulary"))
+    return Model.from_params(vocab=vocab, params=config.pop("model"))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--config-file", type=str,
+                        default="tests/fixtures/smoke_imdb_unsupervised_training.json",
+                        help="Experiment config of the pretrained model.")
+    parser.add_argument("--overrides", type=str, default="",
+                        help="JSON overrides applied to --config-file.")
+    parser.add_argument("--archive-file", type=str, default=None,
+                        help="A pretrained archive to use instead of one built from --config-file.")
+    parser.add_argument("--repeat", type=int, default=10,
+                        help="Timed repetitions per measurement.")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Where to write the JSON results (stdout if omitted).")
+    args = parser.parse_args()
+
+    serialization_dir = tempfile.mkdtemp()
+    archive_file = args.archive_file or write_archive(args.config_file, os.path.join(serialization_dir, "model"),
+                                                      args.overrides)
+
+    results = OrderedDict()
+    results["environment"] = environment()
+    results["config"] = vars(args)
+    for name, delta_checkpoints in (("full", False), ("delta", True)):
+        model = build_classifier(archive_file, delta_checkpoints)
+        weights_file = os.path.join(serialization_dir, name + ".th")
+        # pylint: disable=cell-var-from-loop
+        save = timed(lambda: torch.save(model.state_dict(), weights_file), args.repeat)
+        load = timed(lambda: model.load_state_dict(torch.load(weights_file)), args.repeat)
+        results[name] = OrderedDict([
+                ("parameters", sum(parameter.numel() for parameter in model.parameters())),
+                ("trainable_parameters", sum(parameter.numel() for parameter in model.parameters()
+                                             if parameter.requires_grad)),
+                ("checkpoint_bytes", os.path.getsize(weights_file)),
+                ("save_seconds", save),
+                ("load_seconds", load),
+        ])
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output)
+    else:
+        sys.stdout.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
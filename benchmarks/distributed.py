@@ -0,0 +1,87 @@
+"""
+Scaling efficiency of data-parallel CPU training (``library.training.distributed``) from one
+process to ``--max-processes`` on a synthetic corpus.
+
+Run with ``python -m benchmarks.distributed``.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+from collections import OrderedDict
+
+import torch.multiprocessing as mp
+
+from benchmarks.common import environment
+from benchmarks.synthetic import write_synthetic_corpus
+from library.training.distributed import train_worker
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--config-file", type=str,
+                        default="tests/fixtures/smoke_imdb_unsupervised_training.json",
+                        help="Experiment config; its data paths are replaced by a synthetic corpus.")
+    parser.add_argument("--max-processes", type=int, default=4,
+                        help="Largest number of processes to scale to (powers of two up to it).")
+    parser.add_argument("--threads-per-process", type=int, default=1,
+                        help="Intra-op threads per process.")
+    parser.add_argument("--num-documents", type=int, default=200,
+                        help="Reviews in the synthetic corpus.")
+    parser.add_argument("--vocab-size", type=int, default=5000,
+                        help="Distinct words in the synthetic corpus.")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Where to write the JSON results (stdout if omitted).")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    with open(args.config_file, 'r') as config_file:
+        config = json.load(config_file)
+    config["train_data_path"] = write_synthetic_corpus(os.path.join(work_dir, "synthetic.jsonl"),
+                                                       num_documents=args.num_documents,
+                                                       vocab_size=args.vocab_size)
+    config["validation_data_path"] = config["train_data_path"]
+    config["trainer"]["num_epochs"] = 1
+    config_path = os.path.join(work_dir, "config.json")
+    with open(config_path, 'w') as config_file:
+        json.dump(config, config_file)
+
+    counts = [1]
+    while counts[-1] * 2 <= args.max_processes:
+        counts.append(counts[-1] * 2)
+
+    results = OrderedDict()
+    results["environment"] = environment()
+    results["runs"] = OrderedDict()
+    for port_offset, num_processes in enumerate(counts):
+        serialization_dir = os.path.join(work_dir, "run_{}".format(num_processes))
+        mp.spawn(train_worker,
+                 args=(num_processes, config_path, serialization_dir,
+                       29500 + port_offset, args.threads_per_process, 1337),
+                 nprocs=num_processes)
+        with open(os.path.join(serialization_dir, "metrics.json"), 'r') as metrics_file:
+            metrics = json.load(metrics_file)
+        with open(os.path.join(serialization_dir, "loss_curve.json"), 'r') as curve_file:
+            loss_curve = json.load(curve_file)
+        results["runs"][str(num_processes)] = {
+                "instances_per_second": metrics["epochs"][-1]["instances_per_second"],
+                "loss_curve": loss_curve,
+        }
+
+    baseline = results["runs"]["1"]["instances_per_second"]
+    for num_processes, run in results["runs"].items():
+        run["speedup"] = run["instances_per_second"] / baseline
+        run["scaling_efficiency"] = run["speedup"] / int(num_processes)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output)
+    else:
+        sys.stdout.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Step time and convergence of ``TopicRNN``'s ``bfloat16`` autocast mode against fp32.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, List
+
+import torch
+from allennlp.data.vocabulary import Vocabulary
+
+from benchmarks.common import build_model, timed
+
+
+def benchmark_mixed_precision(vocab: Vocabulary,
+                              batches: List[Dict[str, Any]],
+                              num_steps: int = 50,
+                              repeat: int = 10,
+                              **model_kwargs) -> Dict[str, Any]:
+    """
+    Trains identically initialized fp32 and bf16 models with Adam for ``num_steps`` steps over
+    ``batches`` (cycled), recording both loss curves, and times a training step of each.
+    The topic noise is reseeded before every step so both runs draw the same samples.
+    """
+    results = OrderedDict()
+    for bfloat16 in (False, True):
+        torch.manual_seed(1337)
+        model = build_model(vocab, bfloat16=bfloat16, **model_kwargs)
+        model.train()
+        optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+
+        loss_curve = []
+        for step in range(num_steps):
+            torch.manual_seed(step)
+            optimizer.zero_grad()
+            loss = model(**batches[step % len(batches)])['loss']
+            loss.backward()
+            optimizer.step()
+            loss_curve.append(loss.item())
+
+        def training_step():
+            model.zero_grad()
+            model(**batches[0])['loss'].backward()  # pylint: disable=cell-var-from-loop
+
+        results["bf16" if bfloat16 else "fp32"] = {
+                "forward_backward": timed(training_step, repeat),
+                "loss_curve": loss_curve,
+        }
+
+    fp32, bf16 = results["fp32"], results["bf16"]
+    results["speedup"] = fp32["forward_backward"]["mean"] / bf16["forward_backward"]["mean"]
+    results["max_relative_loss_difference"] = max(abs(b - f) / abs(f) for f, b in
+                                                  zip(fp32["loss_curve"], bf16["loss_curve"]))
+    results["final_relative_loss_difference"] = \
+        abs(bf16["loss_curve"][-1] - fp32["loss_curve"][-1]) / abs(fp32["loss_curve"][-1])
+    return results
@@ -0,0 +1,95 @@
+"""
+Step time, per-stage cost, inference latency and peak memory of ``TopicRNN``, and the cost of
+the ``Perplexity`` metric.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, List
+
+import torch
+from allennlp.data.instance import Instance
+
+from benchmarks.common import as_batches, measure_peak_memory, summarize, timed
+from library.metrics.perplexity import Perplexity
+from library.models.topic_rnn import TopicRNN
+
+
+def benchmark_training_step(model: TopicRNN, batch: Dict[str, Any], repeat: int = 10) -> Dict[str, Any]:
+    """ Wall time of a full forward and of a full forward + backward. """
+    model.train()
+
+    def forward():
+        return model(**batch)['loss']
+
+    def forward_backward():
+        model.zero_grad()
+        forward().backward()
+
+    with torch.no_grad():
+        forward_only = timed(forward, repeat)
+    return {"forward": forward_only, "forward_backward": timed(forward_backward, repeat)}
+
+
+def benchmark_stages(model: TopicRNN, batch: Dict[str, Any], repeat: int = 10) -> Dict[str, Any]:
+    """
+    Forward time and memory broken down by stage, as recorded by the model's ``StageProfiler``.
+    """
+    profiler = model.profiler
+    enabled = profiler.enabled
+    profiler.enabled = True
+    try:
+        with torch.no_grad():
+            # Warm up before measuring.
+            model(**batch)
+            profiler.reset()
+            for _ in range(repeat):
+                model(**batch)
+        return profiler.get_report(reset=True)
+    finally:
+        profiler.enabled = enabled
+
+
+def benchmark_inference_latency(model: TopicRNN,
+                                instances: List[Instance],
+                                batch_sizes=(1, 16, 256),
+                                repeat: int = 10) -> Dict[str, Any]:
+    """ Latency of a no-grad forward pass at each batch size. """
+    model.eval()
+    results = OrderedDict()
+    for batch_size in batch_sizes:
+        # Repeat instances if the corpus is too small for the batch size.
+        pool = (instances * (batch_size // len(instances) + 1))[:batch_size]
+        batch = next(iter(as_batches(pool, model.vocab, batch_size)))
+        with torch.no_grad():
+            stats = timed(lambda: model(**batch), repeat)  # pylint: disable=cell-var-from-loop
+        stats["instances_per_second"] = batch_size / stats["mean"]
+        results[str(batch_size)] = stats
+    return results
+
+
+def benchmark_perplexity(vocab_size: int,
+                         batch_size: int = 64,
+                         sequence_length: int = 35,
+                         repeat: int = 10) -> Dict[str, Any]:
+    """ Cost of one ``Perplexity`` update on random logits of the given shape. """
+    logits = torch.randn(batch_size, sequence_length, vocab_size)
+    targets = torch.randint(0, vocab_size, (batch_size, sequence_length), dtype=torch.long)
+    mask = torch.ones(batch_size, sequence_length)
+    metric = Perplexity()
+    return timed(lambda: metric(logits, targets, mask), repeat)
+
+
+def benchmark_peak_memory(model: TopicRNN, batch: Dict[str, Any]) -> Dict[str, int]:
+    """ Peak RSS of a process running one training step, and one no-grad forward. """
+    def training_step():
+        model.train()
+        model(**batch)['loss'].backward()
+
+    def inference():
+        model.eval()
+        with torch.no_grad():
+            model(**batch)
+
+    return {
+        "training_step_bytes": measure_peak_memory(training_step),
+        "inference_bytes": measure_peak_memory(inference),
+    }
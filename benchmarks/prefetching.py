@@ -0,0 +1,65 @@
+"""
+Training step time with batches built on the training thread against a ``PrefetchIterator``.
+"""
+import itertools
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator
+
+import torch
+from allennlp.data.iterators import BasicIterator, DataIterator
+from allennlp.data.vocabulary import Vocabulary
+
+from benchmarks.common import as_batches, build_model, summarize
+from library.dataset_readers.imdb_review_reader import IMDBReviewReader
+from library.iterators.prefetch_iterator import PrefetchIterator
+
+
+def benchmark_prefetching(data_path: str,
+                          vocab: Vocabulary,
+                          words_per_instance: int = 35,
+                          batch_size: int = 64,
+                          num_steps: int = 50,
+                          num_workers: int = 2,
+                          **model_kwargs) -> Dict[str, Any]:
+    """
+    Times ``num_steps`` training steps (after two warmup steps) fed by a lazy
+    ``IMDBReviewReader`` through a ``BasicIterator``, then through a ``PrefetchIterator``
+    wrapping it, and compares both against the pure model step on pre-built tensors.
+    """
+    torch.manual_seed(1337)
+    model = build_model(vocab, **model_kwargs)
+    model.train()
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+
+    def step_times(batches: Iterator[Dict[str, Any]]) -> Dict[str, float]:
+        times = []
+        start = time.perf_counter()
+        for batch in itertools.islice(batches, num_steps + 2):
+            optimizer.zero_grad()
+            model(**batch)['loss'].backward()
+            optimizer.step()
+            end = time.perf_counter()
+            times.append(end - start)
+            start = end
+        return summarize(times[2:])
+
+    def iterator_batches(iterator: DataIterator) -> Iterator[Dict[str, Any]]:
+        iterator.index_with(vocab)
+        reader = IMDBReviewReader(words_per_instance=words_per_instance, lazy=True)
+        return iterator(reader.read(data_path), num_epochs=None, shuffle=False)
+
+    reader = IMDBReviewReader(words_per_instance=words_per_instance)
+    instances = list(itertools.islice(reader.read(data_path), batch_size * 4))
+    prebuilt = list(as_batches(instances, vocab, batch_size))
+
+    results = OrderedDict()
+    results["model_step"] = step_times(itertools.cycle(prebuilt))
+    results["basic_iterator"] = step_times(iterator_batches(BasicIterator(batch_size=batch_size)))
+    results["prefetch_iterator"] = step_times(iterator_batches(
+            PrefetchIterator(BasicIterator(batch_size=batch_size), num_workers=num_workers)))
+    results["basic_iterator_overhead"] = \
+        results["basic_iterator"]["mean"] / results["model_step"]["mean"] - 1
+    results["prefetch_iterator_overhead"] = \
+        results["prefetch_iterator"]["mean"] / results["model_step"]["mean"] - 1
+    return results
@@ -0,0 +1,100 @@
+"""
+Seconds to build the pretrained embedding matrix of a vocabulary with AllenNLP's
+``_read_pretrained_embedding_file`` and with ``library.modules.pretrained_embeddings``: on
+first use (converting the file), for a new vocabulary of an already converted file, and
+for a vocabulary read before.
+
+The embedding file is a generated GloVe-style ``.txt.gz`` unless ``--embeddings-file`` is given.
+Run with ``python -m benchmarks.pretrained_embeddings``.
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+import numpy
+import torch
+from allennlp.data.vocabulary import Vocabulary
+from allennlp.modules.token_embedders.embedding import _read_pretrained_embedding_file
+
+from benchmarks.common import environment
+from library.modules.pretrained_embeddings import read_embeddings
+
+
+def write_synthetic_embeddings(path: str, num_words: int, embedding_dim: int) -> str:
+    """ Writes ``num_words`` random vectors named ``word0``, ``word1``, ... as a gzipped text file. """
+    random = numpy.random.RandomState(1337)
+    with gzip.open(path, 'wt', compresslevel=1) as embeddings_out:
+        for index in range(num_words):
+            vector = " ".join("{:.5f}".format(value) for value in random.randn(embedding_dim))
+            embeddings_out.write("word{} {}\n".format(index, vector))
+    return path
+
+
+def sample_vocabulary(num_words: int, vocab_size: int, seed: int) -> Vocabulary:
+    """ ``vocab_size`` words of a synthetic embedding file, and one in ten words it lacks. """
+    random = numpy.random.RandomState(seed)
+    vocab = Vocabulary()
+    for index in random.choice(num_words, vocab_size, replace=False):
+        vocab.add_token_to_namespace("word{}".format(index), "tokens")
+    for index in range(vocab_size // 10):
+        vocab.add_token_to_namespace("unseen{}".format(index), "tokens")
+    return vocab
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--embeddings-file", type=str, default=None,
+                        help="A pretrained embedding file whose words are word0, word1, ... "
+                             "(generated if omitted).")
+    parser.add_argument("--num-words", type=int, default=400000,
+                        help="Words in the generated embedding file.")
+    parser.add_argument("--embedding-dim", type=int, default=100,
+                        help="The dimension of the vectors.")
+    parser.add_argument("--vocab-size", type=int, default=50000,
+                        help="Words of the embedding file in each vocabulary.")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Where to write the JSON results (stdout if omitted).")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    embeddings_file = args.embeddings_file or write_synthetic_embeddings(
+            os.path.join(directory, "embeddings.txt.gz"), args.num_words, args.embedding_dim)
+    cache_directory = os.path.join(directory, "cache")
+    vocab, other_vocab = (sample_vocabulary(args.num_words, args.vocab_size, seed) for seed in (1, 2))
+
+    results = OrderedDict()
+    results["environment"] = environment()
+    results["config"] = vars(args)
+    loads = [("allennlp", lambda: _read_pretrained_embedding_file(embeddings_file, args.embedding_dim, vocab)),
+             ("cached_first_use", lambda: read_embeddings(embeddings_file, args.embedding_dim, vocab,
+                                                          cache_directory=cache_directory)),
+             ("cached_new_vocabulary", lambda: read_embeddings(embeddings_file, args.embedding_dim, other_vocab,
+                                                               cache_directory=cache_directory)),
+             ("cached", lambda: read_embeddings(embeddings_file, args.embedding_dim, vocab,
+                                                cache_directory=cache_directory))]
+    matrices = {}
+    for name, load in loads:
+        torch.manual_seed(1337)
+        start = time.perf_counter()
+        matrices[name] = load()
+        results[name] = {"seconds": time.perf_counter() - start}
+    for name in ("cached_first_use", "cached"):
+        results[name]["speedup"] = results["allennlp"]["seconds"] / results[name]["seconds"]
+        results[name]["max_abs_difference"] = (matrices[name] - matrices["allennlp"]).abs().max().item()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output)
+    else:
+        sys.stdout.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
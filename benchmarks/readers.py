@@ -0,0 +1,29 @@
+"""
+Throughput of the IMDB dataset readers.
+"""
+import time
+from typing import Any, Dict
+
+from allennlp.common.util import ensure_list
+
+from library.dataset_readers.imdb_review_reader import (IMDBReviewLanguageModelingReader,
+                                                        IMDBReviewReader)
+
+
+def benchmark_readers(data_path: str, words_per_instance: int = 35) -> Dict[str, Any]:
+    """ Instances and tokens read per second by each reader over ``data_path``. """
+    results = {}
+    for name, reader in [("imdb_review_reader", IMDBReviewReader(words_per_instance=words_per_instance)),
+                         ("imdb_review_language_modeling_reader",
+                          IMDBReviewLanguageModelingReader(words_per_instance=words_per_instance))]:
+        start = time.perf_counter()
+        instances = ensure_list(reader.read(data_path))
+        elapsed = time.perf_counter() - start
+        num_tokens = sum(len(instance.fields["input_tokens"].tokens) for instance in instances)
+        results[name] = {
+            "seconds": elapsed,
+            "instances": len(instances),
+            "instances_per_second": len(instances) / elapsed,
+            "tokens_per_second": num_tokens / elapsed,
+        }
+    return results
@@ -0,0 +1,149 @@
+"""
+Memory use and cold-start time of N forked inference workers for three ways of loading a
+trained archive:
+
+- ``load_archive``: every worker loads it with ``allennlp.models.archival.load_archive``,
+- ``load_model``: every worker loads it with ``library.inference.loading.load_model``, which
+  memory-maps the weights file,
+- ``shared``: the parent loads it once with ``load_model(share_memory=True)`` and forks the
+  workers (``library.inference.forking``).
+
+The cold start is the time from the start of loading until every worker has made its first
+prediction. Per worker, RSS counts shared pages in full, PSS splits them among the processes
+sharing them and USS counts private pages only, so the total PSS is what the workers occupy
+together. Memory is read from ``/proc/self/smaps_rollup`` (Linux 4.14+) while all workers are
+alive. Every measurement runs in a fresh interpreter.
+
+Run with ``python -m benchmarks.shared_weights --workers 1,16``.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Any, Dict
+
+import torch
+from allennlp.data.dataset import Batch
+from allennlp.models.archival import load_archive
+from allennlp.models.model import Model
+
+from benchmarks.common import environment, summarize
+from benchmarks.startup import write_archive
+import library.models  # pylint: disable=unused-import
+from library.dataset_readers.imdb_review_reader import IMDBReviewReader
+from library.inference.forking import fork_workers, wait_for_workers
+from library.inference.loading import load_model
+
+STRATEGIES = ["load_archive", "load_model", "shared"]
+
+
+def memory_usage() -> Dict[str, int]:
+    """ The RSS, PSS and USS of this process in bytes. """
+    fields = {}
+    with open("/proc/self/smaps_rollup", 'r') as smaps:
+        for line in smaps:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    return {"rss": fields["Rss"], "pss": fields["Pss"],
+            "uss": fields["Private_Clean"] + fields["Private_Dirty"]}
+
+
+def _load(strategy: str, archive_file: str) -> Model:
+    if strategy == "load_archive":
+        return load_archive(archive_file).model.eval()
+    return load_model(archive_file, share_memory=strategy == "shared")
+
+
+def run_workers(strategy: str, archive_file: str, data_path: str, num_workers: int) -> None:
+    """ Starts ``num_workers`` workers with ``strategy`` and prints their measurements as JSON. """
+    instance = next(iter(IMDBReviewReader(words_per_instance=35).read(data_path)))
+    ready_read, ready_write = os.pipe()
+    go_read, go_write = os.pipe()
+
+    start = time.perf_counter()
+    model = _load(strategy, archive_file) if strategy == "shared" else None
+
+    def run_worker(_: int) -> None:
+        worker_model = model if model is not None else _load(strategy, archive_file)
+        batch = Batch([instance])
+        batch.index_instances(worker_model.vocab)
+        with torch.no_grad():
+            worker_model(**batch.as_tensor_dict())
+        os.write(ready_write, b"r")
+        # Memory is measured once every worker holds its model.
+        os.read(go_read, 1)
+        os.write(ready_write, (json.dumps(memory_usage()) + "\n").encode())
+
+    pids = fork_workers(run_worker, num_workers)
+    # Reads end at EOF rather than block if a worker fails.
+    os.close(ready_write)
+    os.close(go_read)
+    with os.fdopen(ready_read, 'rb') as ready:
+        if len(ready.read(num_workers)) < num_workers:
+            wait_for_workers(pids)
+            raise RuntimeError("A {} worker failed to start".format(strategy))
+        cold_start = time.perf_counter() - start
+        os.write(go_write, b"g" * num_workers)
+        usage = [json.loads(ready.readline().decode()) for _ in range(num_workers)]
+    failures = wait_for_workers(pids)
+
+    print(json.dumps({
+            "cold_start_seconds": cold_start,
+            "failures": failures,
+            "rss_per_worker": summarize([worker["rss"] for worker in usage]),
+            "pss_per_worker": summarize([worker["pss"] for worker in usage]),
+            "uss_per_worker": summarize([worker["uss"] for worker in usage]),
+            "total_pss": sum(worker["pss"] for worker in usage),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--config-file", type=str,
+                        default="tests/fixtures/smoke_imdb_unsupervised_training.json",
+                        help="Experiment config of the archived model.")
+    parser.add_argument("--archive-file", type=str, default=None,
+                        help="A trained archive to load instead of an untrained one built from --config-file.")
+    parser.add_argument("--data-path", type=str, default="tests/fixtures/smoke.jsonl",
+                        help="Where the first prediction's review is read from.")
+    parser.add_argument("--workers", type=str, default="1,16",
+                        help="Comma-separated numbers of workers to measure.")
+    parser.add_argument("--strategies", type=str, default=",".join(STRATEGIES),
+                        help="Comma-separated subset of: " + ", ".join(STRATEGIES))
+    parser.add_argument("--output", type=str, default=None,
+                        help="Where to write the JSON results (stdout if omitted).")
+    args = parser.parse_args()
+
+    archive_file = args.archive_file or write_archive(args.config_file,
+                                                      os.path.join(tempfile.mkdtemp(), "model"))
+    # Extracts the archive for ``load_model`` outside of the measurements.
+    load_model(archive_file)
+
+    env = dict(os.environ, PYTHONPATH=os.getcwd())
+    results: Dict[str, Any] = OrderedDict()
+    results["environment"] = environment()
+    results["config"] = vars(args)
+    for strategy in args.strategies.split(","):
+        results[strategy] = OrderedDict()
+        for num_workers in [int(number) for number in args.workers.split(",")]:
+            code = "from benchmarks.shared_weights import run_workers; run_workers({!r}, {!r}, {!r}, {})".format(
+                    strategy, archive_file, args.data_path, num_workers)
+            output = subprocess.check_output([sys.executable, "-c", code], env=env)
+            results[strategy][str(num_workers)] = json.loads(output.decode().strip().splitlines()[-1])
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output)
+    else:
+        sys.stdout.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
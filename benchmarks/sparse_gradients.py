@@ -0,0 +1,51 @@
+"""
+Optimizer cost with sparse embedding gradients and ``DenseSparseAdam`` against dense Adam.
+"""
+from collections import OrderedDict
+from typing import Any, Dict
+
+import torch
+from allennlp.data.vocabulary import Vocabulary
+
+from benchmarks.common import build_model, timed
+from library.training.optimizers import DenseSparseAdam
+
+
+def benchmark_sparse_gradients(vocab: Vocabulary,
+                               batch: Dict[str, Any],
+                               repeat: int = 10,
+                               **model_kwargs) -> Dict[str, Any]:
+    """
+    Times the backward pass and the optimizer step separately for a dense embedding updated by
+    ``torch.optim.Adam`` and a sparse one updated by ``DenseSparseAdam``. Meant to be run on a
+    large vocabulary (e.g. ``--synthetic --vocab-size 50000 --max-vocab-size 50000``).
+    """
+    results = OrderedDict()
+    for sparse in (False, True):
+        torch.manual_seed(1337)
+        model = build_model(vocab, sparse=sparse, **model_kwargs)
+        model.train()
+        optimizer_class = DenseSparseAdam if sparse else torch.optim.Adam
+        optimizer = optimizer_class(model.parameters(), lr=1e-3)
+
+        def forward_backward():
+            optimizer.zero_grad()  # pylint: disable=cell-var-from-loop
+            model(**batch)['loss'].backward()  # pylint: disable=cell-var-from-loop
+
+        def training_step():
+            forward_backward()
+            optimizer.step()  # pylint: disable=cell-var-from-loop
+
+        forward_backward()
+        results["sparse" if sparse else "dense"] = {
+                "optimizer": optimizer_class.__name__,
+                "optimizer_step": timed(optimizer.step, repeat),
+                "training_step": timed(training_step, repeat),
+        }
+
+    dense, sparse_result = results["dense"], results["sparse"]
+    results["optimizer_step_speedup"] = \
+        dense["optimizer_step"]["mean"] / sparse_result["optimizer_step"]["mean"]
+    results["training_step_speedup"] = \
+        dense["training_step"]["mean"] / sparse_result["training_step"]["mean"]
+    return results
@@ -0,0 +1,148 @@
+"""
+Worker startup cost: import time of the model and inference modules, and the time to load a
+trained archive and make a first prediction with ``load_archive``, with
+``library.inference.loading.load_model`` and with ``TopicInferenceNetwork``.
+
+Every measurement runs in a fresh interpreter. Run with ``python -m benchmarks.startup``.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from collections import OrderedDict
+
+import torch
+from allennlp.common import Params
+from allennlp.common.util import ensure_list
+from allennlp.data import DatasetReader
+from allennlp.data.vocabulary import Vocabulary
+from allennlp.models.archival import archive_model
+from allennlp.models.model import Model
+
+from benchmarks.common import environment, summarize
+
+_IMPORT = """
+import json, time
+start = time.perf_counter()
+import {module}
+print(json.dumps({{"import": time.perf_counter() - start}}))
+"""
+
+_LOAD_AND_PREDICT = """
+import json, time
+start = time.perf_counter()
+import torch
+{imports}
+imported = time.perf_counter()
+model = {load}
+loaded = time.perf_counter()
+
+from allennlp.data.dataset import Batch
+from library.dataset_readers.imdb_review_reader import IMDBReviewReader
+instance = next(iter(IMDBReviewReader(words_per_instance=35).read({data_path!r})))
+batch = Batch([instance])
+batch.index_instances(model.vocab)
+tensors = batch.as_tensor_dict()
+predict_start = time.perf_counter()
+with torch.no_grad():
+    model(**tensors)
+print(json.dumps({{"import": imported - start, "load": loaded - imported,
+                  "first_prediction": time.perf_counter() - predict_start}}))
+"""
+
+_TOPIC_INFERENCE = """
+import json, time
+start = time.perf_counter()
+from library.inference.topic_inference import TopicInferenceNetwork
+imported = time.perf_counter()
+network = TopicInferenceNetwork.from_archive({archive_file!r})
+loaded = time.perf_counter()
+network.infer([["a", "great", "movie"]])
+print(json.dumps({{"import": imported - start, "load": loaded - imported,
+                  "first_prediction": time.perf_counter() - loaded}}))
+"""
+
+
+def write_archive(config_file: str, serialization_dir: str, overrides: str = "") -> str:
+    """ Archives an untrained model built from ``config_file``; returns the archive's path. """
+    params = Params.from_file(config_file, overrides)
+    config = params.as_dict(quiet=True)
+    reader = DatasetReader.from_params(params.pop("dataset_reader"))
+    instances = ensure_list(reader.read(params.pop("train_data_path")))
+    vocab = Vocabulary.from_params(params.pop("vocabulary", {}), instances)
+    model = Model.from_params(vocab=vocab, params=params.pop("model"))
+
+    os.makedirs(serialization_dir, exist_ok=True)
+    vocab.save_to_files(os.path.join(serialization_dir, "vocabulary"))
+    with open(os.path.join(serialization_dir, "config.json"), 'w') as config_out:
+        json.dump(config, config_out, indent=4)
+    torch.save(model.state_dict(), os.path.join(serialization_dir, "weights.th"))
+    archive_model(serialization_dir, "weights.th")
+    return os.path.join(serialization_dir, "model.tar.gz")
+
+
+def run_in_fresh_interpreter(code: str, repeat: int) -> OrderedDict:
+    """ Runs ``code`` ``repeat`` times, each in a new process, and summarizes what it prints. """
+    env = dict(os.environ, PYTHONPATH=os.getcwd())
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, "-c", code], env=env)
+        runs.append(json.loads(output.decode().strip().splitlines()[-1]))
+    return OrderedDict((key, summarize([run[key] for run in runs])) for key in runs[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--config-file", type=str,
+                        default="tests/fixtures/smoke_imdb_unsupervised_training.json",
+                        help="Experiment config of the archived model.")
+    parser.add_argument("--archive-file", type=str, default=None,
+                        help="A trained archive to load instead of an untrained one built from --config-file.")
+    parser.add_argument("--data-path", type=str, default="tests/fixtures/smoke.jsonl",
+                        help="Where the first prediction's review is read from.")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Fresh interpreters per measurement.")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Where to write the JSON results (stdout if omitted).")
+    args = parser.parse_args()
+
+    archive_file = args.archive_file or write_archive(args.config_file,
+                                                      os.path.join(tempfile.mkdtemp(), "model"))
+
+    results = OrderedDict()
+    results["environment"] = environment()
+    results["config"] = vars(args)
+    for module in ("library.models.topic_rnn",
+                   "library.inference.topic_inference",
+                   "library.inference.torchscript"):
+        results["import_" + module] = run_in_fresh_interpreter(_IMPORT.format(module=module), args.repeat)
+
+    results["load_archive"] = run_in_fresh_interpreter(_LOAD_AND_PREDICT.format(
+            imports="from allennlp.models.archival import load_archive\nimport library.models",
+            load="load_archive({!r}).model.eval()".format(archive_file),
+            data_path=args.data_path), args.repeat)
+    # The first call extracts the archive; the measured ones reuse the extracted copy.
+    load_model = _LOAD_AND_PREDICT.format(
+            imports="from library.inference.loading import load_model\nimport library.models",
+            load="load_model({!r})".format(archive_file),
+            data_path=args.data_path)
+    run_in_fresh_interpreter(load_model, 1)
+    results["load_model"] = run_in_fresh_interpreter(load_model, args.repeat)
+
+    topic_inference = _TOPIC_INFERENCE.format(archive_file=archive_file)
+    run_in_fresh_interpreter(topic_inference, 1)
+    results["topic_inference"] = run_in_fresh_interpreter(topic_inference, args.repeat)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output)
+    else:
+        sys.stdout.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+Synthetic IMDB-style corpora of configurable size for benchmarking.
+"""
+import json
+import os
+import random
+
+from library.dataset_readers.util import STOP_WORDS
+
+
+def write_synthetic_corpus(path: str,
+                           num_documents: int = 200,
+                           vocab_size: int = 5000,
+                           document_length: int = 250,
+                           seed: int = 1337) -> str:
+    """
+    Writes ``num_documents`` reviews in the format produced by
+    ``scripts/generate_imdb_corpus.py``. Words are drawn from a Zipfian distribution over
+    ``vocab_size`` synthetic words, with roughly a third of tokens being stop words as in
+    natural text.
+    """
+    rng = random.Random(seed)
+    words = ["word{}".format(i) for i in range(vocab_size)]
+    weights = [1.0 / (rank + 1) for rank in range(vocab_size)]
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as corpus_file:
+        for document_id in range(num_documents):
+            content = rng.choices(words, weights=weights, k=document_length)
+            for position in range(0, document_length, 3):
+                content[position] = rng.choice(STOP_WORDS)
+            example = {
+                "id": document_id,
+                "text": " ".join(content),
+                "sentiment": rng.choice([1, 2, 3, 4, 7, 8, 9, 10]),
+            }
+            corpus_file.write(json.dumps(example) + "\n")
+    return path
@@ -0,0 +1,43 @@
+"""
+Vocabulary construction: AllenNLP's counting over reader instances against the one-pass,
+parallel ``library.vocabulary.builder``.
+"""
+import os
+import time
+from typing import Any, Dict
+
+from allennlp.common.util import ensure_list
+from allennlp.data.vocabulary import Vocabulary
+
+from library.dataset_readers.imdb_review_reader import IMDBReviewReader
+from library.vocabulary.builder import build_vocabulary, count_corpus
+
+
+def benchmark_vocabulary(data_path: str,
+                         words_per_instance: int = 35,
+                         max_vocab_size: int = 5000) -> Dict[str, Any]:
+    """
+    Seconds to build a ``max_vocab_size`` vocabulary each way (the builder with one process and
+    with every CPU), and the overlap of the resulting vocabularies.
+    """
+    results = {}
+    start = time.perf_counter()
+    instances = ensure_list(IMDBReviewReader(words_per_instance=words_per_instance).read(data_path))
+    from_instances = Vocabulary.from_instances(instances, max_vocab_size=max_vocab_size)
+    results["from_instances"] = {"seconds": time.perf_counter() - start}
+
+    for num_workers in sorted({1, os.cpu_count() or 1}):
+        start = time.perf_counter()
+        counts = count_corpus(data_path, num_workers=num_workers)
+        built = build_vocabulary(counts, max_vocab_size=max_vocab_size)
+        elapsed = time.perf_counter() - start
+        results["builder_{}_workers".format(num_workers)] = {
+                "seconds": elapsed,
+                "tokens_per_second": counts.num_tokens / elapsed,
+                "speedup": results["from_instances"]["seconds"] / elapsed,
+        }
+
+    expected = set(from_instances.get_token_to_index_vocabulary("tokens"))
+    actual = set(built.get_token_to_index_vocabulary("tokens"))
+    results["token_overlap"] = len(expected & actual) / len(expected | actual)
+    return results
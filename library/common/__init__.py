@@ -0,0 +1 @@
+from library.common import archives, profiling
@@ -0,0 +1,72 @@
+import hashlib
+import inspect
+import os
+import shutil
+import tarfile
+import tempfile
+from typing import Any, Dict, Sequence
+
+import torch
+
+
+# The entry of delta weights (see ``TopicRNN``'s ``delta_checkpoints``) that references the
+# archive holding the remaining weights, as ``{"archive": <path>, "sha256": <weights_sha256>}``.
+BASE_ARCHIVE_KEY = "_base_archive"
+
+
+class ExtractedArchive:
+    """
+    Yields a directory holding ``member_names`` (all members if omitted) of a ``model.tar.gz``,
+    cleaning up afterwards. A serialization directory is yielded as is.
+    """
+    def __init__(self, archive_file: str, member_names: Sequence[str] = None) -> None:
+        self._archive_file = archive_file
+        self._member_names = member_names
+        self._tempdir = None
+
+    def __enter__(self) -> str:
+        if os.path.isdir(self._archive_file):
+            return self._archive_file
+        self._tempdir = tempfile.mkdtemp()
+        with tarfile.open(self._archive_file, 'r:gz') as archive:
+            members = [member for member in archive.getmembers()
+                       if self._member_names is None or member.name in self._member_names]
+            archive.extractall(self._tempdir, members=members)
+        return self._tempdir
+
+    def __exit__(self, *args) -> None:
+        if self._tempdir is not None:
+            shutil.rmtree(self._tempdir, ignore_errors=True)
+
+
+def load_weights(path: str) -> Dict[str, torch.Tensor]:
+    """
+    ``torch.load`` onto the CPU, memory-mapping the file where PyTorch supports it (2.1+) so
+    that tensors are only paged in when used and are shared between processes reading the
+    same file.
+    """
+    if "mmap" in inspect.signature(torch.load).parameters:
+        try:
+            return torch.load(path, map_location="cpu", mmap=True)
+        except RuntimeError:
+            # Files in the legacy (pre-1.6) serialization format cannot be memory-mapped.
+            pass
+    return torch.load(path, map_location="cpu")
+
+
+def weights_sha256(state_dict: Dict[str, torch.Tensor]) -> str:
+    """ A hash of the names and contents of the tensors in ``state_dict``. """
+    digest = hashlib.sha256()
+    for name in sorted(state_dict):
+        digest.update(name.encode('utf-8'))
+        digest.update(state_dict[name].detach().cpu().contiguous().numpy())
+    return digest.hexdigest()
+
+
+def load_base_weights(reference: Dict[str, Any]) -> Dict[str, torch.Tensor]:
+    """ The weights of the archive that delta weights reference under ``BASE_ARCHIVE_KEY``. """
+    if not os.path.exists(reference["archive"]):
+        raise FileNotFoundError("Delta weights need their base archive {}, which does not exist".format(
+                reference["archive"]))
+    with ExtractedArchive(reference["archive"], ["weights.th"]) as archive_dir:
+        return load_weights(os.path.join(archive_dir, "weights.th"))
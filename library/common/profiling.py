@@ -0,0 +1,168 @@
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List
+
+import torch
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class _NullStage:
+    """ The context returned for every stage when profiling is disabled. """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, profiler: 'StageProfiler', name: str) -> None:
+        self._profiler = profiler
+        self._name = name
+        self._start = 0.0
+        self._start_memory = 0
+
+    def __enter__(self):
+        self._start_memory = self._profiler.allocated_bytes()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self._profiler.synchronize()
+        end = time.perf_counter()
+        self._profiler.record(self._name, self._start, end,
+                              self._profiler.allocated_bytes() - self._start_memory)
+        return False
+
+
+class StageProfiler:
+    """
+    Records the wall time and change in allocated memory of named stages of a forward pass.
+
+    Wrap each stage in ``with profiler.stage("name"):`` and call ``step()`` once per batch.
+    When disabled, ``stage`` returns a shared no-op context manager, so instrumented code pays
+    only for a method call and an attribute check.
+
+    Allocated memory is ``torch.cuda.memory_allocated`` on GPU and the process's resident set
+    size on CPU (where PyTorch keeps no allocation counter), so CPU figures include allocator
+    caching effects.
+
+    Parameters
+    ----------
+    enabled : ``bool``, optional (default=False)
+        Whether to record anything at all.
+    trace_file : ``str``, optional
+        If given, stages of the batches in the trace window are written to this file in
+        Chrome's trace event format (viewable at chrome://tracing).
+    trace_start_batch : ``int``, optional (default=10)
+        The first batch of the trace window (counting from 0), leaving room for warm-up.
+    trace_num_batches : ``int``, optional (default=5)
+        The number of batches in the trace window.
+    """
+    def __init__(self,
+                 enabled: bool = False,
+                 trace_file: str = None,
+                 trace_start_batch: int = 10,
+                 trace_num_batches: int = 5) -> None:
+        self.enabled = enabled
+        self._trace_file = trace_file
+        self._trace_start_batch = trace_start_batch
+        self._trace_end_batch = trace_start_batch + trace_num_batches
+        self._batch = -1
+        self._origin = time.perf_counter()
+        self._events: List[Dict] = []
+        self._device = None
+        self.reset()
+
+    def reset(self) -> None:
+        self._seconds: Dict[str, float] = OrderedDict()
+        self._memory: Dict[str, int] = OrderedDict()
+        self._calls: Dict[str, int] = OrderedDict()
+
+    def stage(self, name: str):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def step(self, device: torch.device = None) -> None:
+        """ Marks the start of a new batch. """
+        if not self.enabled:
+            return
+        self._device = device
+        self._batch += 1
+        if self._trace_file and self._batch == self._trace_end_batch:
+            self._write_trace()
+
+    def _tracing(self) -> bool:
+        return (self._trace_file is not None and
+                self._trace_start_batch <= self._batch < self._trace_end_batch)
+
+    def synchronize(self) -> None:
+        if self._device is not None and self._device.type == "cuda":
+            torch.cuda.synchronize(self._device)
+
+    def allocated_bytes(self) -> int:
+        if self._device is not None and self._device.type == "cuda":
+            return torch.cuda.memory_allocated(self._device)
+        return _resident_set_bytes()
+
+    def record(self, name: str, start: float, end: float, memory_delta: int) -> None:
+        self._seconds[name] = self._seconds.get(name, 0.0) + end - start
+        self._memory[name] = self._memory.get(name, 0) + memory_delta
+        self._calls[name] = self._calls.get(name, 0) + 1
+        if self._tracing():
+            self._events.append({
+                    "name": name,
+                    "ph": "X",
+                    "ts": (start - self._origin) * 1e6,
+                    "dur": (end - start) * 1e6,
+                    "pid": os.getpid(),
+                    "tid": 0,
+                    "args": {"batch": self._batch, "memory_delta_bytes": memory_delta},
+            })
+
+    def _write_trace(self) -> None:
+        with open(self._trace_file, 'w') as trace_file:
+            json.dump({"traceEvents": self._events, "displayTimeUnit": "ms"}, trace_file)
+        logger.info("Wrote a trace of %d stage events to %s", len(self._events), self._trace_file)
+        self._events = []
+
+    def get_report(self, reset: bool = False) -> Dict[str, Dict[str, float]]:
+        """
+        Returns, per stage, the number of calls, the total and mean milliseconds and the mean
+        change in allocated memory in bytes.
+        """
+        report = OrderedDict()
+        for name, seconds in self._seconds.items():
+            calls = self._calls[name]
+            report[name] = {
+                    "calls": calls,
+                    "total_ms": seconds * 1000,
+                    "mean_ms": seconds * 1000 / calls,
+                    "mean_memory_delta_bytes": self._memory[name] / calls,
+            }
+        if reset:
+            self.reset()
+        return report
+
+    def get_metrics(self, reset: bool = False) -> Dict[str, float]:
+        """ Mean milliseconds per stage, flattened for a model's ``get_metrics``. """
+        if not self.enabled:
+            return {}
+        return {"profile_{}_ms".format(name): stats["mean_ms"]
+                for name, stats in self.get_report(reset).items()}
+
+
+def _resident_set_bytes() -> int:
+    try:
+        with open("/proc/self/statm", 'r') as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
@@ -1,2 +1,2 @@
-from library.dataset_readers import imdb_review_reader
+from library.dataset_readers import imdb_review_reader, shuffling
 from library.dataset_readers.util import STOP_WORDS
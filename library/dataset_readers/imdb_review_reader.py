@@ -1,17 +1,19 @@
 import logging
-from typing import Dict
+import random
+from typing import Any, Dict, List
 
-from allennlp.common.file_utils import cached_path
 from allennlp.common.util import END_SYMBOL, START_SYMBOL
 from allennlp.data.dataset_readers.dataset_reader import DatasetReader
 from allennlp.data.fields import LabelField, TextField
 from allennlp.data.instance import Instance
 from allennlp.data.token_indexers import SingleIdTokenIndexer, TokenIndexer
-from allennlp.data.tokenizers import Tokenizer, WordTokenizer
+from allennlp.data.tokenizers import Token, Tokenizer, WordTokenizer
 from overrides import overrides
 
 import ujson
 
+from library.dataset_readers.shuffling import ResumableInstances
+
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
 
@@ -40,20 +42,38 @@ class IMDBReviewLanguageModelingReader(DatasetReader):
         Passed to ``DatasetReader``.  If this is ``True``, training will start sooner, but will
         take longer per batch.  This also allows training with datasets that are too large to fit
         in memory.
+        Lazy reads return a ``ResumableInstances``, whose reading position can be saved and
+        resumed from (see ``library.training.resumable``).
     tokenizer : ``Tokenizer``, optional
         Tokenizer to use to split text into English tokens.
-        Defaults to ``WordTokenizer()``.
+        Defaults to ``WordTokenizer()``. Reviews that carry their ``tokens`` (as written by
+        ``library.vocabulary.builder.tokenize_corpus``) are not tokenized again.
     token_indexers : ``Dict[str, TokenIndexer]``, optional
         Indexers used to define English token representations. Defaults to ``{"tokens":
         SingleIdTokenIndexer(namespace="en", lowercase_tokens=True)}``.
     words_per_instance : ``int``, optional
         The number of words in which the raw text will be bucketed during evaluation.
+    shuffle_buffer_size : ``int``, optional
+        If given, instances are shuffled through a buffer of this many instances, which gives a
+        near-random order in constant memory (useful with ``lazy``). Every read (epoch) draws a
+        new order.
+    num_shards : ``int``, optional
+        If given, each file is split into this many line-aligned byte ranges that are read in a
+        random order on every read. ``file_path`` may also be a glob pattern matching several
+        files, whose shards are then shuffled together. Combined with ``shuffle_buffer_size``
+        this mixes corpora that are sorted (e.g. by label) in constant memory.
+    seed : ``int``, optional
+        Seeds the shuffling. Defaults to a draw from the ``random`` module, so that runs seeded
+        by ``random_seed`` are reproducible.
     """
     def __init__(self,
                  lazy: bool = False,
                  tokenizer: Tokenizer = None,
                  token_indexers: Dict[str, TokenIndexer] = None,
-                 words_per_instance: int = 35
+                 words_per_instance: int = 35,
+                 shuffle_buffer_size: int = None,
+                 num_shards: int = None,
+                 seed: int = None
                 ) -> None:
         super().__init__(lazy)
         self._tokenizer = tokenizer or WordTokenizer(
@@ -65,54 +85,57 @@ class IMDBReviewLanguageModelingReader(DatasetReader):
         }
 
         self._words_per_instance = words_per_instance
+        self._shuffle_buffer_size = shuffle_buffer_size
+        self._num_shards = num_shards
+        self._rng = random.Random(seed if seed is not None else random.getrandbits(64))
+
+    @overrides
+    def read(self, file_path: str):
+        if self.lazy:
+            return _resumable_instances(self, file_path)
+        return super().read(file_path)
 
     @overrides
     def _read(self, file_path):
-        file_path = cached_path(file_path)
+        return iter(_resumable_instances(self, file_path))
+
+    def _read_line(self, line: str):
         # Break up the text into a series of BPTT chunks and yield one at a time.
         #
         # Strict partitioning instead of a sliding window will mean each chunk is
         # distinct and doesn't not overlap with immediately surrounding chunks.
-        with open(cached_path(file_path), 'r') as data_file:
-            logger.info("Reading instances from lines in file: %s", file_path)
-            for line in data_file:
-                line = line.strip("\n")
-                if not line:
-                    continue
-                example = ujson.loads(line)
-                example_text = example['text']
+        example = ujson.loads(line)
+        example_text_tokenized = _tokenize(self._tokenizer, example)
+        target_text_tokenized = example_text_tokenized[1:]
 
-                example_text_tokenized = self._tokenizer.tokenize(example_text)
-                target_text_tokenized = example_text_tokenized[1:]
+        tokenized_inputs = []
+        tokenized_outputs = []
+        for index in range(0, len(example_text_tokenized), self._words_per_instance):
+            tokenized_inputs.append(example_text_tokenized[index:(index + self._words_per_instance)])
 
-                tokenized_inputs = []
-                tokenized_outputs = []
-                for index in range(0, len(example_text_tokenized), self._words_per_instance):
-                    tokenized_inputs.append(example_text_tokenized[index:(index + self._words_per_instance)])
+        for index in range(1, len(example_text_tokenized), self._words_per_instance):
+            tokenized_outputs.append(target_text_tokenized[index:(index + self._words_per_instance)])
 
-                for index in range(1, len(example_text_tokenized), self._words_per_instance):
-                    tokenized_outputs.append(target_text_tokenized[index:(index + self._words_per_instance)])
+        input_output_pairs = zip(tokenized_inputs, tokenized_outputs)
 
-                input_output_pairs = zip(tokenized_inputs, tokenized_outputs)
+        previous_batch = None
+        for i, (tokenized_input, tokenized_output) in enumerate(input_output_pairs):
+            input_field = TextField(tokenized_input, self._token_indexers)
+            output_field = TextField(tokenized_output, self._token_indexers)
+            example = {
+                'input_tokens': input_field,
+                'output_tokens': output_field,
+                'frequency_tokens': output_field.empty_field()
+            }
 
-                previous_batch = None
-                for i, (tokenized_input, tokenized_output) in enumerate(input_output_pairs):
-                    input_field = TextField(tokenized_input, self._token_indexers)
-                    output_field = TextField(tokenized_output, self._token_indexers)
-                    example = {
-                        'input_tokens': input_field,
-                        'output_tokens': output_field,
-                        'frequency_tokens': output_field.empty_field()
-                    }
+            if i > 0 and previous_batch is not None:
+                example['frequency_tokens'] = previous_batch
 
-                    if i > 0 and previous_batch is not None:
-                        example['frequency_tokens'] = previous_batch
+            # When computing perplexity, the topic vector will be drawn from the distrubtion
+            # resulting from this context.
+            previous_batch = input_field
 
-                    # When computing perplexity, the topic vector will be drawn from the distrubtion
-                    # resulting from this context.
-                    previous_batch = input_field
-
-                    yield Instance(example)
+            yield Instance(example)
 
 
 @DatasetReader.register("imdb_review_reader")
@@ -138,22 +161,41 @@ class IMDBReviewReader(DatasetReader):
         Passed to ``DatasetReader``.  If this is ``True``, training will start sooner, but will
         take longer per batch.  This also allows training with datasets that are too large to fit
         in memory.
+        Lazy reads return a ``ResumableInstances``, whose reading position can be saved and
+        resumed from (see ``library.training.resumable``).
     tokenizer : ``Tokenizer``, optional
         Tokenizer to use to split text into English tokens.
-        Defaults to ``WordTokenizer()``.
+        Defaults to ``WordTokenizer()``. Reviews that carry their ``tokens`` (as written by
+        ``library.vocabulary.builder.tokenize_corpus``) are not tokenized again.
     token_indexers : ``Dict[str, TokenIndexer]``, optional
         Indexers used to define English token representations. Defaults to ``{"tokens":
         SingleIdTokenIndexer(namespace="en", lowercase_tokens=True)}``.
     words_per_instance : ``int``, optional
         The number of words in which the raw text will be bucketed to allow for more efficient
         training (backpropagation-through-time limit).
+    shuffle_buffer_size : ``int``, optional
+        If given, instances are shuffled through a buffer of this many instances, which gives a
+        near-random order in constant memory (useful with ``lazy``). Every read (epoch) draws a
+        new order. It separates the chunks of a review, so do not combine it with the
+        ``"document"`` iterator.
+    num_shards : ``int``, optional
+        If given, each file is split into this many line-aligned byte ranges that are read in a
+        random order on every read. ``file_path`` may also be a glob pattern matching several
+        files, whose shards are then shuffled together. Combined with ``shuffle_buffer_size``
+        this mixes corpora that are sorted (e.g. by label) in constant memory.
+    seed : ``int``, optional
+        Seeds the shuffling. Defaults to a draw from the ``random`` module, so that runs seeded
+        by ``random_seed`` are reproducible.
     """
     def __init__(self,
                  lazy: bool = False,
                  tokenizer: Tokenizer = None,
                  token_indexers: Dict[str, TokenIndexer] = None,
                  words_per_instance: int = 35,
-                 classification_mode=False
+                 classification_mode=False,
+                 shuffle_buffer_size: int = None,
+                 num_shards: int = None,
+                 seed: int = None
                 ) -> None:
         super().__init__(lazy)
         self._tokenizer = tokenizer or WordTokenizer(
@@ -165,44 +207,65 @@ class IMDBReviewReader(DatasetReader):
         }
 
         self._words_per_instance = words_per_instance
+        self._shuffle_buffer_size = shuffle_buffer_size
+        self._num_shards = num_shards
+        self._rng = random.Random(seed if seed is not None else random.getrandbits(64))
         self._classification_mode = classification_mode
 
+    @overrides
+    def read(self, file_path: str):
+        if self.lazy:
+            return _resumable_instances(self, file_path)
+        return super().read(file_path)
+
     @overrides
     def _read(self, file_path):
+        return iter(_resumable_instances(self, file_path))
+
+    def _read_line(self, line: str):
         # A training instance consists of the word frequencies for the entire review and a
         # `words_per_instance`` portion of the review.
-        file_path = cached_path(file_path)
 
         # Partition each review into BPTT Limit + 1 chunks to allow room for input (chunk[:-1])
         # and output (chunk[1:]).
         # Break up the text into a series of BPTT chunks and yield one at a time.
         num_tokens = self._words_per_instance + 1
-        with open(cached_path(file_path), 'r') as data_file:
-            logger.info("Reading instances from lines in file: %s", file_path)
-            for line in data_file:
-                line = line.strip("\n")
-                if not line:
-                    continue
-                example = ujson.loads(line)
-                example_text = example['text']
-                example_text_tokenized = self._tokenizer.tokenize(example_text)
-                example_sentiment = "positive" if example['sentiment'] >= 5 else "negative"
-                example_sentiment_field = LabelField(example_sentiment)
-
-                # Each review will receive the entire encoded review.
-                frequency_field = TextField(example_text_tokenized, self._token_indexers)
-                tokenized_strings = []
-                for index in range(0, len(example_text_tokenized) - num_tokens, num_tokens - 1):
-                    tokenized_strings.append(example_text_tokenized[index:(index + num_tokens)])
-
-                    # By breaking early when training a classifier, we prevent training on duplicates.
-                    if self._classification_mode:
-                        break
-
-                for tokenized_string in tokenized_strings:
-                    input_field = TextField(tokenized_string[:-1], self._token_indexers)
-                    output_field = TextField(tokenized_string[1:], self._token_indexers)
-                    yield Instance({'input_tokens': input_field,
-                                    'output_tokens': output_field,
-                                    'frequency_tokens': frequency_field,
-                                    'sentiment': example_sentiment_field})
+        example = ujson.loads(line)
+        example_text_tokenized = _tokenize(self._tokenizer, example)
+        example_sentiment = "positive" if example['sentiment'] >= 5 else "negative"
+        example_sentiment_field = LabelField(example_sentiment)
+
+        # Each review will receive the entire encoded review.
+        frequency_field = TextField(example_text_tokenized, self._token_indexers)
+        tokenized_strings = []
+        for index in range(0, len(example_text_tokenized) - num_tokens, num_tokens - 1):
+            tokenized_strings.append(example_text_tokenized[index:(index + num_tokens)])
+
+            # By breaking early when training a classifier, we prevent training on duplicates.
+            if self._classification_mode:
+                break
+
+        for tokenized_string in tokenized_strings:
+            input_field = TextField(tokenized_string[:-1], self._token_indexers)
+            output_field = TextField(tokenized_string[1:], self._token_indexers)
+            yield Instance({'input_tokens': input_field,
+                            'output_tokens': output_field,
+                            'frequency_tokens': frequency_field,
+                            'sentiment': example_sentiment_field})
+
+
+def _tokenize(tokenizer: Tokenizer, example: Dict[str, Any]) -> List[Token]:
+    """
+    The tokens of a review: its ``tokens`` if it was pre-tokenized (see
+    ``library.vocabulary.builder.tokenize_corpus``), otherwise its tokenized ``text``.
+    """
+    if 'tokens' in example:
+        return [Token(text) for text in example['tokens']]
+    return tokenizer.tokenize(example['text'])
+
+
+def _resumable_instances(reader, file_path: str) -> ResumableInstances:
+    """ The instances of each line of ``file_path``, shuffled at the shard and instance level as configured. """
+    # pylint: disable=protected-access
+    return ResumableInstances(file_path, reader._read_line, reader._num_shards,
+                              reader._shuffle_buffer_size, reader._rng)
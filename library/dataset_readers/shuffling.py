@@ -0,0 +1,229 @@
+""" Constant-memory shuffling and resumable reading for readers that stream their corpus.
+"""
+import glob
+import logging
+import os
+import random
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+from allennlp.common.checks import ConfigurationError
+from allennlp.common.file_utils import cached_path
+from allennlp.data.instance import Instance
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+T = TypeVar('T')  # pylint: disable=invalid-name
+
+
+def line_aligned_ranges(path: str, num_ranges: int) -> List[Tuple[int, int]]:
+    """ Splits ``path`` into at most ``num_ranges`` byte ranges that each start at a line. """
+    size = os.path.getsize(path)
+    boundaries = [0]
+    with open(path, 'rb') as data_file:
+        for i in range(1, num_ranges):
+            data_file.seek(max(size * i // num_ranges, boundaries[-1]))
+            data_file.readline()
+            boundaries.append(min(data_file.tell(), size))
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
+
+def shards(file_path: str, num_shards: Optional[int] = None) -> List[Tuple[str, int, int]]:
+    """
+    The ``(path, start, end)`` byte ranges to read ``file_path`` (a file, a URL or a glob
+    pattern matching several files, read in sorted order) in. With ``num_shards``, every file
+    is split into that many line-aligned ranges; otherwise each file is a single range.
+    """
+    if glob.has_magic(file_path):
+        paths = sorted(glob.glob(file_path))
+    else:
+        paths = [cached_path(file_path)]
+    ranges = []
+    for path in paths:
+        if num_shards:
+            ranges.extend((path, start, end) for start, end in line_aligned_ranges(path, num_shards))
+        else:
+            ranges.append((path, 0, os.path.getsize(path)))
+    return ranges
+
+
+def read_lines(path: str, start: int, end: int) -> Iterator[Tuple[int, int, str]]:
+    """ ``(offset, next offset, line)`` for the non-empty lines starting within ``[start, end)``. """
+    with open(path, 'rb') as data_file:
+        data_file.seek(start)
+        offset = start
+        while offset < end:
+            line = data_file.readline()
+            next_offset = offset + len(line)
+            line = line.decode('utf-8').strip("\n")
+            if line:
+                yield offset, next_offset, line
+            offset = next_offset
+
+
+def shuffle_buffer(items: Iterable[T],
+                   buffer_size: int,
+                   rng: random.Random,
+                   buffer: List[T] = None) -> Iterator[T]:
+    """
+    Yields ``items`` in a random order using at most ``buffer_size`` items of memory: the buffer
+    is filled first, then each new item replaces a randomly chosen buffered one, which is
+    yielded. An item can therefore move arbitrarily far back, but at most ``buffer_size``
+    positions forward.
+
+    ``buffer`` (by default a new list) holds the buffered items; it may be passed in pre-filled
+    to continue an earlier pass, and always holds exactly the items pulled but not yet yielded.
+    """
+    buffer = [] if buffer is None else buffer
+    for item in items:
+        if len(buffer) < buffer_size:
+            buffer.append(item)
+            continue
+        index = rng.randrange(buffer_size)
+        shuffled, buffer[index] = buffer[index], item
+        yield shuffled
+    while buffer:
+        yield buffer.pop(rng.randrange(len(buffer)))
+
+
+class ResumableInstances(Iterable[Instance]):
+    """
+    Lazily read instances that can report where reading stopped and continue from there.
+
+    Every iteration is a pass over the lines of ``file_path``, each turned into instances by
+    ``read_line``. With ``num_shards`` the shards are read in a new random order on every pass,
+    and with ``shuffle_buffer_size`` the instances pass through a ``shuffle_buffer``.
+
+    ``position()`` describes the state of the current pass after the instances yielded so far:
+    the shard order, the shard and byte offset of the review being read, the number of its
+    instances already read (``chunk``), the reviews and chunks held in the shuffle buffer and
+    the state of ``rng``. It is JSON serializable. After ``resume_from(position)``, the next
+    pass seeks to that review, skips its first ``chunk`` instances, re-reads only the buffered
+    reviews and yields exactly what the interrupted pass would have yielded next.
+
+    Parameters
+    ----------
+    file_path : ``str``, required
+        A file, URL or glob pattern, see ``shards``.
+    read_line : ``Callable[[str], Iterable[Instance]]``, required
+        Turns a line (a review) into its instances.
+    num_shards : ``int``, optional
+        See ``shards``.
+    shuffle_buffer_size : ``int``, optional
+        The size of the shuffle buffer, if any.
+    rng : ``random.Random``, optional
+        The source of randomness for both shufflings.
+    """
+    def __init__(self,
+                 file_path: str,
+                 read_line: Callable[[str], Iterable[Instance]],
+                 num_shards: int = None,
+                 shuffle_buffer_size: int = None,
+                 rng: random.Random = None) -> None:
+        self._file_path = file_path
+        self._read_line = read_line
+        self._num_shards = num_shards
+        self._shuffle_buffer_size = shuffle_buffer_size
+        self._rng = rng or random.Random()
+        self._resume_position: Optional[Dict[str, Any]] = None
+        # The state of the pass in progress, if any.
+        self._pass: Optional[_Pass] = None
+
+    def __iter__(self) -> Iterator[Instance]:
+        position, self._resume_position = self._resume_position, None
+        if position is None:
+            ranges = shards(self._file_path, self._num_shards)
+            if self._num_shards:
+                self._rng.shuffle(ranges)
+            reading_pass = _Pass(ranges)
+            logger.info("Reading instances from lines in file: %s", self._file_path)
+        else:
+            reading_pass = _Pass([tuple(shard) for shard in position["shards"]],
+                                 position["shard"], position["offset"], position["chunk"])
+            reading_pass.buffer = self._reread(reading_pass.shards, position["buffer"])
+            version, internal_state, gauss = position["rng_state"]
+            self._rng.setstate((version, tuple(internal_state), gauss))
+            logger.info("Resuming %s at shard %d, offset %d, chunk %d", self._file_path,
+                        reading_pass.shard, reading_pass.offset, reading_pass.chunk)
+        self._pass = reading_pass
+        return self._instances(reading_pass)
+
+    def position(self) -> Optional[Dict[str, Any]]:
+        """ The position after the instances yielded so far, or ``None`` between passes. """
+        reading_pass = self._pass
+        if reading_pass is None or reading_pass.finished:
+            return None
+        version, internal_state, gauss = self._rng.getstate()
+        return {
+                "file_path": self._file_path,
+                "shards": [list(shard) for shard in reading_pass.shards],
+                "shard": reading_pass.shard,
+                "offset": reading_pass.offset,
+                "chunk": reading_pass.chunk,
+                "buffer": [list(reference) for reference, _ in reading_pass.buffer],
+                "rng_state": [version, list(internal_state), gauss],
+        }
+
+    def resume_from(self, position: Dict[str, Any]) -> None:
+        """ Makes the next pass continue from ``position`` instead of starting over. """
+        if position["file_path"] != self._file_path:
+            raise ConfigurationError("Cannot resume reading {} from a position in {}".format(
+                    self._file_path, position["file_path"]))
+        self._resume_position = position
+
+    def _instances(self, reading_pass: '_Pass') -> Iterator[Instance]:
+        items = self._read_from(reading_pass)
+        if self._shuffle_buffer_size:
+            items = shuffle_buffer(items, self._shuffle_buffer_size, self._rng, reading_pass.buffer)
+        for _, instance in items:
+            yield instance
+        reading_pass.finished = True
+
+    def _read_from(self, reading_pass: '_Pass') -> Iterator[Tuple[Tuple[int, int, int], Instance]]:
+        """
+        Reads from the pass's current review on, yielding ``((shard, offset, chunk), instance)``
+        and advancing the pass before each yield, so that it always points at the next instance.
+        """
+        while reading_pass.shard < len(reading_pass.shards):
+            path, _, end = reading_pass.shards[reading_pass.shard]
+            for offset, next_offset, line in read_lines(path, reading_pass.offset, end):
+                instances = list(self._read_line(line))
+                for chunk in range(reading_pass.chunk, len(instances)):
+                    if chunk + 1 < len(instances):
+                        reading_pass.offset, reading_pass.chunk = offset, chunk + 1
+                    else:
+                        reading_pass.offset, reading_pass.chunk = next_offset, 0
+                    yield (reading_pass.shard, offset, chunk), instances[chunk]
+                reading_pass.offset, reading_pass.chunk = next_offset, 0
+            reading_pass.shard += 1
+            if reading_pass.shard < len(reading_pass.shards):
+                reading_pass.offset = reading_pass.shards[reading_pass.shard][1]
+
+    def _reread(self,
+                ranges: List[Tuple[str, int, int]],
+                references: List[List[int]]) -> List[Tuple[Tuple[int, int, int], Instance]]:
+        """ Rebuilds the shuffle buffer from its ``(shard, offset, chunk)`` references, in order. """
+        reviews: Dict[Tuple[int, int], List[Instance]] = {}
+        buffer = []
+        for shard, offset, chunk in references:
+            if (shard, offset) not in reviews:
+                path, _, end = ranges[shard]
+                _, _, line = next(read_lines(path, offset, end))
+                reviews[(shard, offset)] = list(self._read_line(line))
+            buffer.append(((shard, offset, chunk), reviews[(shard, offset)][chunk]))
+        return buffer
+
+
+class _Pass:
+    """ Where a ``ResumableInstances`` pass is: the next instance to read and the buffer. """
+    def __init__(self,
+                 ranges: List[Tuple[str, int, int]],
+                 shard: int = 0,
+                 offset: int = None,
+                 chunk: int = 0) -> None:
+        self.shards = ranges
+        self.shard = shard
+        self.offset = offset if offset is not None else (ranges[0][1] if ranges else 0)
+        self.chunk = chunk
+        self.buffer: List[Tuple[Tuple[int, int, int], Instance]] = []
+        self.finished = False
@@ -0,0 +1 @@
+from library.index import topic_index
@@ -0,0 +1,367 @@
+import json
+import logging
+import os
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+# Bumped whenever the on-disk layout below changes.
+INDEX_FORMAT_VERSION = 1
+
+_META_FILE = "meta.json"
+_VECTORS_FILE = "vectors.f32"
+_IDS_FILE = "ids.i64"
+_CODES_FILE = "codes.u64"
+
+
+class TopicIndex:
+    """
+    A nearest-neighbor index over inferred topic proportions (the ``mu`` of TopicRNN's
+    variational distribution).
+
+    Vectors are kept in a single contiguous float32 file that is memory-mapped on load, with
+    a parallel int64 file holding the document id of every row. Both files are append-only, so
+    new documents can be added without rewriting what is already on disk.
+
+    Queries are answered exactly with blocked matrix products over the memory-map; at no point
+    does more than ``block_size`` rows of the corpus need to be resident at once.
+
+    Parameters
+    ----------
+    directory : ``str``, required
+        The directory holding (or that will hold) the index files.
+    dim : ``int``, optional
+        The dimensionality of the stored vectors (i.e. ``topic_dim``). Required when creating
+        a new index, read from disk otherwise.
+    metric : ``str``, optional (default=``"cosine"``)
+        Either ``"cosine"`` or ``"dot"``. With ``"cosine"``, vectors are unit-normalized when
+        added so that scoring is a plain dot product.
+    """
+    # Whether ``add`` keeps the hash codes of ``RandomProjectionIndex`` up to date.
+    _writes_codes = False
+
+    def __init__(self,
+                 directory: str,
+                 dim: int = None,
+                 metric: str = "cosine") -> None:
+        self._directory = directory
+        meta_path = os.path.join(directory, _META_FILE)
+
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as meta_file:
+                meta = json.load(meta_file)
+            if meta.get("version") != INDEX_FORMAT_VERSION:
+                raise ValueError("Index at {} has format version {}, expected {}.".format(
+                        directory, meta.get("version"), INDEX_FORMAT_VERSION))
+            if dim is not None and dim != meta["dim"]:
+                raise ValueError("Index at {} stores {}-dimensional vectors, "
+                                 "got dim={}.".format(directory, meta["dim"], dim))
+            self._meta = meta
+        else:
+            if dim is None:
+                raise ValueError("No index found at {}; dim is required to create one.".format(directory))
+            if metric not in ("cosine", "dot"):
+                raise ValueError("Unknown metric: {}".format(metric))
+            os.makedirs(directory, exist_ok=True)
+            self._meta = {"version": INDEX_FORMAT_VERSION, "dim": dim, "metric": metric, "size": 0}
+            self._write_meta()
+
+        self._vectors = None
+        self._ids = None
+        self._open()
+
+    @property
+    def dim(self) -> int:
+        return self._meta["dim"]
+
+    @property
+    def metric(self) -> str:
+        return self._meta["metric"]
+
+    def __len__(self) -> int:
+        return self._meta["size"]
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """ The stored (possibly normalized) vectors as a read-only memory-map. """
+        return self._vectors
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self._directory, name)
+
+    def _append(self, name: str, data: np.ndarray) -> None:
+        """
+        Appends ``data`` (rows of the file ``name``) after the ``len(self)`` rows recorded in the
+        metadata, cutting off whatever an interrupted ``add`` wrote past them.
+        """
+        row_bytes = data.dtype.itemsize * int(np.prod(data.shape[1:], dtype=np.int64))
+        with open(self._path(name), 'ab') as data_file:
+            data_file.truncate(len(self) * row_bytes)
+            data_file.write(np.ascontiguousarray(data).tobytes())
+
+    def _write_meta(self) -> None:
+        # Write-then-rename so that a crash mid-append never leaves a size that disagrees
+        # with the data files.
+        tmp_path = self._path(_META_FILE + ".tmp")
+        with open(tmp_path, 'w') as meta_file:
+            json.dump(self._meta, meta_file)
+        os.replace(tmp_path, self._path(_META_FILE))
+
+    def _open(self) -> None:
+        size = len(self)
+        if size == 0:
+            self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+            self._ids = np.zeros((0,), dtype=np.int64)
+            return
+        self._vectors = np.memmap(self._path(_VECTORS_FILE), dtype=np.float32,
+                                  mode='r', shape=(size, self.dim))
+        self._ids = np.memmap(self._path(_IDS_FILE), dtype=np.int64, mode='r', shape=(size,))
+
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        if vectors.shape[1] != self.dim:
+            raise ValueError("Expected vectors of dimension {}, got {}.".format(self.dim, vectors.shape[1]))
+        if self.metric == "cosine":
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.maximum(norms, 1e-12)
+        return vectors
+
+    def add(self, ids: Iterable[int], vectors: np.ndarray) -> None:
+        """
+        Appends ``vectors`` (shape ``(n, dim)``) under the given document ``ids``.
+        """
+        self._write(*self._checked(ids, vectors))
+
+    def _checked(self, ids: Iterable[int], vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """ The ``ids`` and prepared ``vectors`` of an ``add``, checked before anything is written. """
+        if "lsh" in self._meta and not self._writes_codes:
+            raise ValueError("Index at {} has hash codes; add to it through a "
+                             "RandomProjectionIndex.".format(self._directory))
+        vectors = self._prepare(vectors)
+        ids = np.asarray(list(ids), dtype=np.int64)
+        if ids.shape[0] != vectors.shape[0]:
+            raise ValueError("Got {} ids for {} vectors.".format(ids.shape[0], vectors.shape[0]))
+        return ids, vectors
+
+    def _write(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        # Drop the memory-maps before growing the files underneath them.
+        self._vectors = None
+        self._ids = None
+        self._append(_VECTORS_FILE, vectors)
+        self._append(_IDS_FILE, ids)
+
+        self._meta["size"] += ids.shape[0]
+        self._write_meta()
+        self._open()
+
+    def search(self,
+               queries: np.ndarray,
+               k: int = 10,
+               block_size: int = 65536,
+               candidates: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exact top-k search.
+
+        Parameters
+        ----------
+        queries : ``np.ndarray``, required
+            Query vectors of shape ``(num_queries, dim)`` (or a single ``(dim,)`` vector).
+        k : ``int``, optional (default=10)
+            The number of neighbors to return per query.
+        block_size : ``int``, optional (default=65536)
+            The number of stored rows scored per matrix product.
+        candidates : ``np.ndarray``, optional
+            If given, only these row positions are scored.
+
+        Returns
+        -------
+        A tuple ``(ids, scores)``, each of shape ``(num_queries, min(k, size))`` and sorted by
+        decreasing score.
+        """
+        queries = self._prepare(queries)
+        rows = self._vectors if candidates is None else None
+        total = len(self) if candidates is None else candidates.shape[0]
+        k = min(k, total)
+        num_queries = queries.shape[0]
+        if k == 0:
+            return np.zeros((num_queries, 0), dtype=np.int64), np.zeros((num_queries, 0), dtype=np.float32)
+
+        best_scores = np.full((num_queries, k), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((num_queries, k), dtype=np.int64)
+        for start in range(0, total, block_size):
+            end = min(start + block_size, total)
+            if rows is not None:
+                block = rows[start:end]
+                block_rows = np.arange(start, end, dtype=np.int64)
+            else:
+                block_rows = np.sort(candidates[start:end])
+                block = self._vectors[block_rows]
+
+            # Shape: (num_queries, block rows)
+            scores = queries @ np.asarray(block).T
+
+            # Merge the block's local top-k with the running top-k.
+            if scores.shape[1] > k:
+                local = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, local, axis=1)
+                local_rows = block_rows[local]
+            else:
+                local_rows = np.broadcast_to(block_rows, scores.shape)
+            merged_scores = np.concatenate([best_scores, scores], axis=1)
+            merged_rows = np.concatenate([best_rows, local_rows], axis=1)
+            top = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(merged_scores, top, axis=1)
+            best_rows = np.take_along_axis(merged_rows, top, axis=1)
+
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        return np.asarray(self._ids)[best_rows], best_scores
+
+
+class RandomProjectionIndex(TopicIndex):
+    """
+    An approximate ``TopicIndex`` for large corpora using random-projection LSH.
+
+    Every vector is hashed in ``num_tables`` tables by the signs of its projection onto
+    ``num_bits`` random hyperplanes. A query is only scored exactly against the rows that share
+    its bucket in at least one table; if that yields fewer than ``k`` candidates, the search
+    falls back to the exact blocked scan.
+
+    Hash codes are appended alongside the vectors, so incremental appends keep working. The
+    rows of each table are sorted by code on the first search after opening or appending, so
+    that finding a bucket is a binary search rather than a scan of every code.
+
+    Parameters
+    ----------
+    directory : ``str``, required
+        See ``TopicIndex``.
+    dim : ``int``, optional
+        See ``TopicIndex``.
+    metric : ``str``, optional (default=``"cosine"``)
+        See ``TopicIndex``.
+    num_tables : ``int``, optional (default=8)
+        The number of independent hash tables. More tables raise recall at the cost of more
+        candidates per query.
+    num_bits : ``int``, optional (default=16)
+        Hyperplanes per table (at most 64). More bits mean smaller buckets.
+    seed : ``int``, optional (default=1337)
+        Seed for drawing the hyperplanes.
+    """
+    _writes_codes = True
+
+    def __init__(self,
+                 directory: str,
+                 dim: int = None,
+                 metric: str = "cosine",
+                 num_tables: int = 8,
+                 num_bits: int = 16,
+                 seed: int = 1337) -> None:
+        super().__init__(directory, dim, metric)
+        lsh = self._meta.get("lsh")
+        if lsh is None:
+            if len(self) > 0:
+                raise ValueError("Index at {} was built without hash codes.".format(directory))
+            if not 0 < num_bits <= 64:
+                raise ValueError("num_bits must be in (0, 64], got {}.".format(num_bits))
+            lsh = {"num_tables": num_tables, "num_bits": num_bits, "seed": seed}
+            self._meta["lsh"] = lsh
+            self._write_meta()
+
+        self._num_tables = lsh["num_tables"]
+        self._num_bits = lsh["num_bits"]
+        rng = np.random.RandomState(lsh["seed"])
+        # Shape: (dim, num_tables * num_bits)
+        self._hyperplanes = rng.randn(self.dim, self._num_tables * self._num_bits).astype(np.float32)
+        self._bit_weights = np.left_shift(np.uint64(1), np.arange(self._num_bits, dtype=np.uint64))
+        self._open_codes()
+
+    def _open_codes(self) -> None:
+        if len(self) == 0:
+            self._codes = np.zeros((0, self._num_tables), dtype=np.uint64)
+        else:
+            self._codes = np.memmap(self._path(_CODES_FILE), dtype=np.uint64,
+                                    mode='r', shape=(len(self), self._num_tables))
+        self._buckets = None
+
+    def _sorted_buckets(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Per table, the stored rows ordered by their code and the codes in that order, both of
+        shape ``(num_tables, size)``: the rows of a bucket are a contiguous range of the former.
+        """
+        if self._buckets is None:
+            codes = np.asarray(self._codes).T
+            rows = np.argsort(codes, axis=1, kind='stable')
+            self._buckets = (rows, np.take_along_axis(codes, rows, axis=1))
+        return self._buckets
+
+    def _hash(self, vectors: np.ndarray) -> np.ndarray:
+        """ Returns codes of shape ``(n, num_tables)`` for already-prepared vectors. """
+        bits = (vectors @ self._hyperplanes) > 0
+        bits = bits.reshape(vectors.shape[0], self._num_tables, self._num_bits).astype(np.uint64)
+        return (bits * self._bit_weights).sum(axis=-1, dtype=np.uint64)
+
+    def add(self, ids: Iterable[int], vectors: np.ndarray) -> None:
+        ids, vectors = self._checked(ids, vectors)
+        codes = self._hash(vectors)
+        self._codes = None
+        self._append(_CODES_FILE, codes)
+        self._write(ids, vectors)
+        self._open_codes()
+
+    def search(self,
+               queries: np.ndarray,
+               k: int = 10,
+               block_size: int = 65536,
+               candidates: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        if candidates is not None:
+            return super().search(queries, k, block_size, candidates)
+
+        prepared = self._prepare(queries)
+        k = min(k, len(self))
+        if k == 0:
+            return super().search(prepared, k, block_size)
+        num_queries = prepared.shape[0]
+        rows_by_code, sorted_codes = self._sorted_buckets()
+
+        # The ranges of ``rows_by_code`` holding each query's bucket in each table, flattened
+        # to one (query, row) pair per collision.
+        query_codes = self._hash(prepared)
+        starts = np.stack([np.searchsorted(sorted_codes[table], query_codes[:, table], side='left')
+                           for table in range(self._num_tables)], axis=1)
+        ends = np.stack([np.searchsorted(sorted_codes[table], query_codes[:, table], side='right')
+                         for table in range(self._num_tables)], axis=1)
+        lengths = (ends - starts).ravel()
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        tables = np.repeat(np.tile(np.arange(self._num_tables), num_queries), lengths)
+        rows = rows_by_code[tables, np.repeat(starts.ravel(), lengths) + offsets]
+        queries_of_pairs = np.repeat(np.arange(num_queries).repeat(self._num_tables), lengths)
+        query_rows = np.unique(queries_of_pairs * len(self) + rows)
+        query_of, rows = np.divmod(query_rows, len(self))
+
+        # Scores every pair exactly and keeps the best k of each query.
+        scores = np.einsum('ij,ij->i', prepared[query_of], np.asarray(self._vectors[rows]))
+        order = np.lexsort((-scores, query_of))
+        query_of, rows, scores = query_of[order], rows[order], scores[order]
+        num_candidates = np.bincount(query_of, minlength=num_queries)
+        rank = np.arange(query_of.shape[0]) - np.repeat(np.cumsum(num_candidates) - num_candidates, num_candidates)
+        best_rows = np.zeros((num_queries, k), dtype=np.int64)
+        best_scores = np.zeros((num_queries, k), dtype=np.float32)
+        kept = rank < k
+        best_rows[query_of[kept], rank[kept]] = rows[kept]
+        best_scores[query_of[kept], rank[kept]] = scores[kept]
+        ids = np.asarray(self._ids)[best_rows]
+
+        # Queries whose buckets hold fewer than k rows are answered by the exact scan.
+        few = np.nonzero(num_candidates < k)[0]
+        if few.shape[0] > 0:
+            ids[few], best_scores[few] = super().search(prepared[few], k, block_size)
+        return ids, best_scores
@@ -0,0 +1,4 @@
+# Only modules that need nothing beyond PyTorch are imported here, so that serving processes
+# can load exported artifacts without importing AllenNLP. ``generation``, ``loading`` and
+# ``quantization`` are imported by their full paths.
+from library.inference import forking, server, topic_inference, torchscript
@@ -0,0 +1,76 @@
+"""
+Running several inference workers as forked processes that share one physical copy of the
+model's weights.
+"""
+import gc
+import logging
+import os
+import signal
+from typing import Callable, List
+
+import torch
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+def share_weights(module: torch.nn.Module) -> torch.nn.Module:
+    """
+    Moves the parameters and buffers of ``module`` into shared memory, in place.
+
+    Processes forked afterwards then map the same pages instead of inheriting them
+    copy-on-write, so a worker writing to a weight (or to anything else on the same page) never
+    gives it a private copy, and the tensors can be sent to processes started with
+    ``torch.multiprocessing`` without being copied.
+    """
+    return module.share_memory()
+
+
+def fork_workers(run_worker: Callable[[int], None], num_workers: int) -> List[int]:
+    """
+    Forks ``num_workers`` processes that each call ``run_worker(index)`` and exit, returning
+    their pids.
+
+    Everything the parent loaded before (the model above all) is shared with the workers rather
+    than loaded again. The parent's Python objects are moved out of the garbage collector's
+    reach first (``gc.freeze``, Python 3.7+), so that collections in the workers do not write
+    to, and thereby copy, the pages holding them. Load the model without running it: forked
+    processes can hang in OpenMP if the parent has already used a thread pool.
+    """
+    gc.collect()
+    if hasattr(gc, "freeze"):
+        gc.freeze()
+    pids = []
+    for index in range(num_workers):
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover
+            status = 0
+            try:
+                run_worker(index)
+            except BaseException:  # pylint: disable=broad-except
+                logger.exception("Worker %d failed", index)
+                status = 1
+            finally:
+                os._exit(status)  # pylint: disable=protected-access
+        pids.append(pid)
+    logger.info("Forked %d workers", num_workers)
+    return pids
+
+
+def wait_for_workers(pids: List[int]) -> int:
+    """
+    Waits until every worker in ``pids`` has exited and returns the number that failed. An
+    interrupt of the parent is passed on to the workers.
+    """
+    remaining = set(pids)
+    failures = 0
+    while remaining:
+        try:
+            pid, status = os.wait()
+        except KeyboardInterrupt:
+            for pid in remaining:
+                os.kill(pid, signal.SIGINT)
+            continue
+        if pid in remaining:
+            remaining.remove(pid)
+            failures += status != 0
+    return failures
@@ -0,0 +1,177 @@
+import logging
+from typing import List, Optional, Sequence
+
+import torch
+from allennlp.common.checks import ConfigurationError
+from allennlp.common.util import END_SYMBOL, START_SYMBOL
+from allennlp.models.model import Model
+from torch.nn.utils.rnn import pack_padded_sequence
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class TopicRNNGenerator:
+    """
+    Samples text from a trained ``TopicRNN``.
+
+    Generation is conditioned on a topic vector ``theta``, given directly or inferred (as the
+    mean ``mu`` of the variational distribution) from seed text. The topic additions
+    ``beta^T theta`` are computed once per sequence, and the ``text_encoder`` hidden state is
+    carried between steps so every new token costs a single RNN step. Many sequences are
+    decoded in parallel as one batch.
+
+    Parameters
+    ----------
+    model : ``TopicRNN``, required
+        A trained model whose ``text_encoder`` wraps a unidirectional, batch-first RNN.
+    """
+    def __init__(self, model: Model) -> None:
+        self._model = model
+        self._vocab = model.vocab
+        # pylint: disable=protected-access
+        self._rnn = model.text_encoder._module
+        if getattr(self._rnn, "bidirectional", False) or not getattr(self._rnn, "batch_first", False):
+            raise ConfigurationError("Generation requires a unidirectional, batch-first text_encoder.")
+        self._embedder = model.text_field_embedder
+        self._vocabulary_projection = model.vocabulary_projection_layer._module
+        self._stopword_projection = model.stopword_projection_layer._module
+
+        self._padding_index = 0
+        self._start_index = self._vocab.get_token_index(START_SYMBOL)
+        self._end_index = self._vocab.get_token_index(END_SYMBOL)
+
+    def topic_additions(self, theta: torch.Tensor) -> torch.Tensor:
+        """ ``beta^T theta`` for a batch of topic vectors, zeroed for padding and unknowns. """
+        topic_additions = torch.mm(theta, self._model.beta)
+        topic_additions[:, :2] = 0
+        return topic_additions
+
+    def generate(self,
+                 seeds: Optional[List[Sequence[str]]] = None,
+                 theta: Optional[torch.Tensor] = None,
+                 num_sequences: int = 1,
+                 max_length: int = 50,
+                 strategy: str = "greedy",
+                 top_k: int = 10,
+                 top_p: float = 0.9,
+                 temperature: float = 1.0) -> List[List[str]]:
+        """
+        Parameters
+        ----------
+        seeds : ``List[Sequence[str]]``, optional
+            Tokenized prefixes to continue. If omitted, generation starts from the start symbol.
+        theta : ``torch.Tensor``, optional
+            Topic vectors of shape ``(len(seeds), topic_dim)`` (or ``(1, topic_dim)`` without
+            seeds). Defaults to ``mu`` inferred from the seeds, or a draw from the prior.
+        num_sequences : ``int``, optional (default=1)
+            The number of sequences to sample per seed (or per ``theta``).
+        max_length : ``int``, optional (default=50)
+            The maximum number of tokens to generate per sequence.
+        strategy : ``str``, optional (default=``"greedy"``)
+            One of ``"greedy"``, ``"top_k"`` or ``"nucleus"``.
+        top_k : ``int``, optional (default=10)
+            Candidates kept with ``"top_k"``.
+        top_p : ``float``, optional (default=0.9)
+            Probability mass kept with ``"nucleus"``.
+        temperature : ``float``, optional (default=1.0)
+            Divides the logits before sampling.
+
+        Returns
+        -------
+        The generated continuations (without the seeds), one token list per sequence, grouped by
+        seed.
+        """
+        if strategy not in ("greedy", "top_k", "nucleus"):
+            raise ConfigurationError("Unknown decoding strategy: {}".format(strategy))
+
+        model = self._model
+        device = model.beta.device
+        if theta is not None:
+            if theta.dim() != 2 or theta.size(1) != model.topic_dim:
+                raise ConfigurationError("theta must have shape (batch, {}), got {}.".format(
+                        model.topic_dim, tuple(theta.size())))
+            if seeds is not None and theta.size(0) != len(seeds):
+                raise ConfigurationError("Got {} topic vectors for {} seeds.".format(theta.size(0), len(seeds)))
+        if seeds is None:
+            seeds = [[]] * (theta.size(0) if theta is not None else 1)
+        seeds = [[START_SYMBOL] + [token.lower() for token in seed] for seed in seeds]
+        seed_ids = [[self._vocab.get_token_index(token) for token in seed] for seed in seeds]
+
+        with torch.no_grad():
+            lengths = torch.LongTensor([len(ids) for ids in seed_ids])
+            prefix = torch.zeros(len(seed_ids), int(lengths.max()), dtype=torch.long)
+            for i, ids in enumerate(seed_ids):
+                prefix[i, :len(ids)] = torch.LongTensor(ids)
+            prefix = prefix.to(device)
+
+            if theta is None:
+                if any(len(seed) > 1 for seed in seeds):
+                    _, theta, _ = model.compute_variational_parameters({"tokens": prefix})
+                else:
+                    theta = model.noise.sample((len(seeds),)).to(device)
+            theta = theta.to(device).repeat_interleave(num_sequences, dim=0)
+            prefix = prefix.repeat_interleave(num_sequences, dim=0)
+            lengths = lengths.repeat_interleave(num_sequences, dim=0)
+
+            # Computed once per sequence rather than once per step.
+            topic_additions = self.topic_additions(theta)
+
+            # Encode the prefixes in one pass, keeping the output at each one's last token.
+            packed = pack_padded_sequence(self._embed(prefix), lengths, batch_first=True, enforce_sorted=False)
+            _, hidden_state = self._rnn(packed)
+            output = (hidden_state[0] if isinstance(hidden_state, tuple) else hidden_state)[-1]
+
+            batch_size = prefix.size(0)
+            generated = torch.zeros(batch_size, max_length, dtype=torch.long, device=device)
+            finished = torch.zeros(batch_size, dtype=torch.bool, device=device)
+            for step in range(max_length):
+                logits = self._next_token_logits(output, topic_additions) / temperature
+                next_tokens = self._select(logits, strategy, top_k, top_p)
+                next_tokens = next_tokens.masked_fill(finished, self._padding_index)
+                generated[:, step] = next_tokens
+                finished = finished | (next_tokens == self._end_index)
+                if bool(finished.all()):
+                    break
+
+                # A single RNN step from the carried state.
+                step_output, hidden_state = self._rnn(self._embed(next_tokens.unsqueeze(1)), hidden_state)
+                output = step_output[:, -1]
+
+        results = []
+        for row in generated.tolist():
+            tokens = []
+            for index in row:
+                if index in (self._padding_index, self._end_index):
+                    break
+                tokens.append(self._vocab.get_token_from_index(index))
+            results.append(tokens)
+        return results
+
+    def _embed(self, token_ids: torch.Tensor) -> torch.Tensor:
+        return self._embedder({"tokens": token_ids})
+
+    def _next_token_logits(self, output: torch.Tensor, topic_additions: torch.Tensor) -> torch.Tensor:
+        logits = self._vocabulary_projection(output)
+        # As in training, forthcoming stop words receive no topic additions.
+        is_stop = torch.argmax(self._stopword_projection(output), dim=-1) == 1
+        logits = logits + (~is_stop).unsqueeze(-1).float() * topic_additions
+        logits[:, self._padding_index] = -float("inf")
+        return logits
+
+    @staticmethod
+    def _select(logits: torch.Tensor, strategy: str, top_k: int, top_p: float) -> torch.Tensor:
+        if strategy == "greedy":
+            return torch.argmax(logits, dim=-1)
+
+        if strategy == "top_k":
+            values, _ = torch.topk(logits, min(top_k, logits.size(-1)), dim=-1)
+            logits = logits.masked_fill(logits < values[:, -1:], -float("inf"))
+        else:
+            sorted_logits, sorted_indices = torch.sort(logits, descending=True, dim=-1)
+            cumulative = torch.cumsum(torch.softmax(sorted_logits, dim=-1), dim=-1)
+            # Drop tokens once the mass before them already exceeds top_p; the first always stays.
+            remove = (cumulative - torch.softmax(sorted_logits, dim=-1)) > top_p
+            sorted_logits = sorted_logits.masked_fill(remove, -float("inf"))
+            logits = torch.full_like(logits, -float("inf")).scatter(-1, sorted_indices, sorted_logits)
+
+        return torch.multinomial(torch.softmax(logits, dim=-1), 1).squeeze(-1)
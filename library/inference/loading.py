@@ -0,0 +1,88 @@
+import inspect
+import logging
+import os
+import shutil
+import tarfile
+
+import torch
+from allennlp.common import Params
+from allennlp.data.vocabulary import Vocabulary
+from allennlp.models.model import Model
+
+from library.common.archives import load_weights
+from library.inference.forking import share_weights
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+def load_model(archive_file: str,
+               overrides: str = "",
+               weights_file: str = None,
+               cache_dir: str = None,
+               share_memory: bool = False) -> Model:
+    """
+    Loads a trained ``TopicRNN`` (or any model) for CPU inference, as a lighter alternative to
+    ``allennlp.models.archival.load_archive``:
+
+    - a ``model.tar.gz`` is extracted once into ``cache_dir`` (by default
+      ``<archive_file>.extracted``) and reused by later calls and by other processes,
+    - the weights are memory-mapped where PyTorch supports it and adopted by the model rather
+      than copied into freshly initialized parameters,
+    - ``pretrained_file`` is dropped from the model config, so that a fine-tuned classifier does
+      not load the archive it was initialized from only to overwrite its weights.
+
+    Parameters
+    ----------
+    archive_file : ``str``, required
+        A ``model.tar.gz`` or a serialization directory.
+    overrides : ``str``, optional
+        JSON overrides applied to the archived config.
+    weights_file : ``str``, optional
+        Weights to load instead of the archived ``weights.th``.
+    cache_dir : ``str``, optional
+        Where to extract ``archive_file``.
+    share_memory : ``bool``, optional (default=False)
+        Move the weights into shared memory (``library.inference.forking.share_weights``), for
+        a parent process that loads the model once and forks its workers. Workers that load the
+        model themselves already share the memory-mapped pages of the weights file.
+    """
+    if os.path.isdir(archive_file):
+        serialization_dir = archive_file
+    else:
+        serialization_dir = cache_dir or archive_file + ".extracted"
+        _extract(archive_file, serialization_dir)
+
+    config = Params.from_file(os.path.join(serialization_dir, "config.json"), overrides)
+    vocab = Vocabulary.from_files(os.path.join(serialization_dir, "vocabulary"))
+    model_params = config.pop("model")
+    model_params.pop("pretrained_file", None)
+    model = Model.from_params(vocab=vocab, params=model_params)
+
+    state_dict = load_weights(weights_file or os.path.join(serialization_dir, "weights.th"))
+    if "assign" in inspect.signature(torch.nn.Module.load_state_dict).parameters:
+        # PyTorch 2.1+: keep the (memory-mapped) loaded tensors instead of copying them.
+        model.load_state_dict(state_dict, assign=True)
+    else:
+        model.load_state_dict(state_dict)
+    if share_memory:
+        share_weights(model)
+    return model.eval()
+
+
+def _extract(archive_file: str, serialization_dir: str) -> None:
+    """ Extracts ``archive_file`` into ``serialization_dir`` unless an up-to-date copy exists. """
+    config_file = os.path.join(serialization_dir, "config.json")
+    if os.path.exists(config_file) and os.path.getmtime(config_file) >= os.path.getmtime(archive_file):
+        return
+
+    logger.info("Extracting %s into %s", archive_file, serialization_dir)
+    # Extract next to the target and rename, so that concurrent workers never see a partial copy.
+    staging_dir = "{}.{}.tmp".format(serialization_dir.rstrip("/"), os.getpid())
+    with tarfile.open(archive_file, 'r:gz') as archive:
+        archive.extractall(staging_dir)
+    shutil.rmtree(serialization_dir, ignore_errors=True)
+    try:
+        os.rename(staging_dir, serialization_dir)
+    except OSError:
+        # Another worker got there first.
+        shutil.rmtree(staging_dir, ignore_errors=True)
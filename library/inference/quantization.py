@@ -0,0 +1,53 @@
+import copy
+import io
+import logging
+
+import torch
+import torch.nn as nn
+from allennlp.common.checks import ConfigurationError
+from allennlp.models.archival import load_archive
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+# Recurrent layers dynamic quantization knows how to replace; vanilla ``nn.RNN`` is not
+# among them and stays in fp32.
+_QUANTIZABLE_RNNS = (nn.LSTM, nn.GRU)
+
+
+def quantize_model(model: nn.Module) -> nn.Module:
+    """
+    Returns a copy of a trained ``TopicRNN`` (or any module) for CPU inference in which every
+    ``Linear`` and supported RNN layer uses dynamic int8 quantization: weights are stored as int8
+    and activations are quantized on the fly per batch.
+
+    This covers the vocabulary projection, the ``500 * topic_dim`` output layer of the inference
+    network and the sentiment classifier. Free parameters such as ``beta`` remain in fp32.
+    """
+    quantization = getattr(torch, "quantization", None)
+    if quantization is None or not hasattr(quantization, "quantize_dynamic"):
+        raise ConfigurationError("Dynamic quantization requires PyTorch 1.3 or later.")
+
+    layer_types = {nn.Linear}
+    for module in model.modules():
+        if isinstance(module, _QUANTIZABLE_RNNS):
+            layer_types.add(type(module))
+        elif isinstance(module, nn.RNN):
+            logger.warning("Dynamic quantization does not support %s; it will stay in fp32.",
+                           type(module).__name__)
+
+    quantized = quantization.quantize_dynamic(copy.deepcopy(model).cpu().eval(),
+                                              layer_types, dtype=torch.qint8)
+    return quantized
+
+
+def model_size_in_bytes(model: nn.Module) -> int:
+    """ The size of the serialized ``state_dict`` of ``model``. """
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.getbuffer().nbytes
+
+
+def load_quantized_archive(archive_file: str, overrides: str = "") -> nn.Module:
+    """ Loads a trained archive and returns its model quantized for CPU inference. """
+    model = load_archive(archive_file, overrides=overrides).model
+    return quantize_model(model)
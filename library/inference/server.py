@@ -0,0 +1,349 @@
+import asyncio
+import http.client
+import json
+import logging
+import socket
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import torch
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            500: "Internal Server Error"}
+
+
+class TopicRNNBatchPredictor:
+    """
+    Predicts topic proportions and sentiment probabilities for a batch of raw review texts with
+    ``TopicRNNInference.predict``, i.e. without the vocabulary projection.
+
+    Parameters
+    ----------
+    module : ``TopicRNNInference`` (or its scripted form), required
+        The inference path of a trained ``TopicRNN``.
+    tokenize : ``Callable[[List[str]], List[List[str]]]``, required
+        Tokenizes a batch of texts, including start and end symbols.
+    token_to_index : ``Dict[str, int]``, required
+        The "tokens" vocabulary; unknown (lowercased) tokens map to 1.
+    labels : ``List[str]``, required
+        The sentiment labels in index order.
+    max_length : ``int``, optional (default=400)
+        Reviews are truncated to this many tokens.
+    """
+    def __init__(self,
+                 module: torch.nn.Module,
+                 tokenize: Callable[[List[str]], List[List[str]]],
+                 token_to_index: Dict[str, int],
+                 labels: List[str],
+                 max_length: int = 400) -> None:
+        self._module = module
+        self._tokenize = tokenize
+        self._token_to_index = token_to_index
+        self._labels = labels
+        self._max_length = max_length
+
+    def __call__(self, texts: List[str]) -> List[Dict[str, Any]]:
+        ids = [[self._token_to_index.get(token.lower(), 1) for token in tokens][:self._max_length]
+               for tokens in self._tokenize(texts)]
+        tokens = torch.zeros(len(ids), max(len(sequence) for sequence in ids), dtype=torch.long)
+        for i, sequence in enumerate(ids):
+            tokens[i, :len(sequence)] = torch.LongTensor(sequence)
+        with torch.no_grad():
+            mu, sentiment_probs = self._module.predict(tokens)
+        return [{"topics": topics, "sentiment": dict(zip(self._labels, probs))}
+                for topics, probs in zip(mu.tolist(), sentiment_probs.tolist())]
+
+    @classmethod
+    def from_archive(cls,
+                     archive_file: str,
+                     max_length: int = 400,
+                     share_memory: bool = False) -> 'TopicRNNBatchPredictor':
+        """
+        Builds a predictor from a trained ``TopicRNN`` archive (requires AllenNLP). With
+        ``share_memory``, its weights are moved into shared memory for forked workers.
+        """
+        # pylint: disable=import-outside-toplevel
+        from allennlp.common.util import END_SYMBOL, START_SYMBOL
+        from allennlp.data.tokenizers import WordTokenizer
+        from library.inference.forking import share_weights
+        from library.inference.loading import load_model
+        from library.inference.torchscript import TopicRNNInference
+
+        model = load_model(archive_file)
+        tokenizer = WordTokenizer(start_tokens=[START_SYMBOL], end_tokens=[END_SYMBOL])
+
+        def tokenize(texts: List[str]) -> List[List[str]]:
+            return [[token.text for token in tokens] for tokens in tokenizer.batch_tokenize(texts)]
+
+        index_to_label = model.vocab.get_index_to_token_vocabulary("labels")
+        labels = [index_to_label.get(index, str(index)) for index in range(2)]
+        # The inference module copies the weights it needs; ``model`` is dropped afterwards.
+        module = TopicRNNInference.from_model(model)
+        if share_memory:
+            share_weights(module)
+        return cls(module, tokenize, model.vocab.get_token_to_index_vocabulary("tokens"), labels, max_length)
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent ``predict`` calls into batches for ``predict_batch``, which runs in a
+    pool of ``num_workers`` threads (PyTorch releases the GIL in its kernels).
+
+    A batch is started as soon as a worker is free and a request is waiting. It then takes the
+    requests that arrive within ``max_wait_ms`` of the first, up to ``max_batch_size``, so
+    under load batches fill up while the workers are busy and under light load a lone request
+    waits at most ``max_wait_ms``.
+
+    Parameters
+    ----------
+    predict_batch : ``Callable[[List[Any]], List[Any]]``, required
+        Maps a batch of inputs to their results, in order.
+    max_batch_size : ``int``, optional (default=32)
+    max_wait_ms : ``float``, optional (default=5.0)
+    num_workers : ``int``, optional (default=1)
+    """
+    def __init__(self,
+                 predict_batch: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = 32,
+                 max_wait_ms: float = 5.0,
+                 num_workers: int = 1) -> None:
+        self._predict_batch = predict_batch
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait_ms / 1000
+        self._num_workers = num_workers
+        self._executor = ThreadPoolExecutor(num_workers)
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Future] = None
+        self._latencies: deque = deque(maxlen=10000)
+        self._batch_sizes: Counter = Counter()
+        self._num_requests = 0
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._workers = asyncio.Semaphore(self._num_workers)
+        self._task = asyncio.ensure_future(self._batch_requests())
+
+    async def stop(self) -> None:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._executor.shutdown(wait=True)
+
+    async def predict(self, item: Any) -> Any:
+        future = asyncio.get_event_loop().create_future()
+        await self._queue.put((item, future, time.perf_counter()))
+        return await future
+
+    def metrics(self) -> Dict[str, Any]:
+        """ Request latency percentiles (over the last 10000 requests) and batch sizes. """
+        latencies = sorted(self._latencies)
+
+        def percentile(fraction: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return 1000 * latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+        return {
+                "requests": self._num_requests,
+                "latency_ms": {"p50": percentile(0.5), "p90": percentile(0.9),
+                               "p99": percentile(0.99), "max": percentile(1.0)},
+                "batch_sizes": {str(size): count for size, count in sorted(self._batch_sizes.items())},
+        }
+
+    async def _batch_requests(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            await self._workers.acquire()
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self._max_wait
+            while len(batch) < self._max_batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            asyncio.ensure_future(self._run_batch(batch))
+
+    async def _run_batch(self, batch: List[Tuple[Any, asyncio.Future, float]]) -> None:
+        try:
+            results = await asyncio.get_event_loop().run_in_executor(
+                    self._executor, self._predict_batch, [item for item, _, _ in batch])
+        except Exception as error:  # pylint: disable=broad-except
+            logger.exception("Batch of %d failed", len(batch))
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(error)
+        else:
+            finished = time.perf_counter()
+            for (_, future, submitted), result in zip(batch, results):
+                self._latencies.append(finished - submitted)
+                if not future.done():
+                    future.set_result(result)
+            self._batch_sizes[len(batch)] += 1
+            self._num_requests += len(batch)
+        finally:
+            self._workers.release()
+
+
+class InferenceServer:
+    """
+    A minimal HTTP/1.1 front end (one request per connection) to a ``MicroBatcher``:
+
+    - ``POST /predict`` with ``{"text": "..."}`` returns one prediction; with
+      ``{"texts": [...]}`` it returns ``{"predictions": [...]}``. Each text is batched on its
+      own, together with those of concurrent requests.
+    - ``GET /metrics`` returns ``MicroBatcher.metrics()``.
+    - ``GET /health`` returns ``{"status": "ok"}``.
+
+    With ``sock``, the server accepts connections on that already listening socket instead of
+    binding ``host`` and ``port``, which lets forked processes share one port.
+    """
+    def __init__(self,
+                 batcher: MicroBatcher,
+                 host: str = "127.0.0.1",
+                 port: int = 8000,
+                 sock: socket.socket = None) -> None:
+        self.batcher = batcher
+        self.host = host
+        self.port = port
+        self._sock = sock
+        self._server = None
+
+    async def start(self) -> None:
+        self.batcher.start()
+        if self._sock is not None:
+            self._server = await asyncio.start_server(self._handle, sock=self._sock)
+        else:
+            self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        # Resolves port 0 to the port actually bound.
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("Serving on http://%s:%d", self.host, self.port)
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+        await self.batcher.stop()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            method, path, body = await _read_request(reader)
+            status, payload = await self._route(method, path, body)
+        except (ValueError, KeyError, TypeError) as error:
+            status, payload = 400, {"error": str(error)}
+        except Exception as error:  # pylint: disable=broad-except
+            logger.exception("Request failed")
+            status, payload = 500, {"error": str(error)}
+
+        content = json.dumps(payload).encode('utf-8')
+        writer.write("HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n"
+                     "Connection: close\r\n\r\n".format(status, _REASONS[status], len(content)).encode('latin-1'))
+        writer.write(content)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, body: bytes) -> Tuple[int, Any]:
+        if path == "/predict":
+            if method != "POST":
+                return 405, {"error": "Use POST."}
+            request = json.loads(body.decode('utf-8'))
+            if "texts" in request:
+                predictions = await asyncio.gather(*(self.batcher.predict(str(text))
+                                                     for text in request["texts"]))
+                return 200, {"predictions": list(predictions)}
+            return 200, await self.batcher.predict(str(request["text"]))
+        if path == "/metrics":
+            return 200, self.batcher.metrics()
+        if path == "/health":
+            return 200, {"status": "ok"}
+        return 404, {"error": "Unknown path {}".format(path)}
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Tuple[str, str, bytes]:
+    request_line = (await reader.readline()).decode('latin-1').strip()
+    method, path, _ = request_line.split(" ", 2)
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1').strip()
+        if not line:
+            break
+        name, value = line.split(":", 1)
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return method, path.split("?", 1)[0], body
+
+
+def serve(predict_batch: Callable[[List[Any]], List[Any]],
+          host: str = "127.0.0.1",
+          port: int = 8000,
+          max_batch_size: int = 32,
+          max_wait_ms: float = 5.0,
+          num_workers: int = 1,
+          num_processes: int = 1) -> None:
+    """
+    Runs an ``InferenceServer`` around ``predict_batch`` until interrupted.
+
+    With ``num_processes > 1``, the port is bound once and that many forked processes accept
+    connections on it, each with its own ``MicroBatcher`` (and ``/metrics``). Whatever
+    ``predict_batch`` holds, the model above all, is loaded once and shared with them; see
+    ``library.inference.forking``.
+    """
+    if num_processes > 1:
+        # pylint: disable=import-outside-toplevel
+        from library.inference.forking import fork_workers, wait_for_workers
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+        sock.listen(128)
+        sock.setblocking(False)
+
+        def run_worker(_: int) -> None:
+            asyncio.set_event_loop(asyncio.new_event_loop())
+            _serve_forever(InferenceServer(MicroBatcher(predict_batch, max_batch_size, max_wait_ms, num_workers),
+                                           host, port, sock))
+
+        pids = fork_workers(run_worker, num_processes)
+        sock.close()
+        wait_for_workers(pids)
+        return
+    _serve_forever(InferenceServer(MicroBatcher(predict_batch, max_batch_size, max_wait_ms, num_workers),
+                                   host, port))
+
+
+def _serve_forever(server: InferenceServer) -> None:
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(server.start())
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(server.stop())
+
+
+def request(host: str, port: int, method: str, path: str, payload: Any = None) -> Tuple[int, Any]:
+    """
+    Sends one request to an ``InferenceServer`` and returns ``(status, decoded JSON body)``;
+    a blocking helper for tests and benchmarks.
+    """
+    connection = http.client.HTTPConnection(host, port)
+    try:
+        body = None if payload is None else json.dumps(payload)
+        connection.request(method, path, body=body, headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read().decode('utf-8'))
+    finally:
+        connection.close()
@@ -0,0 +1,240 @@
+import json
+import logging
+import os
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import torch
+import torch.nn as nn
+
+from library.common.archives import BASE_ARCHIVE_KEY, ExtractedArchive, load_base_weights, load_weights
+from library.modules.sparse import sparse_term_linear
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+# Prefixes of the TopicRNN state dict that the inference network needs.
+_INFERENCE_PARAMETERS = ("variational_autoencoder.", "w_mu", "a_mu", "w_sigma", "a_sigma")
+
+_ACTIVATIONS = {
+    "linear": lambda: (lambda x: x),
+    "tanh": nn.Tanh,
+    "sigmoid": nn.Sigmoid,
+    "relu": nn.ReLU,
+}
+
+_CACHE_FILE = "topic_inference.th"
+_STOPLESS_FILE = "stopless.txt"
+_TOKENS_FILE = "tokens.txt"
+
+
+class TopicInferenceNetwork(nn.Module):
+    """
+    The term-frequency -> ``variational_autoencoder`` -> ``w_mu``/``a_mu`` path of ``TopicRNN``
+    on its own, for serving topic lookups without the RNN or the vocabulary projection.
+
+    Inputs are sparse term-count vectors in the "stopless" vocabulary space, so the first layer
+    costs time proportional to the number of distinct terms rather than the vocabulary size.
+    Use ``from_archive`` to load one from a trained model; only the inference network's weights
+    are ever kept, and after the first load they come from a small cache file next to the
+    archive so the RNN weights are never read again.
+
+    Parameters
+    ----------
+    input_dim : ``int``, required
+        The size of the stopless vocabulary.
+    hidden_dims : ``List[int]``, required
+        Output sizes of the inference network's layers; the last must be ``500 * topic_dim``.
+    activations : ``List[str]``, required
+        Activation names (``"tanh"``, ``"sigmoid"``, ``"relu"`` or ``"linear"``) per layer.
+    topic_dim : ``int``, required
+        The number of latent topics.
+    stopless_tokens : ``List[str]``, optional
+        The stopless vocabulary in index order, used by ``term_counts``.
+    known_tokens : ``List[str]``, optional
+        The full ("tokens") vocabulary, used by ``term_counts`` to tell stop words (known but
+        not stopless) apart from unknown words.
+    """
+    def __init__(self,
+                 input_dim: int,
+                 hidden_dims: List[int],
+                 activations: List[str],
+                 topic_dim: int,
+                 stopless_tokens: List[str] = None,
+                 known_tokens: List[str] = None) -> None:
+        super(TopicInferenceNetwork, self).__init__()
+        self.topic_dim = topic_dim
+        self._config = {"input_dim": input_dim, "hidden_dims": list(hidden_dims),
+                        "activations": list(activations), "topic_dim": topic_dim}
+
+        input_dims = [input_dim] + list(hidden_dims[:-1])
+        self._linear_layers = nn.ModuleList([nn.Linear(in_dim, out_dim)
+                                             for in_dim, out_dim in zip(input_dims, hidden_dims)])
+        self._activations = [_ACTIVATIONS[name]() for name in activations]
+
+        self.w_mu = nn.Parameter(torch.zeros(500))
+        self.a_mu = nn.Parameter(torch.zeros(topic_dim))
+        self.w_sigma = nn.Parameter(torch.zeros(500))
+        self.a_sigma = nn.Parameter(torch.zeros(topic_dim))
+
+        self._stopless_index = {token: index for index, token in enumerate(stopless_tokens or [])}
+        self._known_tokens = list(known_tokens or [])
+        self._known_token_set = frozenset(self._known_tokens)
+
+    def forward(self,  # type: ignore
+                indices: torch.LongTensor,
+                counts: torch.Tensor,
+                offsets: torch.LongTensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        # pylint: disable=arguments-differ
+        """
+        Parameters
+        ----------
+        indices, counts, offsets : required
+            A batch of stopless term-count vectors in compressed sparse row form
+            (see ``library.modules.sparse.sparse_term_linear``).
+
+        Returns
+        -------
+        A tuple ``(mu, sigma)`` of the variational distribution, each ``(batch, topic_dim)``.
+        """
+        first_layer = self._linear_layers[0]
+        output = self._activations[0](sparse_term_linear(indices, counts, offsets,
+                                                         first_layer.weight, first_layer.bias))
+        for layer, activation in zip(self._linear_layers[1:], self._activations[1:]):
+            output = activation(layer(output))
+
+        # Shape: (batch, 500, topic_dim)
+        mapped_term_frequencies = output.view(output.size(0), 500, -1)
+        mu = torch.matmul(self.w_mu, mapped_term_frequencies) + self.a_mu
+        log_sigma = torch.matmul(self.w_sigma, mapped_term_frequencies) + self.a_sigma
+        return mu, torch.exp(log_sigma)
+
+    def term_counts(self, documents: Iterable[Sequence[str]]
+                   ) -> Tuple[torch.LongTensor, torch.Tensor, torch.LongTensor]:
+        """
+        Converts tokenized documents into the ``(indices, counts, offsets)`` expected by
+        ``forward``. Stop words are dropped and unknown words are counted as OOV.
+        """
+        indices: List[int] = []
+        counts: List[float] = []
+        offsets = [0]
+        for document in documents:
+            document_counts: Dict[int, int] = {}
+            for token in document:
+                token = token.lower()
+                index = self._stopless_index.get(token)
+                if index is None:
+                    # Stop words are known but absent from the stopless namespace.
+                    if token in self._known_token_set:
+                        continue
+                    index = 1
+                document_counts[index] = document_counts.get(index, 0) + 1
+            for index, count in document_counts.items():
+                indices.append(index)
+                counts.append(count)
+            offsets.append(len(indices))
+        return (torch.LongTensor(indices), torch.FloatTensor(counts), torch.LongTensor(offsets))
+
+    def infer(self, documents: Iterable[Sequence[str]]) -> Tuple[torch.Tensor, torch.Tensor]:
+        """ Returns ``(mu, sigma)`` for a batch of tokenized documents. """
+        with torch.no_grad():
+            return self(*self.term_counts(documents))
+
+    def save(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        torch.save({"config": self._config, "state_dict": self.state_dict()},
+                   os.path.join(directory, _CACHE_FILE))
+        stopless_tokens = sorted(self._stopless_index, key=self._stopless_index.get)
+        _write_tokens(os.path.join(directory, _STOPLESS_FILE), stopless_tokens)
+        _write_tokens(os.path.join(directory, _TOKENS_FILE), self._known_tokens)
+
+    @classmethod
+    def load(cls, directory: str) -> 'TopicInferenceNetwork':
+        saved = load_weights(os.path.join(directory, _CACHE_FILE))
+        network = cls(stopless_tokens=_read_tokens(os.path.join(directory, _STOPLESS_FILE)),
+                      known_tokens=_read_tokens(os.path.join(directory, _TOKENS_FILE)),
+                      **saved["config"])
+        network.load_state_dict(saved["state_dict"])
+        network.eval()
+        return network
+
+    @classmethod
+    def from_archive(cls, archive_file: str, cache_dir: str = None) -> 'TopicInferenceNetwork':
+        """
+        Loads the inference network of a trained TopicRNN ``model.tar.gz`` (or serialization
+        directory).
+
+        The first call extracts only the config, the vocabulary and the weights, keeps the
+        inference network's parameters and writes them to ``cache_dir`` (by default
+        ``<archive_file>.topic_inference``). Later calls load the cache directly.
+
+        Archives of ``allennlp train`` runs whose vocabulary was not prepared ahead of time lack
+        the "stopless" namespace, which the model only adds in memory; it is then derived from
+        the "tokens" namespace as the model derives it.
+        """
+        cache_dir = cache_dir or archive_file.rstrip("/") + ".topic_inference"
+        cache_file = os.path.join(cache_dir, _CACHE_FILE)
+        if os.path.exists(cache_file) and os.path.getmtime(cache_file) >= os.path.getmtime(archive_file):
+            return cls.load(cache_dir)
+
+        logger.info("Extracting the inference network from %s into %s", archive_file, cache_dir)
+        member_names = ("config.json", "weights.th",
+                        "vocabulary/" + _STOPLESS_FILE, "vocabulary/" + _TOKENS_FILE)
+        with ExtractedArchive(archive_file, member_names) as archive_dir:
+            with open(os.path.join(archive_dir, "config.json"), 'r') as config_file:
+                model_config = json.load(config_file)["model"]
+            known_tokens = _read_tokens(os.path.join(archive_dir, "vocabulary", _TOKENS_FILE))
+            stopless_file = os.path.join(archive_dir, "vocabulary", _STOPLESS_FILE)
+            if os.path.exists(stopless_file):
+                stopless_tokens = _read_tokens(stopless_file)
+            else:
+                # Imported here: the package of the stop word list imports the AllenNLP readers,
+                # which serving from the cache never needs.
+                from library.dataset_readers.util import STOP_WORDS  # pylint: disable=import-outside-toplevel
+                stop_words = frozenset(STOP_WORDS)
+                stopless_tokens = [token for token in known_tokens if token not in stop_words]
+            state_dict = load_weights(os.path.join(archive_dir, "weights.th"))
+        if BASE_ARCHIVE_KEY in state_dict:
+            # Delta weights of a fine-tuned classifier; the frozen inference network is in the
+            # archive it was fine-tuned from.
+            state_dict = load_base_weights(state_dict[BASE_ARCHIVE_KEY])
+
+        topic_dim = model_config.get("topic_dim", 20)
+        vae_config = model_config.get("variational_autoencoder") or {
+                "num_layers": 3,
+                "hidden_dims": [500, 500, 500 * topic_dim],
+                "activations": "tanh",
+        }
+        num_layers = vae_config["num_layers"]
+        hidden_dims = vae_config["hidden_dims"]
+        activations = vae_config["activations"]
+        if not isinstance(hidden_dims, list):
+            hidden_dims = [hidden_dims] * num_layers
+        if not isinstance(activations, list):
+            activations = [activations] * num_layers
+
+        network = cls(len(stopless_tokens), hidden_dims, activations, topic_dim,
+                      stopless_tokens, known_tokens)
+        inference_state = {}
+        for name, tensor in state_dict.items():
+            if not name.startswith(_INFERENCE_PARAMETERS):
+                continue
+            # FeedForward stores its layers as ``_linear_layers.<i>``, as we do.
+            inference_state[name.replace("variational_autoencoder.", "")] = tensor
+        network.load_state_dict(inference_state)
+        del state_dict
+
+        network.save(cache_dir)
+        network.eval()
+        return network
+
+
+def _read_tokens(path: str) -> List[str]:
+    """ Reads a padded namespace saved by ``Vocabulary.save_to_files``. """
+    with open(path, 'r') as token_file:
+        # Padding is implicit in AllenNLP's vocabulary files.
+        return ["@@PADDING@@"] + [line.rstrip("\n") for line in token_file]
+
+
+def _write_tokens(path: str, tokens: List[str]) -> None:
+    with open(path, 'w') as token_file:
+        for token in tokens[1:]:
+            token_file.write(token + "\n")
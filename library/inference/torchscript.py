@@ -0,0 +1,193 @@
+import copy
+import logging
+import os
+from typing import Dict, List, Tuple
+
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+MODEL_FILE = "topic_rnn.pt"
+VOCAB_FILE = "vocab.txt"
+
+
+class TopicRNNInference(nn.Module):
+    """
+    A scriptable copy of the inference path of a trained ``TopicRNN``: the token embedding, the
+    ``text_encoder`` RNN, the vocabulary projection with its (stopword-gated) topic additions,
+    the term-frequency inference network and the sentiment classifier.
+
+    It holds plain PyTorch modules only, so that ``torch.jit.script`` can compile it into an
+    artifact that is loadable with ``torch.jit.load`` without AllenNLP. The topic proportions are
+    taken to be the mean ``mu`` of the variational distribution rather than a sample.
+
+    Use ``from_model`` to build one from a ``TopicRNN``.
+    """
+    def __init__(self,
+                 embedding: nn.Embedding,
+                 rnn: nn.RNNBase,
+                 vocabulary_projection: nn.Linear,
+                 stopword_projection: nn.Linear,
+                 inference_network: nn.Sequential,
+                 sentiment_classifier: nn.Sequential,
+                 beta: torch.Tensor,
+                 w_mu: torch.Tensor,
+                 a_mu: torch.Tensor,
+                 w_sigma: torch.Tensor,
+                 a_sigma: torch.Tensor,
+                 full_to_stopless: torch.Tensor,
+                 stopless_dim: int) -> None:
+        super(TopicRNNInference, self).__init__()
+        self.embedding = embedding
+        self.rnn = rnn
+        self.vocabulary_projection = vocabulary_projection
+        self.stopword_projection = stopword_projection
+        self.inference_network = inference_network
+        self.sentiment_classifier = sentiment_classifier
+
+        # Padding and unknowns never receive topic additions.
+        beta = beta.clone()
+        beta[:, :2] = 0
+        self.register_buffer("beta", beta)
+        self.register_buffer("w_mu", w_mu.clone())
+        self.register_buffer("a_mu", a_mu.clone())
+        self.register_buffer("w_sigma", w_sigma.clone())
+        self.register_buffer("a_sigma", a_sigma.clone())
+        self.register_buffer("full_to_stopless", full_to_stopless)
+        self.stopless_dim = stopless_dim
+
+    def forward(self, tokens: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        Parameters
+        ----------
+        tokens : ``torch.LongTensor``, required
+            Right-padded token ids of shape ``(batch, sequence length)``, padding being 0.
+
+        Returns
+        -------
+        A tuple of
+        vocab_logits : ``(batch, sequence length, vocab size)`` next-word logits.
+        mu : ``(batch, topic_dim)`` topic proportions.
+        sigma : ``(batch, topic_dim)`` standard deviations of the variational distribution.
+        sentiment_probs : ``(batch, 2)`` sentiment class probabilities.
+        """
+        encoded, lengths = self._encode(tokens)
+        mapped_term_frequencies, mu, sigma = self._topics(tokens)
+
+        stopword_predictions = torch.argmax(self.stopword_projection(encoded), dim=-1)
+        topic_additions = torch.mm(mu, self.beta).unsqueeze(1)
+        vocab_logits = self.vocabulary_projection(encoded) + \
+            (1 - stopword_predictions).unsqueeze(-1).float() * topic_additions
+
+        sentiment_probs = self._sentiment(encoded, lengths, mapped_term_frequencies)
+        return vocab_logits, mu, sigma, sentiment_probs
+
+    @torch.jit.export
+    def predict(self, tokens: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        The topic proportions ``mu`` and sentiment probabilities of ``forward``, without the
+        vocabulary projection, for serving.
+        """
+        encoded, lengths = self._encode(tokens)
+        mapped_term_frequencies, mu, _ = self._topics(tokens)
+        return mu, self._sentiment(encoded, lengths, mapped_term_frequencies)
+
+    def _encode(self, tokens: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        lengths = (tokens != 0).long().sum(dim=1).clamp(min=1)
+        # The encoder is unidirectional, so outputs at valid positions are unaffected by the
+        # trailing padding and no packing is needed.
+        encoded, _ = self.rnn(self.embedding(tokens))
+        return encoded, lengths
+
+    def _topics(self, tokens: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        mask = (tokens != 0).long()
+        # Term frequencies in the stopless space; stop words and padding map to column 0.
+        frequencies = torch.zeros(tokens.size(0), self.stopless_dim, device=tokens.device)
+        frequencies.scatter_add_(1, self.full_to_stopless[tokens], mask.float())
+        frequencies[:, 0] = 0
+        mapped_term_frequencies = self.inference_network(frequencies)
+        mapped_term_frequencies = mapped_term_frequencies.view(tokens.size(0), 500, -1)
+        mu = torch.matmul(self.w_mu, mapped_term_frequencies) + self.a_mu
+        sigma = torch.exp(torch.matmul(self.w_sigma, mapped_term_frequencies) + self.a_sigma)
+        return mapped_term_frequencies, mu, sigma
+
+    def _sentiment(self,
+                   encoded: torch.Tensor,
+                   lengths: torch.Tensor,
+                   mapped_term_frequencies: torch.Tensor) -> torch.Tensor:
+        # The classifier sees the final hidden state at each sequence's true length.
+        final_index = (lengths - 1).view(-1, 1, 1).expand(-1, 1, encoded.size(-1))
+        final_states = encoded.gather(1, final_index).squeeze(1)
+        batch = encoded.size(0)
+        sentiment_features = torch.cat([final_states, mapped_term_frequencies.view(batch, -1)], dim=-1)
+        return torch.softmax(self.sentiment_classifier(sentiment_features), dim=-1)
+
+    @classmethod
+    def from_model(cls, model) -> 'TopicRNNInference':
+        """ Copies the inference path out of a ``TopicRNN``. """
+        embedder = getattr(model.text_field_embedder, "token_embedder_tokens", None)
+        if embedder is None or getattr(embedder, "_projection", None) is not None:
+            raise ValueError("Export supports a single, unprojected \"tokens\" embedding.")
+        embedding = nn.Embedding(embedder.weight.size(0), embedder.weight.size(1), padding_idx=0)
+        embedding.weight.data.copy_(embedder.weight.data)
+
+        rnn = copy.deepcopy(model.text_encoder._module)  # pylint: disable=protected-access
+        if rnn.bidirectional or not rnn.batch_first:
+            raise ValueError("Export supports batch-first, unidirectional encoders only.")
+
+        vocab = model.vocab
+        # Stop words are absent from the stopless namespace and map to padding.
+        full_to_stopless = model.vocabulary_tensors.full_to_stopless.cpu().clone()
+
+        return cls(embedding,
+                   rnn,
+                   copy.deepcopy(model.vocabulary_projection_layer._module),  # pylint: disable=protected-access
+                   copy.deepcopy(model.stopword_projection_layer._module),  # pylint: disable=protected-access
+                   _sequential_from_feedforward(model.variational_autoencoder),
+                   _sequential_from_feedforward(model.sentiment_classifier),
+                   model.beta.data,
+                   model.w_mu.data,
+                   model.a_mu.data,
+                   model.w_sigma.data,
+                   model.a_sigma.data,
+                   full_to_stopless,
+                   vocab.get_vocab_size("stopless")).eval()
+
+
+def _sequential_from_feedforward(feedforward) -> nn.Sequential:
+    """ Rebuilds an AllenNLP ``FeedForward`` as a plain ``nn.Sequential`` (dropout is dropped). """
+    layers: List[nn.Module] = []
+    # pylint: disable=protected-access
+    for linear, activation in zip(feedforward._linear_layers, feedforward._activations):
+        layers.append(copy.deepcopy(linear))
+        # Non-module activations (e.g. "linear") are identities.
+        layers.append(copy.deepcopy(activation) if isinstance(activation, nn.Module) else nn.Identity())
+    return nn.Sequential(*layers)
+
+
+def export(model, directory: str) -> None:
+    """
+    Scripts the inference path of ``model`` and writes it to ``directory`` alongside a vocab file
+    listing the "tokens" namespace in index order.
+    """
+    os.makedirs(directory, exist_ok=True)
+    scripted = torch.jit.script(TopicRNNInference.from_model(model))
+    scripted.save(os.path.join(directory, MODEL_FILE))
+
+    index_to_token = model.vocab.get_index_to_token_vocabulary("tokens")
+    with open(os.path.join(directory, VOCAB_FILE), 'w') as vocab_file:
+        for index in range(len(index_to_token)):
+            vocab_file.write(index_to_token[index] + "\n")
+    logger.info("Exported TopicRNN inference graph to %s", directory)
+
+
+def load_exported(directory: str) -> Tuple[torch.jit.ScriptModule, Dict[str, int]]:
+    """
+    Loads an artifact written by ``export``, returning the scripted module and a map from
+    (lowercased) token to id. Unknown tokens should be mapped to id 1.
+    """
+    module = torch.jit.load(os.path.join(directory, MODEL_FILE), map_location="cpu")
+    with open(os.path.join(directory, VOCAB_FILE), 'r') as vocab_file:
+        token_to_index = {line.rstrip("\n"): index for index, line in enumerate(vocab_file)}
+    return module, token_to_index
@@ -0,0 +1 @@
+from library.iterators import document_iterator, prefetch_iterator
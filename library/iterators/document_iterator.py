@@ -0,0 +1,122 @@
+import logging
+import random
+from typing import Iterable, Iterator, List
+
+from allennlp.common import Params
+from allennlp.common.util import is_lazy
+from allennlp.data.dataset import Batch
+from allennlp.data.instance import Instance
+from allennlp.data.iterators import BasicIterator, DataIterator
+from overrides import overrides
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+@DataIterator.register("document")
+class DocumentIterator(BasicIterator):
+    """
+    Batches the BPTT chunks of ``IMDBReviewReader`` so that all chunks of a review land in the
+    same batch, letting ``TopicRNN`` with ``group_documents`` run its inference network once per
+    review instead of once per chunk.
+
+    Consecutive instances with the same ``frequency_tokens`` are taken to be one review, as the
+    reader yields them. Reviews are read as a stream into pools of at most
+    ``max_instances_in_memory`` instances; the reviews (not chunks) of a pool are shuffled and
+    packed greedily into batches of at most ``batch_size`` instances. A review that does not fit
+    in the current batch starts a new one, and only reviews with more than ``batch_size`` chunks
+    are split across batches. As with ``BasicIterator``, lazy instances without
+    ``max_instances_in_memory`` are pooled ``batch_size`` instances at a time, and other
+    instances in a single pool.
+
+    The reader's ``shuffle_buffer_size`` must not be set with this iterator: the buffer mixes
+    the chunks of different reviews, which are then no longer consecutive and end up split into
+    several "reviews" across batches. Its ``num_shards`` shuffles whole reviews and is fine.
+
+    Parameters
+    ----------
+    batch_size : ``int``, optional (default=32)
+        The maximum number of instances (chunks) per batch.
+    max_instances_in_memory : ``int``, optional (default=None)
+        The maximum number of instances read ahead and shuffled together. A review longer than
+        this is a pool of its own.
+    """
+    def __init__(self, batch_size: int = 32, max_instances_in_memory: int = None) -> None:
+        super(DocumentIterator, self).__init__(batch_size=batch_size)
+        self._max_instances_in_memory = max_instances_in_memory
+
+    @overrides
+    def get_num_batches(self, instances: Iterable[Instance]) -> int:
+        if is_lazy(instances):
+            # Counting would read a lazy dataset once more, as ``BasicIterator`` avoids too.
+            return 1
+        # Packing depends on the order of the reviews; this counts it for the given order.
+        return sum(1 for pool in self._pools(instances)
+                   for _ in _pack([len(document) for document in pool], self._batch_size))
+
+    @overrides
+    def _create_batches(self, instances: Iterable[Instance], shuffle: bool) -> Iterable[Batch]:
+        for documents in self._pools(instances):
+            if shuffle:
+                random.shuffle(documents)
+            chunks = [instance for document in documents for instance in document]
+            start = 0
+            for batch_size in _pack([len(document) for document in documents], self._batch_size):
+                yield Batch(chunks[start:start + batch_size])
+                start += batch_size
+
+    def _pools(self, instances: Iterable[Instance]) -> Iterator[List[List[Instance]]]:
+        """ The reviews of ``instances``, read in pools of at most ``max_instances_in_memory`` chunks. """
+        max_pool_size = self._max_instances_in_memory
+        if max_pool_size is None and is_lazy(instances):
+            max_pool_size = self._batch_size
+        pool: List[List[Instance]] = []
+        pool_size = 0
+        for document in group_documents(instances):
+            if pool and max_pool_size is not None and pool_size + len(document) > max_pool_size:
+                yield pool
+                pool, pool_size = [], 0
+            pool.append(document)
+            pool_size += len(document)
+        if pool:
+            yield pool
+
+    @classmethod
+    def from_params(cls, params: Params) -> 'DocumentIterator':
+        batch_size = params.pop_int('batch_size', 32)
+        max_instances_in_memory = params.pop_int('max_instances_in_memory', None)
+        params.assert_empty(cls.__name__)
+        return cls(batch_size=batch_size, max_instances_in_memory=max_instances_in_memory)
+
+
+def group_documents(instances: Iterable[Instance]) -> Iterator[List[Instance]]:
+    """ Groups consecutive instances that share their ``frequency_tokens``. """
+    document: List[Instance] = []
+    previous_tokens = None
+    for instance in instances:
+        field = instance.fields["frequency_tokens"]
+        # The reader shares one field between a review's chunks; fall back to comparing tokens.
+        if document and (field is document[-1].fields["frequency_tokens"] or field.tokens == previous_tokens):
+            document.append(instance)
+            continue
+        if document:
+            yield document
+        document = [instance]
+        previous_tokens = field.tokens
+    if document:
+        yield document
+
+
+def _pack(document_lengths: List[int], batch_size: int) -> Iterator[int]:
+    """ The sizes of the batches that whole documents of ``document_lengths`` are packed into. """
+    current = 0
+    for length in document_lengths:
+        if current and current + length > batch_size:
+            yield current
+            current = 0
+        # Documents longer than a batch fill whole batches; their remainder is packed on.
+        while length > batch_size:
+            yield batch_size
+            length -= batch_size
+        current += length
+    if current:
+        yield current
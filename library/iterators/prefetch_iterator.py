@@ -0,0 +1,158 @@
+import itertools
+import logging
+import queue
+import threading
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+import torch
+from allennlp.common import Params
+from allennlp.data.dataset import Batch
+from allennlp.data.instance import Instance
+from allennlp.data.iterators import DataIterator
+from allennlp.data.vocabulary import Vocabulary
+from overrides import overrides
+
+from library.dataset_readers.shuffling import ResumableInstances
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+# Marks the end of the batches of a ``__call__``.
+_DONE = object()
+
+
+class _Failure:
+    """ An exception raised in a background thread, to be re-raised on the training thread. """
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+@DataIterator.register("prefetch")
+class PrefetchIterator(DataIterator):
+    """
+    Wraps another iterator and builds its batches ahead of time in background threads, so
+    that reading (including ``lazy`` readers), indexing, padding and tensorization overlap with
+    the model's forward and backward passes instead of running between optimizer steps.
+
+    One thread pulls ``Batch``es from the wrapped iterator's ``_create_batches`` (in the
+    wrapped iterator's order, so shuffling follows the seeded ``random`` module exactly as
+    without prefetching, provided nothing else draws from it during iteration, which holds for
+    AllenNLP's tensorization and training loop); ``num_workers`` threads index and tensorize them. Tensors are
+    yielded in the order the batches were created, whatever the worker timing. At most
+    ``queue_size`` batches are in flight at once, which bounds the extra memory.
+
+    Because batches are read ahead, the position of a ``ResumableInstances`` is ahead of
+    training; ``position`` holds the reading position right after the last batch yielded
+    instead, for ``library.training.resumable`` to save.
+
+    Threads rather than processes are used: tensorization runs mostly in PyTorch, which
+    releases the GIL, and the training step itself spends most of its time outside the GIL.
+
+    Parameters
+    ----------
+    iterator : ``DataIterator``, required
+        The iterator whose batches to prefetch.
+    num_workers : ``int``, optional (default=1)
+        Threads indexing and tensorizing batches.
+    queue_size : ``int``, optional (default=8)
+        The maximum number of batches created but not yet consumed.
+    """
+    def __init__(self, iterator: DataIterator, num_workers: int = 1, queue_size: int = 8) -> None:
+        self._iterator = iterator
+        self._num_workers = num_workers
+        self._queue_size = queue_size
+        self.vocab: Optional[Vocabulary] = None
+        self.position: Optional[Dict[str, Any]] = None
+
+    @overrides
+    def index_with(self, vocab: Vocabulary) -> None:
+        self.vocab = vocab
+        self._iterator.index_with(vocab)
+
+    @overrides
+    def get_num_batches(self, instances: Iterable[Instance]) -> int:
+        return self._iterator.get_num_batches(instances)
+
+    @overrides
+    def _create_batches(self, instances: Iterable[Instance], shuffle: bool) -> Iterable[Batch]:
+        # pylint: disable=protected-access
+        return self._iterator._create_batches(instances, shuffle)
+
+    def __call__(self,
+                 instances: Iterable[Instance],
+                 num_epochs: int = None,
+                 shuffle: bool = True,
+                 cuda_device: int = -1) -> Iterator[Dict[str, torch.Tensor]]:
+        epochs = itertools.count() if num_epochs is None else range(num_epochs)
+        resumable = isinstance(instances, ResumableInstances)
+        slots = threading.Semaphore(self._queue_size)
+        stop = threading.Event()
+        work: queue.Queue = queue.Queue()
+        results: Dict[int, object] = {}
+        results_ready = threading.Condition()
+
+        def publish(index: int, result: object) -> None:
+            with results_ready:
+                results[index] = result
+                results_ready.notify_all()
+
+        def produce() -> None:
+            index = 0
+            try:
+                for _ in epochs:
+                    for batch in self._create_batches(instances, shuffle):
+                        while not slots.acquire(timeout=0.1):
+                            if stop.is_set():
+                                return
+                        position = instances.position() if resumable else None
+                        work.put((index, batch, position))
+                        index += 1
+                publish(index, _DONE)
+            except BaseException as error:  # pylint: disable=broad-except
+                publish(index, _Failure(error))
+            finally:
+                for _ in range(self._num_workers):
+                    work.put(None)
+
+        def tensorize() -> None:
+            while not stop.is_set():
+                item = work.get()
+                if item is None:
+                    return
+                index, batch, position = item
+                try:
+                    if self.vocab is not None:
+                        batch.index_instances(self.vocab)
+                    padding_lengths = batch.get_padding_lengths()
+                    publish(index, (batch.as_tensor_dict(padding_lengths, cuda_device=cuda_device), position))
+                except BaseException as error:  # pylint: disable=broad-except
+                    publish(index, _Failure(error))
+
+        threads = [threading.Thread(target=produce, daemon=True)]
+        threads.extend(threading.Thread(target=tensorize, daemon=True) for _ in range(self._num_workers))
+        for thread in threads:
+            thread.start()
+
+        try:
+            for index in itertools.count():
+                with results_ready:
+                    while index not in results:
+                        results_ready.wait()
+                    result = results.pop(index)
+                if result is _DONE:
+                    return
+                if isinstance(result, _Failure):
+                    raise result.error
+                slots.release()
+                tensors, self.position = result
+                yield tensors
+        finally:
+            # Also reached when the consumer stops early; lets the threads wind down.
+            stop.set()
+
+    @classmethod
+    def from_params(cls, params: Params) -> 'PrefetchIterator':
+        iterator = DataIterator.from_params(params.pop("iterator"))
+        num_workers = params.pop_int("num_workers", 1)
+        queue_size = params.pop_int("queue_size", 8)
+        params.assert_empty(cls.__name__)
+        return cls(iterator, num_workers, queue_size)
@@ -1,11 +1,11 @@
-from collections import Counter
-from typing import Dict, Optional
+import logging
+from contextlib import ExitStack
+from typing import Dict, Optional, Tuple
 
 import torch
 import torch.nn as nn
-from allennlp.data.vocabulary import (DEFAULT_OOV_TOKEN, DEFAULT_PADDING_TOKEN,
-                                      Vocabulary)
-from allennlp.models.archival import load_archive
+from allennlp.common.checks import ConfigurationError
+from allennlp.data.vocabulary import Vocabulary
 from allennlp.models.model import Model
 from allennlp.modules import (FeedForward, Seq2SeqEncoder, TextFieldEmbedder,
                               TimeDistributed)
@@ -16,9 +16,16 @@ from allennlp.training.metrics import Average, CategoricalAccuracy
 from overrides import overrides
 from torch.distributions.multivariate_normal import MultivariateNormal
 from torch.nn.modules.linear import Linear
+from torch.utils.checkpoint import checkpoint
 
-from library.dataset_readers.util import STOP_WORDS
+from library.common.archives import BASE_ARCHIVE_KEY, load_base_weights, weights_sha256
+from library.common.profiling import StageProfiler
 from library.metrics.perplexity import Perplexity
+from library.modules.sparse import sparse_term_linear
+from library.vocabulary.preparation import (STOPLESS_NAMESPACE, add_stopless_namespace,
+                                            compute_vocabulary_tensors, load_vocabulary_tensors)
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
 
 @Model.register("topic_rnn")
@@ -49,6 +56,59 @@ class TopicRNN(Model):
         prediction the rest of the sequence.
     pretrained_file: ``str``, optional
         If provided, will initialize the model with the weights provided in this file.
+    prepared_vocabulary: ``str``, optional
+        A directory written by ``scripts/prepare_vocabulary.py`` for ``vocab``. The
+        full-to-stopless index map and the stop word ids are loaded from it rather than computed
+        from ``vocab``. It is only a cache: if the directory is missing or does not match (e.g.
+        when an archive is loaded on another machine), they are computed from ``vocab``'s
+        "stopless" namespace, so archives do not depend on it.
+    group_documents: ``bool``, optional (default=``False``)
+        If true, the variational distribution is inferred from the whole review
+        (``frequency_tokens``) rather than from the input chunk. Chunks of the same review in a
+        batch (those with identical ``frequency_tokens``) share one pass through the inference
+        network and the same ``theta`` samples, and the KL term is counted once per review in
+        the batch rather than once per chunk. Use with the ``"document"`` iterator, which keeps
+        a review's chunks in the same batch.
+    sparse_term_frequencies: ``bool``, optional (default=``False``)
+        If true, the term frequencies are passed to the first layer of the inference network as
+        (stopless index, count) pairs and multiplied with its weight sparsely, so that its cost
+        scales with the number of distinct words per document rather than with the stopless
+        vocabulary size. Outputs match the dense path. Requires a ``variational_autoencoder``
+        whose first layer is linear (any ``FeedForward``). Models quantized for inference use the
+        dense path.
+    checkpoint_activations: ``bool``, optional (default=``False``)
+        If true, the vocabulary projection and cross entropy of every topic sample are recomputed
+        during the backward pass instead of keeping their ``(batch, sequence length, vocabulary
+        size)`` activations alive, trading roughly one extra projection per sample for memory.
+    loss_chunk_size: ``int``, optional (default=``None``)
+        If provided, the language modeling loss is computed over chunks of this many time steps
+        at a time, each chunk's vocabulary projection being recomputed during the backward pass.
+        Peak memory then depends on the chunk size rather than on ``words_per_instance``, and
+        the loss is the same as without chunking.
+    bfloat16: ``bool``, optional (default=``False``)
+        If true, ``forward`` runs under autocast with bfloat16, so the encoder, vocabulary
+        projection, ``beta`` product and inference network use bf16 matrix multiplies. Softmax
+        and cross entropy, the KL term and metrics stay in fp32. Requires PyTorch 1.10+.
+    profile: ``bool``, optional (default=``False``)
+        If true, the wall time and allocated memory of every stage of ``forward`` is recorded
+        and reported through ``get_metrics`` (see ``StageProfiler``).
+    profile_trace_file: ``str``, optional
+        If provided (with ``profile``), stages of a window of batches are written to this file
+        as a Chrome trace.
+    profile_trace_start_batch: ``int``, optional (default=10)
+        The first batch of the traced window.
+    profile_trace_num_batches: ``int``, optional (default=5)
+        The number of batches in the traced window.
+    delta_checkpoints: ``bool``, optional (default=``False``)
+        If true (with ``freeze_feature_extraction``), ``state_dict`` holds only the trainable
+        parameters and, under ``"_base_archive"``, ``pretrained_file`` with a SHA-256 of the
+        frozen weights, so that checkpoints and the archived weights hold the classifier alone.
+        ``load_state_dict`` takes the frozen weights from ``pretrained_file`` as loaded by the
+        model or, if the model was built without it, from the referenced archive, and checks
+        the hash either way.
+    num_samples: ``int``, optional (default=20)
+        The number of topic proportions sampled from the variational distribution per instance
+        to estimate the expected reconstruction loss.
     initializer : ``InitializerApplicator``, optional (default=``InitializerApplicator()``)
         Used to initialize the model parameters.
     regularizer : ``RegularizerApplicator``, optional (default=``None``)
@@ -63,6 +123,18 @@ class TopicRNN(Model):
                  freeze_feature_extraction: bool = False,
                  classification_mode: bool = False,
                  pretrained_file: str = None,
+                 prepared_vocabulary: str = None,
+                 group_documents: bool = False,
+                 sparse_term_frequencies: bool = False,
+                 checkpoint_activations: bool = False,
+                 loss_chunk_size: int = None,
+                 bfloat16: bool = False,
+                 profile: bool = False,
+                 profile_trace_file: str = None,
+                 profile_trace_start_batch: int = 10,
+                 profile_trace_num_batches: int = 5,
+                 delta_checkpoints: bool = False,
+                 num_samples: int = 20,
                  initializer: InitializerApplicator = InitializerApplicator(),
                  regularizer: Optional[RegularizerApplicator] = None) -> None:
         super(TopicRNN, self).__init__(vocab, regularizer)
@@ -79,7 +151,21 @@ class TopicRNN(Model):
         if classification_mode:
             self.metrics['sentiment'] = CategoricalAccuracy()
 
+        self.group_documents = group_documents
+        self.sparse_term_frequencies = sparse_term_frequencies
+        self.checkpoint_activations = checkpoint_activations
+        self.loss_chunk_size = loss_chunk_size
+        if bfloat16 and not hasattr(torch, "autocast"):
+            raise ConfigurationError("bfloat16 mixed precision requires PyTorch 1.10 or later.")
+        self.bfloat16 = bfloat16
+        self.profiler = StageProfiler(profile, profile_trace_file,
+                                      profile_trace_start_batch, profile_trace_num_batches)
+        if delta_checkpoints and not freeze_feature_extraction:
+            raise ConfigurationError("delta_checkpoints requires freeze_feature_extraction.")
+
         if pretrained_file:
+            # Imported here so that only fine-tuning pays for archive loading.
+            from allennlp.models.archival import load_archive  # pylint: disable=import-outside-toplevel
             archive = load_archive(pretrained_file)
             pretrained_model = archive.model
             self._init_from_archive(pretrained_model)
@@ -99,25 +185,30 @@ class TopicRNN(Model):
             # word is a stopword.
             self.stopword_projection_layer = TimeDistributed(Linear(text_encoder.get_output_dim(), 2))
 
-            self.tokens_to_index = vocab.get_token_to_index_vocabulary()
-
-            # This step should only ever be performed ONCE.
-            # When running allennlp train, the vocabulary will be constructed before the model instantiation, but
-            # we can't create the stopless namespace until we get here.
-            # Check if there already exists a stopless namespace: if so refrain from altering it.
-            if "stopless" not in vocab._token_to_index.keys():
-                assert self.tokens_to_index[DEFAULT_PADDING_TOKEN] == 0 and \
-                       self.tokens_to_index[DEFAULT_OOV_TOKEN] == 1
-                for token, _ in self.tokens_to_index.items():
-                    if token not in STOP_WORDS:
-                        vocab.add_token_to_namespace(token, "stopless")
-
-                # Since a vocabulary with the stopless namespace hasn't been saved, save one for convienience.
-                vocab.save_to_files("vocabulary")
-
-            # Compute stop indices in the normal vocab space to prevent stop words
-            # from contributing to the topic additions.
-            self.stop_indices = torch.LongTensor([vocab.get_token_index(stop) for stop in STOP_WORDS])
+            # pylint: disable=protected-access
+            has_stopless_namespace = STOPLESS_NAMESPACE in vocab._token_to_index
+            vocabulary_tensors = None
+            if prepared_vocabulary:
+                try:
+                    vocabulary_tensors = load_vocabulary_tensors(prepared_vocabulary, vocab)
+                except ConfigurationError as error:
+                    if not has_stopless_namespace:
+                        raise
+                    # The directory is only a cache and is not archived: a model loaded from its
+                    # archive elsewhere computes the maps from its (archived) vocabulary.
+                    logger.info("%s Computing the index maps from the vocabulary instead.", error)
+            if vocabulary_tensors is None:
+                if not has_stopless_namespace:
+                    # Kept so that configs building their vocabulary from data still train, but the
+                    # namespace is then missing from the vocabulary AllenNLP has already saved.
+                    logger.warning("The vocabulary has no \"stopless\" namespace; adding it. Build the "
+                                   "vocabulary with scripts/prepare_vocabulary.py to avoid this.")
+                    add_stopless_namespace(vocab)
+                vocabulary_tensors = compute_vocabulary_tensors(vocab)
+            self.vocabulary_tensors = vocabulary_tensors
+
+            # Stop indices in the normal vocab space.
+            self.stop_indices = self.vocabulary_tensors.stop_indices
 
             # Learnable topics.
             # TODO: How should these be initialized?
@@ -140,7 +231,7 @@ class TopicRNN(Model):
             # noise: used when sampling.
             self.noise = MultivariateNormal(torch.zeros(topic_dim), torch.eye(topic_dim))
 
-            stopless_dim = vocab.get_vocab_size("stopless")
+            stopless_dim = vocab.get_vocab_size(STOPLESS_NAMESPACE)
             self.variational_autoencoder = variational_autoencoder or FeedForward(
                 # Takes as input the word frequencies in the stopless dimension and projects
                 # the word frequencies into a latent topic representation.
@@ -164,6 +255,13 @@ class TopicRNN(Model):
                 torch.nn.Sigmoid(),
             )
 
+        if classification_mode or pretrained_file:
+            # This function is only to be invoved when needing to classify.
+            # To avoid manually dealing with padding, instantiate a Seq2Vec instead. Also built
+            # without ``pretrained_file`` (e.g. by ``load_model``), so that a classifier's
+            # weights load either way.
+            self.text_to_vec = PytorchSeq2VecWrapper(self.text_encoder._modules['_module'])
+
         if freeze_feature_extraction:
             # Freeze the RNN and VAE pipeline so that only the classifier is trained.
             for name, param in self.named_parameters():
@@ -172,28 +270,28 @@ class TopicRNN(Model):
 
         self.sentiment_criterion = nn.CrossEntropyLoss()
 
-        self.num_samples = 20
+        self.num_samples = num_samples
 
         initializer(self)
 
+        # The archive the frozen weights come from, written into delta state dicts.
+        self._base_archive: Optional[Dict[str, str]] = None
+        if delta_checkpoints and pretrained_file:
+            self._base_archive = {"archive": pretrained_file, "sha256": self._frozen_weights_sha256()}
+
     def _init_from_archive(self, pretrained_model: Model):
         """ Given a TopicRNN instance, take its weights. """
         self.text_field_embedder = pretrained_model.text_field_embedder
         self.vocab_size = pretrained_model.vocab_size
         self.text_encoder = pretrained_model.text_encoder
-
-        # This function is only to be invoved when needing to classify.
-        # To avoid manually dealing with padding, instantiate a Seq2Vec instead.
-        self.text_to_vec = PytorchSeq2VecWrapper(self.text_encoder._modules['_module'])
-
         self.topic_dim = pretrained_model.topic_dim
         self.vocabulary_projection_layer = pretrained_model.vocabulary_projection_layer
         self.stopword_projection_layer = pretrained_model.stopword_projection_layer
-        self.tokens_to_index = pretrained_model.tokens_to_index
         self.w_mu = pretrained_model.w_mu
         self.a_mu = pretrained_model.a_mu
         self.w_sigma = pretrained_model.w_sigma
         self.a_sigma = pretrained_model.a_sigma
+        self.vocabulary_tensors = pretrained_model.vocabulary_tensors
         self.stop_indices = pretrained_model.stop_indices
         self.beta = pretrained_model.beta
         self.noise = pretrained_model.noise
@@ -226,30 +324,55 @@ class TopicRNN(Model):
         loss : torch.FloatTensor, optional
             A scalar loss to be optimised.
         """
+        with self._autocast():
+            return self._forward(input_tokens, output_tokens, frequency_tokens, sentiment)
+
+    def _autocast(self):
+        """ The bfloat16 autocast context if enabled, otherwise a no-op context. """
+        if not self.bfloat16:
+            return ExitStack()
+        return torch.autocast(self.beta.device.type, dtype=torch.bfloat16)
+
+    def _forward(self,
+                 input_tokens: Dict[str, torch.LongTensor],
+                 output_tokens: Dict[str, torch.LongTensor],
+                 frequency_tokens: Dict[str, torch.LongTensor],
+                 sentiment: Dict[str, torch.LongTensor]) -> Dict[str, torch.Tensor]:
         output_dict = {}
         # import pdb; pdb.set_trace()
+        profiler = self.profiler
+        profiler.step(self.beta.device)
 
         # Encode the input text.
         # Shape: (batch x sequence length x hidden size)
-        embedded_input = self.text_field_embedder(input_tokens)
-        input_mask = util.get_text_field_mask(input_tokens)
-        encoded_input = self.text_encoder(embedded_input, input_mask)
-
-        # Initial projection into vocabulary space, v^T * h_t.
-        # Shape: (batch x sequence length x vocabulary size)
-        logits = self.vocabulary_projection_layer(encoded_input)
-
-        # Predict stopwords.
-        # Note that for every logit in the projection into the vocabulary, the stop indicator
-        # will be the same within time steps. This is because we predict whether forthcoming
-        # words are stops or not and zero out topic additions for those time steps.
-        stopword_logits = torch.sigmoid(self.stopword_projection_layer(encoded_input))
-        stopword_predictions = torch.argmax(stopword_logits, dim=-1)
-        stopword_predictions = stopword_predictions.unsqueeze(2).expand_as(logits)
+        with profiler.stage("embedder"):
+            embedded_input = self.text_field_embedder(input_tokens)
+        with profiler.stage("text_encoder"):
+            input_mask = util.get_text_field_mask(input_tokens)
+            encoded_input = self.text_encoder(embedded_input, input_mask)
+
+        # When checkpointing or chunking, the projection is recomputed per sample instead of
+        # being stored.
+        checkpointing = self.checkpoint_activations and self.training
+        chunking = self.loss_chunk_size is not None
+        with profiler.stage("vocabulary_projection"):
+            # Initial projection into vocabulary space, v^T * h_t.
+            # Shape: (batch x sequence length x vocabulary size)
+            logits = None if checkpointing or chunking else self.vocabulary_projection_layer(encoded_input)
+
+            # Predict stopwords.
+            # Note that for every logit in the projection into the vocabulary, the stop indicator
+            # will be the same within time steps. This is because we predict whether forthcoming
+            # words are stops or not and zero out topic additions for those time steps.
+            stopword_logits = torch.sigmoid(self.stopword_projection_layer(encoded_input))
+            stopword_predictions = torch.argmax(stopword_logits, dim=-1)
+
+            # Shape: (batch x sequence length x 1)
+            topic_gate = (1 - stopword_predictions).float().unsqueeze(-1)
 
         # Word frequency vectors and noise aren't generated with the model. If the model
         # is running on a GPU, these tensors need to be moved to the correct device.
-        device = logits.device
+        device = encoded_input.device
 
         # Mask the output for proper loss calculation.
         output_mask = util.get_text_field_mask(output_tokens)
@@ -257,20 +380,22 @@ class TopicRNN(Model):
         relevant_output_mask = output_mask.contiguous()
 
         # Compute Gaussian parameters.
-
-        # TODO: Don't use the whole document?
-        stopless_word_frequencies = self._compute_word_frequency_vector(input_tokens).to(device=device)
-        mapped_term_frequencies = self.variational_autoencoder(stopless_word_frequencies)
-        
-        # Reshape to (E, K)
-        mapped_term_frequencies = mapped_term_frequencies.view(mapped_term_frequencies.size(0), 500, -1)
+        if self.group_documents:
+            # One row per distinct review in the batch; ``document_index`` maps chunks to them.
+            documents, document_index = torch.unique(frequency_tokens['tokens'], dim=0, return_inverse=True)
+            mapped_term_frequencies, mu, log_sigma = self.compute_variational_parameters({'tokens': documents})
+        else:
+            # TODO: Don't use the whole document?
+            document_index = None
+            mapped_term_frequencies, mu, log_sigma = self.compute_variational_parameters(input_tokens)
 
         # If the inference network ever learns to output just 0, something has gone wrong.
         self.metrics['mapped_term_freq_sum'](mapped_term_frequencies.sum().item())
         self.metrics['mapped_term_freq_filled_ratio']((mapped_term_frequencies != 0.0).sum().item() / (mapped_term_frequencies.numel()))
 
-        mu = torch.matmul(self.w_mu, mapped_term_frequencies) + self.a_mu
-        log_sigma = torch.matmul(self.w_sigma, mapped_term_frequencies) + self.a_sigma
+        # Under autocast these may be bf16; the KL term and sampling stay in fp32.
+        mu = mu.float()
+        log_sigma = log_sigma.float()
 
         # I .Compute KL-Divergence.
         # A closed-form solution exists since we're assuming q is drawn
@@ -280,41 +405,51 @@ class TopicRNN(Model):
         # Sum along the topic dimension and add const.
         kl_divergence = torch.sum(kl_divergence) / 2
 
-        aggregate_cross_entropy_loss = 0
-        for _ in range(self.num_samples):
-
-            # Compute noise for sampling.
-            epsilon = self.noise.rsample().to(device=device)
-
-            # Compute noisy topic proportions given Gaussian parameters.
-            theta = mu + torch.exp(log_sigma) * epsilon
-
-
-            # II. Compute cross entropy against next words for the current sample of noise.
-            # Padding and OOV tokens are indexed at 0 and 1.
-            topic_additions = torch.mm(theta, self.beta)
-            topic_additions.t()[0] = 0  # Padding will be treated as stops.
-            topic_additions.t()[1] = 0  # Unknowns will be treated as stops.
-
-            # Stop words have no contribution via topics.
-            topic_additions = (1 - stopword_predictions).float() * topic_additions.unsqueeze(1).expand_as(logits)
-            cross_entropy_loss = util.sequence_cross_entropy_with_logits(logits + topic_additions,
-                                                                         relevant_output,
-                                                                         relevant_output_mask)
-            aggregate_cross_entropy_loss += cross_entropy_loss
-
-        averaged_cross_entropy_loss = aggregate_cross_entropy_loss / self.num_samples
+        with profiler.stage("sampling_loop"):
+            aggregate_cross_entropy_loss = 0
+            for _ in range(self.num_samples):
+
+                # Compute noise for sampling.
+                epsilon = self.noise.rsample().to(device=device)
+
+                # Compute noisy topic proportions given Gaussian parameters.
+                theta = mu + torch.exp(log_sigma) * epsilon
+                if document_index is not None:
+                    # Every chunk shares its review's sample.
+                    theta = theta[document_index]
+
+                # II. Compute cross entropy against next words for the current sample of noise.
+                if chunking:
+                    cross_entropy_loss = self._chunked_topic_cross_entropy(encoded_input, theta, topic_gate,
+                                                                           relevant_output, relevant_output_mask)
+                elif checkpointing:
+                    cross_entropy_loss = checkpoint(self._projected_topic_cross_entropy,
+                                                    encoded_input, theta, topic_gate,
+                                                    relevant_output, relevant_output_mask)
+                else:
+                    cross_entropy_loss = self._topic_cross_entropy(logits, theta, topic_gate,
+                                                                   relevant_output, relevant_output_mask)
+                aggregate_cross_entropy_loss += cross_entropy_loss
+
+            averaged_cross_entropy_loss = aggregate_cross_entropy_loss / self.num_samples
 
         # III. Compute stopword probabilities and gear RNN hidden states toward learning them. 
-        relevant_stopword_output = self._compute_stopword_mask(output_tokens).contiguous().to(device=device)
-        stopword_loss = util.sequence_cross_entropy_with_logits(stopword_logits,
+        with profiler.stage("stopword_mask"):
+            relevant_stopword_output = self._compute_stopword_mask(output_tokens).contiguous().to(device=device)
+        stopword_loss = util.sequence_cross_entropy_with_logits(stopword_logits.float(),
                                                                 relevant_stopword_output,
                                                                 relevant_output_mask)
 
         if self.classification_mode:
-            output_dict['loss'] = self._classify_sentiment(frequency_tokens, mapped_term_frequencies, sentiment)
+            if document_index is not None:
+                mapped_term_frequencies = mapped_term_frequencies[document_index]
+            with profiler.stage("sentiment_classifier"):
+                output_dict['loss'] = self._classify_sentiment(frequency_tokens, mapped_term_frequencies,
+                                                               sentiment)
         else:
             output_dict['loss'] = -kl_divergence + averaged_cross_entropy_loss + stopword_loss
+            # Exposed separately since, unlike the cross entropies, it is summed over the batch.
+            output_dict['negative_kl_divergence'] = -kl_divergence
 
         self.metrics['negative_kl_divergence']((-kl_divergence).item())
         self.metrics['cross_entropy'](averaged_cross_entropy_loss.item())
@@ -322,6 +457,118 @@ class TopicRNN(Model):
 
         return output_dict
 
+    def _topic_cross_entropy(self,
+                             logits: torch.Tensor,
+                             theta: torch.Tensor,
+                             topic_gate: torch.Tensor,
+                             targets: torch.LongTensor,
+                             mask: torch.Tensor) -> torch.Tensor:
+        """
+        Cross entropy of ``targets`` under the vocabulary projection ``logits`` plus the topic
+        additions ``beta^T theta`` of a single sample of ``theta``, gated by ``topic_gate``.
+        """
+        # Stop words have no contribution via topics.
+        topic_additions = topic_gate * self._topic_additions(theta).unsqueeze(1)
+        return util.sequence_cross_entropy_with_logits(logits.float() + topic_additions, targets, mask)
+
+    def _topic_additions(self, theta: torch.Tensor) -> torch.Tensor:
+        """ ``beta^T theta`` of shape ``(batch, vocabulary size)``. """
+        # Padding and OOV tokens are indexed at 0 and 1.
+        topic_additions = torch.mm(theta, self.beta).float()
+        topic_additions.t()[0] = 0  # Padding will be treated as stops.
+        topic_additions.t()[1] = 0  # Unknowns will be treated as stops.
+        return topic_additions
+
+    def _chunked_topic_cross_entropy(self,
+                                     encoded_input: torch.Tensor,
+                                     theta: torch.Tensor,
+                                     topic_gate: torch.Tensor,
+                                     targets: torch.LongTensor,
+                                     mask: torch.Tensor) -> torch.Tensor:
+        """
+        ``_projected_topic_cross_entropy`` computed ``loss_chunk_size`` time steps at a time.
+
+        The per-sequence sums of negative log likelihoods are accumulated across chunks and
+        normalized exactly as ``util.sequence_cross_entropy_with_logits`` does, so the result is
+        the same as without chunking. While training, each chunk is checkpointed so that no
+        chunk's ``(batch, chunk, vocabulary size)`` activations outlive it.
+        """
+        topic_additions = self._topic_additions(theta)
+        mask = mask.float()
+        negative_log_likelihood = 0
+        for start in range(0, encoded_input.size(1), self.loss_chunk_size):
+            end = start + self.loss_chunk_size
+            chunk = (encoded_input[:, start:end], topic_additions, topic_gate[:, start:end],
+                     targets[:, start:end], mask[:, start:end])
+            if self.training:
+                negative_log_likelihood = negative_log_likelihood + checkpoint(self._chunk_negative_log_likelihood,
+                                                                               *chunk)
+            else:
+                negative_log_likelihood = negative_log_likelihood + self._chunk_negative_log_likelihood(*chunk)
+
+        per_batch_loss = negative_log_likelihood / (mask.sum(1) + 1e-13)
+        num_non_empty_sequences = ((mask.sum(1) > 0).float().sum() + 1e-13)
+        return per_batch_loss.sum() / num_non_empty_sequences
+
+    def _chunk_negative_log_likelihood(self,
+                                       encoded_input: torch.Tensor,
+                                       topic_additions: torch.Tensor,
+                                       topic_gate: torch.Tensor,
+                                       targets: torch.LongTensor,
+                                       mask: torch.Tensor) -> torch.Tensor:
+        """ Masked negative log likelihood of ``targets`` summed over time, shape ``(batch,)``. """
+        logits = self.vocabulary_projection_layer(encoded_input).float()
+        logits = logits + topic_gate * topic_additions.unsqueeze(1)
+        log_probs = torch.nn.functional.log_softmax(logits, dim=-1)
+        negative_log_likelihood = -log_probs.gather(-1, targets.unsqueeze(-1)).squeeze(-1)
+        return (negative_log_likelihood * mask).sum(1)
+
+    def _projected_topic_cross_entropy(self,
+                                       encoded_input: torch.Tensor,
+                                       theta: torch.Tensor,
+                                       topic_gate: torch.Tensor,
+                                       targets: torch.LongTensor,
+                                       mask: torch.Tensor) -> torch.Tensor:
+        """ ``_topic_cross_entropy`` including the vocabulary projection, for checkpointing. """
+        logits = self.vocabulary_projection_layer(encoded_input)
+        return self._topic_cross_entropy(logits, theta, topic_gate, targets, mask)
+
+    def compute_variational_parameters(self, frequency_tokens: Dict[str, torch.LongTensor]
+                                      ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        Runs only the inference network over the given tokens.
+
+        Returns
+        -------
+        A tuple of ``(mapped_term_frequencies, mu, log_sigma)`` where ``mapped_term_frequencies``
+        has shape ``(batch, 500, topic_dim)`` and both ``mu`` and ``log_sigma`` have shape
+        ``(batch, topic_dim)``.
+        """
+        device = self.beta.device
+        # The sparse path reads the weight of the first layer, which quantized layers (see
+        # ``library.inference.quantization``) only expose packed; those take the dense path.
+        sparse = self.sparse_term_frequencies and isinstance(
+                self.variational_autoencoder._linear_layers[0], Linear)  # pylint: disable=protected-access
+        with self.profiler.stage("word_frequency_vector"):
+            if sparse:
+                term_counts = self._compute_sparse_term_counts(frequency_tokens['tokens'].to(device=device))
+            else:
+                stopless_word_frequencies = self._compute_word_frequency_vector(frequency_tokens).to(device=device)
+
+        with self.profiler.stage("inference_network"):
+            if sparse:
+                mapped_term_frequencies = self._sparse_inference_network(*term_counts)
+            else:
+                mapped_term_frequencies = self.variational_autoencoder(stopless_word_frequencies)
+
+            # Reshape to (E, K)
+            mapped_term_frequencies = mapped_term_frequencies.view(mapped_term_frequencies.size(0), 500, -1)
+
+            mu = torch.matmul(self.w_mu, mapped_term_frequencies) + self.a_mu
+            log_sigma = torch.matmul(self.w_sigma, mapped_term_frequencies) + self.a_sigma
+
+        return mapped_term_frequencies, mu, log_sigma
+
     def _classify_sentiment(self,  # type: ignore
                             frequency_tokens: Dict[str, torch.LongTensor],
                             mapped_term_frequencies: torch.Tensor,
@@ -345,48 +592,133 @@ class TopicRNN(Model):
         sentiment_features = torch.cat([encoded_input, mapped_term_frequencies.view(batch, -1)], dim=-1)
 
         # Classify.
-        logits = self.sentiment_classifier(sentiment_features)
+        logits = self.sentiment_classifier(sentiment_features).float()
         loss = self.sentiment_criterion(logits, sentiment)
 
         self.metrics['sentiment'](logits, sentiment)
 
         return loss
 
-    def _compute_word_frequency_vector(self, frequency_tokens: Dict[str, torch.LongTensor]) -> Dict[str, torch.Tensor]:
+    def _compute_word_frequency_vector(self, frequency_tokens: Dict[str, torch.LongTensor]) -> torch.Tensor:
         """ Given the window in which we're allowed to collect word frequencies, produce a
             vector in the 'stopless' dimension for the variational distribution.
         """
-        batch_size = frequency_tokens['tokens'].size(0)
-        res = torch.zeros(batch_size, self.vocab.get_vocab_size("stopless"))
-        for i, row in enumerate(frequency_tokens['tokens']):
-            # A conversion between namespaces (full vocab to stopless) is necessary.
-            words = [self.vocab.get_token_from_index(index) for index in row.tolist()]
-            word_counts = dict(Counter(words))
-
-            # TODO: Make this faster.
-            for word, count in word_counts.items():
-                if word in self.tokens_to_index:
-                    index = self.vocab.get_token_index(word, "stopless")
-
-                    # Exclude padding token from influencing inference.
-                    res[i][index] = count * int(index > 0)
-
+        token_ids = frequency_tokens['tokens']
+        # A conversion between namespaces (full vocab to stopless) is necessary; stop words and
+        # padding map to 0.
+        stopless_ids = self._vocabulary_tensor("full_to_stopless", token_ids.device)[token_ids]
+        res = torch.zeros(token_ids.size(0), self.vocab.get_vocab_size(STOPLESS_NAMESPACE),
+                          device=token_ids.device)
+        res.scatter_add_(1, stopless_ids, torch.ones(stopless_ids.size(), device=token_ids.device))
+
+        # Exclude padding and stop words from influencing inference.
+        res[:, 0] = 0
         return res
 
-    def _compute_stopword_mask(self, output_tokens: Dict[str, torch.LongTensor]) -> Dict[str, torch.Tensor]:
+    def _compute_sparse_term_counts(self, token_ids: torch.LongTensor
+                                   ) -> Tuple[torch.LongTensor, torch.Tensor, torch.LongTensor]:
+        """
+        The stopless term counts of every row of ``token_ids`` as the ``(indices, counts,
+        offsets)`` expected by ``library.modules.sparse.sparse_term_linear``. As in
+        ``_compute_word_frequency_vector``, padding and stop words are left out.
+        """
+        batch_size = token_ids.size(0)
+        stopless_dim = self.vocab.get_vocab_size(STOPLESS_NAMESPACE)
+        stopless_ids = self._vocabulary_tensor("full_to_stopless", token_ids.device)[token_ids]
+
+        # Count (row, term) pairs at once by flattening them into a single key; ``unique``
+        # sorts the keys, so the entries of each row come out contiguous and in row order.
+        keys = torch.arange(batch_size, device=token_ids.device).unsqueeze(1) * stopless_dim + stopless_ids
+        keys = keys[stopless_ids != 0]
+        keys, counts = torch.unique(keys, return_counts=True)
+        rows = keys // stopless_dim
+        offsets = torch.zeros(batch_size + 1, dtype=torch.long, device=token_ids.device)
+        offsets[1:] = torch.cumsum(torch.bincount(rows, minlength=batch_size), dim=0)
+        return keys % stopless_dim, counts.float(), offsets
+
+    def _sparse_inference_network(self,
+                                  indices: torch.LongTensor,
+                                  counts: torch.Tensor,
+                                  offsets: torch.LongTensor) -> torch.Tensor:
+        """ ``variational_autoencoder`` applied to sparse term counts. """
+        # pylint: disable=protected-access
+        feedforward = self.variational_autoencoder
+        layers = zip(feedforward._linear_layers, feedforward._activations, feedforward._dropout)
+        output = None
+        for i, (layer, activation, dropout) in enumerate(layers):
+            if i == 0:
+                output = sparse_term_linear(indices, counts, offsets, layer.weight, layer.bias)
+            else:
+                output = layer(output)
+            output = dropout(activation(output))
+        return output
+
+    def _compute_stopword_mask(self, output_tokens: Dict[str, torch.LongTensor]) -> torch.Tensor:
         """ Given a set of output tokens, compute a mask where 1 indicates stopword presence and 0
             indicates stopword absence.
         """
-        res = torch.zeros_like(output_tokens['tokens'])
-        for i, row in enumerate(output_tokens['tokens']):
-            words = [self.vocab.get_token_from_index(index) for index in row.tolist()]
-            res[i] = torch.LongTensor([int(word in STOP_WORDS) for word in words])
+        token_ids = output_tokens['tokens']
+        return self._vocabulary_tensor("is_stop", token_ids.device)[token_ids].long()
+
+    def _vocabulary_tensor(self, name: str, device: torch.device) -> torch.Tensor:
+        """ One of the ``vocabulary_tensors``, moved to ``device`` on first use there. """
+        tensor = getattr(self.vocabulary_tensors, name)
+        if tensor.device != device:
+            tensor = tensor.to(device)
+            self.vocabulary_tensors = self.vocabulary_tensors._replace(**{name: tensor})
+        return tensor
+
+    def _frozen_state(self) -> Dict[str, torch.Tensor]:
+        """ The entries of the full state dict that are not trainable parameters. """
+        trainable = {name for name, parameter in self.named_parameters() if parameter.requires_grad}
+        state = super(TopicRNN, self).state_dict(keep_vars=True)
+        return {name: tensor for name, tensor in state.items() if name not in trainable}
+
+    def _frozen_weights_sha256(self) -> str:
+        # Hashes every tensor once, under its first name: models built from ``pretrained_file``
+        # also hold the encoder's weights under ``text_to_vec``.
+        frozen = {name: parameter for name, parameter in self.named_parameters() if not parameter.requires_grad}
+        frozen.update(self.named_buffers())
+        return weights_sha256(frozen)
 
-        return res
+    @overrides
+    def state_dict(self, destination=None, prefix='', keep_vars=False):
+        state = super(TopicRNN, self).state_dict(destination=destination, prefix=prefix, keep_vars=keep_vars)
+        if self._base_archive is None:
+            return state
+        for name in self._frozen_state():
+            del state[prefix + name]
+        state[prefix + BASE_ARCHIVE_KEY] = dict(self._base_archive)
+        return state
+
+    @overrides
+    def load_state_dict(self, state_dict, strict=True, **kwargs):
+        if BASE_ARCHIVE_KEY not in state_dict:
+            return super(TopicRNN, self).load_state_dict(state_dict, strict, **kwargs)
+
+        state_dict = dict(state_dict)
+        base_archive = state_dict.pop(BASE_ARCHIVE_KEY)
+        if self._frozen_weights_sha256() != base_archive["sha256"]:
+            # Built without ``pretrained_file`` (e.g. by ``load_model``); the pretrained model's
+            # names carry over.
+            frozen_names = set(self._frozen_state())
+            base_weights = load_base_weights(base_archive)
+            super(TopicRNN, self).load_state_dict(
+                    {name: tensor for name, tensor in base_weights.items() if name in frozen_names}, strict=False)
+            if self._frozen_weights_sha256() != base_archive["sha256"]:
+                raise ConfigurationError("The frozen weights of {} do not match those the delta weights were "
+                                         "trained on.".format(base_archive["archive"]))
+        full_state = self._frozen_state()
+        full_state.update(state_dict)
+        result = super(TopicRNN, self).load_state_dict(full_state, strict, **kwargs)
+        self._base_archive = base_archive
+        return result
 
     @overrides
     def get_metrics(self, reset: bool = False) -> Dict[str, float]:
-        return {metric_name: metric.get_metric(reset) for metric_name, metric in self.metrics.items()}
+        metrics = {metric_name: metric.get_metric(reset) for metric_name, metric in self.metrics.items()}
+        metrics.update(self.profiler.get_metrics(reset))
+        return metrics
 
     @overrides
     def decode(self, output_dict: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
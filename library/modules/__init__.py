@@ -0,0 +1 @@
+from library.modules import sparse
@@ -0,0 +1,216 @@
+"""
+Pretrained word embeddings (GloVe, word2vec text format) read through a cache: the text file is
+converted once into a memory-mappable ``float32`` matrix with a word index, and the rows of each
+vocabulary are stored on their own, so that later runs neither parse the file nor scan all of
+its words.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+from typing import IO, List, Tuple
+
+import numpy
+import torch
+from allennlp.common import Params
+from allennlp.common.checks import ConfigurationError
+from allennlp.common.file_utils import cached_path
+from allennlp.data.vocabulary import Vocabulary
+from allennlp.modules.token_embedders import Embedding, TokenEmbedder
+from allennlp.modules.token_embedders.embedding import _read_pretrained_embedding_file
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+DEFAULT_CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".allennlp", "embeddings")
+
+# Bump whenever the contents or layout of the cache change.
+CACHE_VERSION = 1
+METADATA_FILE = "metadata.json"
+VECTORS_FILE = "vectors.f32"
+WORDS_FILE = "words.txt"
+_ROWS_PER_WRITE = 10000
+
+
+def convert_embeddings(embeddings_file: str, embedding_dim: int, cache_directory: str = None) -> str:
+    """
+    Converts a (gzipped) text file of ``word value value ...`` lines into a directory under
+    ``cache_directory`` holding every vector as a row of a raw ``float32`` matrix, the words in
+    row order and a metadata file, and returns that directory.
+
+    The directory is named after the file's path, size and modification time, so an edited or
+    replaced file is converted again and an unchanged one only once. As in AllenNLP, lines that
+    do not have ``embedding_dim`` values (e.g. the header of a word2vec file) are skipped.
+    """
+    embeddings_file = cached_path(embeddings_file)
+    directory = os.path.join(cache_directory or DEFAULT_CACHE_DIRECTORY,
+                             _cache_key(embeddings_file, embedding_dim))
+    if os.path.exists(os.path.join(directory, METADATA_FILE)):
+        return directory
+
+    logger.info("Converting %s into %s", embeddings_file, directory)
+    os.makedirs(directory, exist_ok=True)
+    # Writes under names of its own and renames, so that concurrent runs never see a partial copy.
+    suffix = ".{}.tmp".format(os.getpid())
+    words: List[str] = []
+    values: List[str] = []
+    num_skipped = 0
+    open_file = gzip.open if embeddings_file.endswith(".gz") else open
+    with open_file(embeddings_file, 'rb') as embeddings_in, \
+            open(os.path.join(directory, VECTORS_FILE + suffix), 'wb') as vectors_out:
+        for line in embeddings_in:
+            word, _, vector = line.decode('utf-8').strip().partition(' ')
+            if not vector or vector.count(' ') + 1 != embedding_dim:
+                num_skipped += 1
+                continue
+            words.append(word)
+            values.append(vector)
+            if len(values) == _ROWS_PER_WRITE:
+                _write_vectors(values, vectors_out)
+        _write_vectors(values, vectors_out)
+    if not words:
+        os.remove(os.path.join(directory, VECTORS_FILE + suffix))
+        raise ConfigurationError("No embeddings of dimension {} found in {}.".format(embedding_dim,
+                                                                                   embeddings_file))
+    if num_skipped:
+        logger.warning("Skipped %d lines of %s without %d values", num_skipped, embeddings_file, embedding_dim)
+
+    with open(os.path.join(directory, WORDS_FILE + suffix), 'wb') as words_out:
+        words_out.write("\n".join(words).encode('utf-8'))
+    with open(os.path.join(directory, METADATA_FILE + suffix), 'w') as metadata_out:
+        json.dump({"version": CACHE_VERSION,
+                   "source": embeddings_file,
+                   "num_words": len(words),
+                   "embedding_dim": embedding_dim}, metadata_out, indent=2)
+    # The metadata file goes last: its presence marks a complete conversion.
+    for name in (VECTORS_FILE, WORDS_FILE, METADATA_FILE):
+        os.replace(os.path.join(directory, name + suffix), os.path.join(directory, name))
+    return directory
+
+
+def read_embeddings(embeddings_file: str,
+                    embedding_dim: int,
+                    vocab: Vocabulary,
+                    namespace: str = "tokens",
+                    cache_directory: str = None) -> torch.FloatTensor:
+    """
+    The embedding matrix of ``namespace``, as AllenNLP's ``_read_pretrained_embedding_file``
+    builds it: the pretrained vector of every word in the file and, for the others, a sample
+    from a normal distribution with the mean and standard deviation of those vectors.
+
+    The rows of the vocabulary are looked up in the converted file (``convert_embeddings``)
+    and stored next to it under a hash of the namespace's tokens, so a run with the same
+    vocabulary loads them from there. HDF5 files are handed to AllenNLP as they are.
+
+    Parameters
+    ----------
+    embeddings_file : ``str``, required
+        A GloVe or word2vec text file, optionally gzipped, or a URL to one.
+    embedding_dim : ``int``, required
+        The dimension of the vectors.
+    vocab : ``Vocabulary``, required
+        The vocabulary whose rows to read.
+    namespace : ``str``, optional (default="tokens")
+        The namespace of ``vocab`` the rows are indexed by.
+    cache_directory : ``str``, optional
+        Where converted files are kept, ``~/.allennlp/embeddings`` by default.
+    """
+    if embeddings_file.endswith(".h5"):
+        return _read_pretrained_embedding_file(embeddings_file, embedding_dim, vocab, namespace)
+
+    directory = convert_embeddings(embeddings_file, embedding_dim, cache_directory)
+    index_to_token = vocab.get_index_to_token_vocabulary(namespace)
+    tokens = [index_to_token[index] for index in range(len(index_to_token))]
+    restricted_file = os.path.join(directory, "vocabulary-{}.npz".format(
+            hashlib.sha1("\n".join(tokens).encode('utf-8')).hexdigest()))
+    if os.path.exists(restricted_file):
+        with numpy.load(restricted_file) as restricted:
+            indices, vectors = restricted["indices"], restricted["vectors"]
+    else:
+        indices, vectors = _restrict(directory, tokens)
+        temporary_file = "{}.{}.tmp".format(restricted_file, os.getpid())
+        with open(temporary_file, 'wb') as restricted_out:
+            numpy.savez(restricted_out, indices=indices, vectors=vectors)
+        os.replace(temporary_file, restricted_file)
+    if not len(indices):  # pylint: disable=len-as-condition
+        raise ConfigurationError("None of the {} tokens of namespace \"{}\" are in {}.".format(
+                len(tokens), namespace, embeddings_file))
+    logger.info("Found %d of %d tokens of \"%s\" in %s", len(indices), len(tokens), namespace, embeddings_file)
+
+    embedding_matrix = torch.FloatTensor(len(tokens), embedding_dim).normal_(float(numpy.mean(vectors)),
+                                                                             float(numpy.std(vectors)))
+    embedding_matrix[torch.from_numpy(indices)] = torch.from_numpy(vectors)
+    return embedding_matrix
+
+
+def _write_vectors(values: List[str], vectors_out: IO[bytes]) -> None:
+    """ Parses and writes the space-separated vectors in ``values`` as ``float32`` rows, emptying it. """
+    # One parse for many rows is much faster than one per row. Parsing as double first rounds
+    # each value exactly as ``numpy.asarray(fields, dtype='float32')`` in AllenNLP does.
+    if values:
+        vectors = numpy.loadtxt(values, dtype=numpy.float64, delimiter=' ', comments=None, ndmin=2)
+        vectors_out.write(vectors.astype(numpy.float32).tobytes())
+    del values[:]
+
+
+def _restrict(directory: str, tokens: List[str]) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """ The vocabulary indices of ``tokens`` found in a converted file, and their vectors. """
+    with open(os.path.join(directory, METADATA_FILE), 'r') as metadata_in:
+        metadata = json.load(metadata_in)
+    with open(os.path.join(directory, WORDS_FILE), 'rb') as words_in:
+        # A word listed more than once keeps its last vector, as in AllenNLP.
+        word_to_row = {word: row for row, word in enumerate(words_in.read().decode('utf-8').split("\n"))}
+    matrix = numpy.memmap(os.path.join(directory, VECTORS_FILE), dtype=numpy.float32, mode='r',
+                          shape=(metadata["num_words"], metadata["embedding_dim"]))
+    found = [(index, word_to_row[token]) for index, token in enumerate(tokens) if token in word_to_row]
+    indices = numpy.array([index for index, _ in found], dtype=numpy.int64)
+    vectors = numpy.array(matrix[[row for _, row in found]], dtype=numpy.float32)
+    return indices, vectors.reshape(len(found), metadata["embedding_dim"])
+
+
+def _cache_key(embeddings_file: str, embedding_dim: int) -> str:
+    """ Identifies ``embeddings_file`` (by path, size and modification time) read at ``embedding_dim``. """
+    stat = os.stat(embeddings_file)
+    key = json.dumps([CACHE_VERSION, os.path.abspath(embeddings_file), stat.st_size, stat.st_mtime, embedding_dim])
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+@TokenEmbedder.register("cached_embedding")
+class CachedEmbedding(Embedding):
+    """
+    An ``Embedding`` whose ``pretrained_file`` is read with ``read_embeddings``. It takes the
+    parameters of the ``"embedding"`` type and ``cache_directory``, and, given the same random
+    seed, starts from the same weights.
+    """
+    @classmethod
+    def from_params(cls, vocab: Vocabulary, params: Params) -> 'CachedEmbedding':  # type: ignore
+        # pylint: disable=arguments-differ
+        num_embeddings = params.pop_int('num_embeddings', None)
+        vocab_namespace = params.pop("vocab_namespace", "tokens")
+        if num_embeddings is None:
+            num_embeddings = vocab.get_vocab_size(vocab_namespace)
+        embedding_dim = params.pop_int('embedding_dim')
+        pretrained_file = params.pop("pretrained_file", None)
+        cache_directory = params.pop("cache_directory", None)
+        projection_dim = params.pop_int("projection_dim", None)
+        trainable = params.pop_bool("trainable", True)
+        padding_index = params.pop_int('padding_index', None)
+        max_norm = params.pop_float('max_norm', None)
+        norm_type = params.pop_float('norm_type', 2.)
+        scale_grad_by_freq = params.pop_bool('scale_grad_by_freq', False)
+        sparse = params.pop_bool('sparse', False)
+        params.assert_empty(cls.__name__)
+
+        weight = None
+        if pretrained_file:
+            weight = read_embeddings(pretrained_file, embedding_dim, vocab, vocab_namespace, cache_directory)
+        return cls(num_embeddings=num_embeddings,
+                   embedding_dim=embedding_dim,
+                   projection_dim=projection_dim,
+                   weight=weight,
+                   padding_index=padding_index,
+                   trainable=trainable,
+                   max_norm=max_norm,
+                   norm_type=norm_type,
+                   scale_grad_by_freq=scale_grad_by_freq,
+                   sparse=sparse)
@@ -0,0 +1,42 @@
+from typing import Optional
+
+import torch
+
+
+def sparse_term_linear(indices: torch.LongTensor,
+                       counts: torch.Tensor,
+                       offsets: torch.LongTensor,
+                       weight: torch.Tensor,
+                       bias: Optional[torch.Tensor] = None) -> torch.Tensor:
+    """
+    Computes ``x W^T + b`` for a batch of term-count vectors ``x`` given in compressed sparse row
+    form, without ever materializing the dense ``(batch, vocab)`` input.
+
+    Parameters
+    ----------
+    indices : ``torch.LongTensor``, required
+        The column (term) index of every non-zero count, for all documents concatenated.
+    counts : ``torch.Tensor``, required
+        The count for every entry of ``indices``.
+    offsets : ``torch.LongTensor``, required
+        A tensor of shape ``(batch + 1,)``; the entries of document ``i`` are
+        ``indices[offsets[i]:offsets[i + 1]]``.
+    weight : ``torch.Tensor``, required
+        The ``(output_dim, vocab)`` weight of the linear layer.
+    bias : ``torch.Tensor``, optional
+        The ``(output_dim,)`` bias of the linear layer.
+
+    Returns
+    -------
+    A tensor of shape ``(batch, output_dim)``.
+    """
+    batch_size = offsets.size(0) - 1
+    rows = torch.repeat_interleave(torch.arange(batch_size, device=indices.device),
+                                   offsets[1:] - offsets[:-1])
+    sparse_input = torch.sparse_coo_tensor(torch.stack([rows, indices]),
+                                           counts.to(dtype=weight.dtype),
+                                           (batch_size, weight.size(1)))
+    output = torch.sparse.mm(sparse_input, weight.t())
+    if bias is not None:
+        output = output + bias
+    return output
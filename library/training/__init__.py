@@ -0,0 +1 @@
+from library.training import distributed, optimizers, resumable
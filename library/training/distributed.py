@@ -0,0 +1,253 @@
+import json
+import logging
+import os
+import random
+import time
+from typing import Iterable, List
+
+import torch
+import torch.distributed as dist
+from allennlp.common import Params
+from allennlp.data import DataIterator, DatasetReader
+from allennlp.data.instance import Instance
+from allennlp.data.vocabulary import Vocabulary
+from allennlp.models.archival import archive_model
+from allennlp.models.model import Model
+from allennlp.training.optimizers import Optimizer
+from torch._utils import _flatten_dense_tensors, _unflatten_dense_tensors
+
+from library.dataset_readers.shuffling import read_lines, shards
+from library.vocabulary.builder import CorpusCounts, build_vocabulary, count_corpus
+from library.vocabulary.preparation import add_stopless_namespace
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class GradientAllReducer:
+    """
+    Averages gradients across the ranks of a ``torch.distributed`` process group.
+
+    Parameters are grouped into buckets of at most ``bucket_size_mb`` that are all-reduced
+    asynchronously, so that communication of one bucket overlaps with the others. Tensors larger
+    than a bucket (``beta`` and the ``500 * topic_dim`` output layer of the inference network
+    for realistic sizes) are all-reduced in place, in their own buckets and first, so they are
+    never copied into a flat buffer and the largest transfers start earliest.
+
+    Parameters whose gradient is ``None`` on a rank (e.g. the sentiment classifier during
+    unsupervised training) are all-reduced as zeros, which keeps every rank issuing the same
+    collectives in the same order.
+    Sparse gradients (from ``"sparse": true`` embeddings) are densified first.
+    """
+    def __init__(self, parameters: Iterable[torch.nn.Parameter], bucket_size_mb: float = 25) -> None:
+        capacity = int(bucket_size_mb * 1024 * 1024)
+        parameters = sorted((p for p in parameters if p.requires_grad), key=lambda p: -p.numel())
+        self._buckets: List[List[torch.nn.Parameter]] = []
+        current: List[torch.nn.Parameter] = []
+        current_size = 0
+        for parameter in parameters:
+            size = parameter.numel() * parameter.element_size()
+            if current and current_size + size > capacity:
+                self._buckets.append(current)
+                current, current_size = [], 0
+            current.append(parameter)
+            current_size += size
+        if current:
+            self._buckets.append(current)
+
+    def all_reduce(self) -> None:
+        world_size = dist.get_world_size()
+        pending = []
+        for bucket in self._buckets:
+            for parameter in bucket:
+                if parameter.grad is None:
+                    parameter.grad = torch.zeros_like(parameter)
+                elif parameter.grad.is_sparse:
+                    # Sparse embedding gradients differ in their rows across ranks.
+                    parameter.grad = parameter.grad.to_dense()
+            if len(bucket) == 1:
+                flat = bucket[0].grad
+            else:
+                flat = _flatten_dense_tensors([parameter.grad for parameter in bucket])
+            pending.append((dist.all_reduce(flat, async_op=True), bucket, flat))
+
+        for handle, bucket, flat in pending:
+            handle.wait()
+            flat.div_(world_size)
+            if len(bucket) > 1:
+                grads = [parameter.grad for parameter in bucket]
+                for grad, reduced in zip(grads, _unflatten_dense_tensors(flat, grads)):
+                    grad.copy_(reduced)
+
+
+def broadcast_parameters(model: torch.nn.Module) -> None:
+    """ Makes every rank start from rank 0's weights. """
+    for tensor in list(model.parameters()) + list(model.buffers()):
+        dist.broadcast(tensor.data, 0)
+
+
+def read_shard(dataset_reader: DatasetReader,
+               file_path: str,
+               rank: int,
+               world_size: int) -> List[List[Instance]]:
+    """
+    The instances of every review in rank ``rank``'s part of ``file_path`` (a file or glob
+    pattern, see ``library.dataset_readers.shuffling.shards``): every file is split into
+    ``world_size`` line-aligned byte ranges, and each rank reads and tokenizes only its own
+    range of each.
+    """
+    return [list(dataset_reader._read_line(line))  # pylint: disable=protected-access
+            for path, start, end in shards(file_path, world_size)[rank::world_size]
+            for _, _, line in read_lines(path, start, end)]
+
+
+def train_worker(rank: int,
+                 world_size: int,
+                 config_file: str,
+                 serialization_dir: str,
+                 port: int = 29500,
+                 threads_per_process: int = 1,
+                 seed: int = 1337) -> None:
+    """
+    Trains the experiment in ``config_file`` as one rank of a local data-parallel ``gloo`` group.
+    Meant to be launched by ``torch.multiprocessing.spawn``; see ``scripts/train_distributed.py``.
+
+    Each rank reads only its own part of the training data (``read_shard``). Every epoch, it
+    shuffles its reviews, keeping the chunks of each review together, and truncates its part
+    to the number of instances of the smallest part.
+
+    Before every step, the ranks agree on whether all of them still have a batch, and the epoch
+    ends for all of them as soon as one runs out. Iterators whose number of batches depends on
+    the instances (e.g. ``"document"``) therefore cannot leave a rank waiting in a collective.
+    Each rank uses ``batch_size // world_size`` from the iterator config so that the global
+    batch matches a single-process run.
+
+    Unless the config loads the vocabulary from a ``directory_path``, rank 0 builds it from the
+    token counts of the training data (``library.vocabulary.builder``) rather than from every
+    rank's instances.
+
+    ``TopicRNN``'s KL term is summed over the batch while its cross entropies are averaged, so
+    each rank scales its share of the KL term by ``world_size`` before the gradients are
+    averaged. Averaged gradients then equal those of the single-process loss on the global batch.
+
+    Rank 0 writes ``loss_curve.json`` (the global loss per step), ``metrics.json`` (throughput)
+    and a ``model.tar.gz`` to ``serialization_dir``.
+    """
+    dist.init_process_group("gloo", init_method="tcp://127.0.0.1:{}".format(port),
+                            rank=rank, world_size=world_size)
+    torch.set_num_threads(threads_per_process)
+
+    params = Params.from_file(config_file)
+    config = params.as_dict(quiet=True)
+    dataset_reader = DatasetReader.from_params(params.pop("dataset_reader"))
+    train_data_path = params.pop("train_data_path")
+    reviews = read_shard(dataset_reader, train_data_path, rank, world_size)
+    params.pop("validation_data_path", None)
+
+    # Rank 0 builds the vocabulary (with its stopless namespace); the others load it so that
+    # every rank indexes identically.
+    vocabulary_dir = os.path.join(serialization_dir, "vocabulary")
+    vocab_params = params.pop("vocabulary", {})
+    model_params = params.pop("model")
+    torch.manual_seed(seed)
+    if rank == 0:
+        os.makedirs(serialization_dir, exist_ok=True)
+        if "directory_path" in vocab_params:
+            vocab = add_stopless_namespace(Vocabulary.from_params(vocab_params))
+        else:
+            vocab = add_stopless_namespace(_build_vocabulary(train_data_path, config))
+        model = Model.from_params(vocab=vocab, params=model_params)
+        vocab.save_to_files(vocabulary_dir)
+        with open(os.path.join(serialization_dir, "config.json"), 'w') as config_out:
+            json.dump(config, config_out, indent=4)
+        dist.barrier()
+    else:
+        dist.barrier()
+        vocab = Vocabulary.from_files(vocabulary_dir)
+        model = Model.from_params(vocab=vocab, params=model_params)
+    broadcast_parameters(model)
+
+    # Ranks share weights but draw different topic noise.
+    torch.manual_seed(seed + rank)
+
+    iterator_params = params.pop("iterator")
+    iterator_params["batch_size"] = max(1, iterator_params.get("batch_size", 32) // world_size)
+    iterator = DataIterator.from_params(iterator_params)
+    iterator.index_with(vocab)
+
+    trainer_params = params.pop("trainer")
+    num_epochs = trainer_params.pop_int("num_epochs", 20)
+    grad_clipping = trainer_params.pop_float("grad_clipping", None)
+    parameters = [[name, parameter] for name, parameter in model.named_parameters() if parameter.requires_grad]
+    optimizer = Optimizer.from_params(parameters, trainer_params.pop("optimizer"))
+    reducer = GradientAllReducer(model.parameters())
+
+    shard_size = torch.LongTensor([sum(len(review) for review in reviews)])
+    dist.all_reduce(shard_size, op=dist.ReduceOp.MIN)
+    shard_size = int(shard_size.item())
+    loss_curve = []
+    epoch_stats = []
+    for epoch in range(num_epochs):
+        random.Random(seed + epoch * world_size + rank).shuffle(reviews)
+        shard = [instance for review in reviews for instance in review][:shard_size]
+
+        model.train()
+        start = time.perf_counter()
+        num_steps = 0
+        batches = iterator(shard, num_epochs=1, shuffle=False)
+        while True:
+            batch = next(batches, None)
+            all_have_batches = torch.Tensor([batch is not None])
+            dist.all_reduce(all_have_batches, op=dist.ReduceOp.MIN)
+            if not all_have_batches.item():
+                break
+
+            optimizer.zero_grad()
+            output_dict = model(**batch)
+            loss = output_dict['loss']
+            if 'negative_kl_divergence' in output_dict:
+                loss = loss + (world_size - 1) * output_dict['negative_kl_divergence']
+            loss.backward()
+            reducer.all_reduce()
+            if grad_clipping is not None:
+                torch.nn.utils.clip_grad_value_(model.parameters(), grad_clipping)
+            optimizer.step()
+
+            global_loss = torch.Tensor([loss.item()])
+            dist.all_reduce(global_loss)
+            loss_curve.append(global_loss.item() / world_size)
+            num_steps += 1
+        elapsed = time.perf_counter() - start
+
+        epoch_stats.append({
+                "epoch": epoch,
+                "seconds": elapsed,
+                "steps": num_steps,
+                "instances_per_second": shard_size * world_size / elapsed,
+        })
+        if rank == 0:
+            logger.info("Epoch %d: %d steps in %.2fs, loss %.4f", epoch, num_steps, elapsed, loss_curve[-1])
+
+    if rank == 0:
+        with open(os.path.join(serialization_dir, "loss_curve.json"), 'w') as curve_file:
+            json.dump(loss_curve, curve_file)
+        with open(os.path.join(serialization_dir, "metrics.json"), 'w') as metrics_file:
+            json.dump({"world_size": world_size,
+                       "threads_per_process": threads_per_process,
+                       "epochs": epoch_stats,
+                       "model_metrics": model.get_metrics(reset=True)}, metrics_file, indent=2)
+        torch.save(model.state_dict(), os.path.join(serialization_dir, "weights.th"))
+        archive_model(serialization_dir, "weights.th")
+    dist.barrier()
+    dist.destroy_process_group()
+
+
+def _build_vocabulary(train_data_path: str, config: dict) -> Vocabulary:
+    """ The vocabulary of the experiment ``config``, from the token counts of its training data. """
+    counts = CorpusCounts()
+    for path in sorted({path for path, _, _ in shards(train_data_path)}):
+        counts.update(count_corpus(path, tokenizer_config=config["dataset_reader"].get("tokenizer")))
+    vocab_config = config.get("vocabulary", {})
+    return build_vocabulary(counts,
+                            max_vocab_size=vocab_config.get("max_vocab_size"),
+                            min_count=vocab_config.get("min_count"),
+                            tokens_to_add=vocab_config.get("tokens_to_add"))
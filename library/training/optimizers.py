@@ -0,0 +1,91 @@
+import math
+
+import torch
+from allennlp.training.optimizers import Optimizer
+
+
+@Optimizer.register("dense_sparse_adam")
+class DenseSparseAdam(torch.optim.Optimizer):
+    """
+    Adam that accepts both dense and sparse gradients in the same parameter groups.
+
+    Parameters with dense gradients get the usual Adam update. For parameters with sparse
+    gradients (e.g. an ``Embedding`` with ``"sparse": true``) the moments and the parameter are
+    only updated at the rows present in the gradient, as in ``torch.optim.SparseAdam``, so the
+    cost of the step scales with the number of distinct tokens in the batch rather than with the
+    vocabulary size. Rows that are absent from a batch keep their moments as they were rather
+    than decaying them.
+
+    ``torch.optim.SparseAdam`` alone cannot be used for ``TopicRNN``, which has dense parameters
+    as well. Registered as ``"dense_sparse_adam"``.
+
+    Parameters
+    ----------
+    params : ``Iterable``, required
+        Parameters or parameter groups to optimize.
+    lr : ``float``, optional (default=1e-3)
+    betas : ``Tuple[float, float]``, optional (default=(0.9, 0.999))
+    eps : ``float``, optional (default=1e-8)
+    """
+    def __init__(self, params, lr=1e-3, betas=(0.9, 0.999), eps=1e-8):
+        if not lr >= 0.0:
+            raise ValueError("Invalid learning rate: {}".format(lr))
+        if not eps >= 0.0:
+            raise ValueError("Invalid epsilon value: {}".format(eps))
+        if not 0.0 <= betas[0] < 1.0 or not 0.0 <= betas[1] < 1.0:
+            raise ValueError("Invalid beta parameters: {}".format(betas))
+        defaults = dict(lr=lr, betas=betas, eps=eps)
+        super(DenseSparseAdam, self).__init__(params, defaults)
+
+    def step(self, closure=None):
+        loss = None
+        if closure is not None:
+            loss = closure()
+
+        for group in self.param_groups:
+            beta1, beta2 = group["betas"]
+            for parameter in group["params"]:
+                if parameter.grad is None:
+                    continue
+                grad = parameter.grad.data
+
+                state = self.state[parameter]
+                if not state:
+                    state["step"] = 0
+                    state["exp_avg"] = torch.zeros_like(parameter.data)
+                    state["exp_avg_sq"] = torch.zeros_like(parameter.data)
+                state["step"] += 1
+                exp_avg, exp_avg_sq = state["exp_avg"], state["exp_avg_sq"]
+                bias_correction1 = 1 - beta1 ** state["step"]
+                bias_correction2 = 1 - beta2 ** state["step"]
+                step_size = group["lr"] * math.sqrt(bias_correction2) / bias_correction1
+
+                if grad.is_sparse:
+                    grad = grad.coalesce()
+                    indices = grad._indices()  # pylint: disable=protected-access
+                    values = grad._values()  # pylint: disable=protected-access
+                    if values.numel() == 0:
+                        continue
+
+                    def make_sparse(update_values):
+                        # pylint: disable=cell-var-from-loop
+                        return torch.sparse_coo_tensor(indices, update_values, grad.size())
+
+                    # Only the rows present in the gradient are read and written.
+                    old_exp_avg = exp_avg.sparse_mask(grad)._values()  # pylint: disable=protected-access
+                    exp_avg_update = values.sub(old_exp_avg).mul_(1 - beta1)
+                    exp_avg.add_(make_sparse(exp_avg_update))
+                    old_exp_avg_sq = exp_avg_sq.sparse_mask(grad)._values()  # pylint: disable=protected-access
+                    exp_avg_sq_update = values.pow(2).sub_(old_exp_avg_sq).mul_(1 - beta2)
+                    exp_avg_sq.add_(make_sparse(exp_avg_sq_update))
+
+                    numerator = exp_avg_update.add_(old_exp_avg)
+                    denominator = exp_avg_sq_update.add_(old_exp_avg_sq).sqrt_().add_(group["eps"])
+                    parameter.data.add_(make_sparse(numerator.div_(denominator).mul_(-step_size)))
+                else:
+                    exp_avg.mul_(beta1).add_(grad, alpha=1 - beta1)
+                    exp_avg_sq.mul_(beta2).addcmul_(grad, grad, value=1 - beta2)
+                    denominator = exp_avg_sq.sqrt().add_(group["eps"])
+                    parameter.data.addcdiv_(exp_avg, denominator, value=-step_size)
+
+        return loss
@@ -0,0 +1,139 @@
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from allennlp.common import Params
+from allennlp.common.checks import ConfigurationError
+from allennlp.data import DataIterator
+from allennlp.data.iterators import BasicIterator
+from allennlp.data.instance import Instance
+from allennlp.models.model import Model
+from allennlp.training.trainer import Trainer
+
+from library.dataset_readers.shuffling import ResumableInstances
+from library.iterators.prefetch_iterator import PrefetchIterator
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+POSITION_FILE = "data_position_epoch_{}.json"
+
+
+def check_iterator(iterator: DataIterator) -> None:
+    """
+    Raises a ``ConfigurationError`` unless the reading position of ``iterator``'s instances can
+    be saved after each of its batches.
+
+    Iterators that read ahead (``PrefetchIterator``) track the position of their last batch in
+    ``position``, provided the iterator they wrap passes this check too. The others must not
+    read ahead of the batch they yield, which only holds for ``BasicIterator`` on lazy instances
+    without ``max_instances_in_memory``: iterators that sort or group their instances first
+    (``"bucket"``, ``"document"``) read ahead of the batch they yield.
+    """
+    if isinstance(iterator, PrefetchIterator):
+        check_iterator(iterator._iterator)  # pylint: disable=protected-access
+        return
+    if type(iterator) is not BasicIterator or getattr(iterator, "_max_instances_in_memory", None) is not None:
+        raise ConfigurationError("Resumable training requires a \"basic\" iterator without "
+                                 "max_instances_in_memory (optionally wrapped by \"prefetch\"), "
+                                 "not {}.".format(type(iterator).__name__))
+
+
+def reading_position(instances: Iterable[Instance], iterator: DataIterator) -> Optional[Dict[str, Any]]:
+    """
+    Where reading ``instances`` stands after the batches ``iterator`` has yielded so far, or
+    ``None`` if the instances are not resumable. See ``check_iterator`` for the iterators this
+    supports.
+    """
+    if not isinstance(instances, ResumableInstances):
+        return None
+    check_iterator(iterator)
+    if hasattr(iterator, "position"):
+        return iterator.position
+    return instances.position()
+
+
+class ResumableTrainer(Trainer):
+    """
+    A ``Trainer`` whose mid-epoch checkpoints (``model_save_interval``) include the reading
+    position of the training data, so that a recovered run continues the interrupted epoch
+    from the next unseen batch instead of starting the next epoch. The training data must be
+    read lazily (a ``ResumableInstances``), and batched by an iterator ``check_iterator``
+    accepts; otherwise this behaves as a plain ``Trainer``.
+
+    The position is written as ``data_position_epoch_<epoch>.json`` next to the checkpoint's
+    ``training_state_epoch_<epoch>.th``.
+    """
+    def _save_checkpoint(self,
+                         epoch: Union[int, str],
+                         val_metric_per_epoch: List[float],
+                         is_best: Optional[bool] = None) -> None:
+        super(ResumableTrainer, self)._save_checkpoint(epoch, val_metric_per_epoch, is_best)
+        if self._serialization_dir is None:
+            return
+
+        # Integer epochs are saved after the epoch's last batch; there is nothing to resume.
+        position = reading_position(self._train_data, self._iterator) if isinstance(epoch, str) else None
+        if position is not None:
+            with open(os.path.join(self._serialization_dir, POSITION_FILE.format(epoch)), 'w') as position_file:
+                json.dump(position, position_file)
+
+        # Drop the positions of checkpoints that ``num_serialized_models_to_keep`` removed.
+        for name in os.listdir(self._serialization_dir):
+            match = re.match(r"data_position_epoch_([0-9\.\-]+)\.json$", name)
+            if match and not os.path.exists(os.path.join(self._serialization_dir,
+                                                         "model_state_epoch_{}.th".format(match.group(1)))):
+                os.remove(os.path.join(self._serialization_dir, name))
+
+    def _restore_checkpoint(self) -> Tuple[int, List[float]]:
+        epoch_to_return, val_metric_per_epoch = super(ResumableTrainer, self)._restore_checkpoint()
+        checkpoint = _latest_checkpoint(self._serialization_dir)
+        if checkpoint is None or not isinstance(self._train_data, ResumableInstances):
+            return epoch_to_return, val_metric_per_epoch
+
+        position_path = os.path.join(self._serialization_dir, POSITION_FILE.format(checkpoint))
+        if "." not in checkpoint or not os.path.exists(position_path):
+            return epoch_to_return, val_metric_per_epoch
+
+        with open(position_path, 'r') as position_file:
+            position = json.load(position_file)
+        self._train_data.resume_from(position)
+        epoch = int(checkpoint.split('.')[0])
+        logger.info("Resuming epoch %d from shard %d, offset %d", epoch, position["shard"], position["offset"])
+        # ``Trainer`` would move on to the next epoch after a mid-epoch checkpoint.
+        return epoch, val_metric_per_epoch
+
+    @classmethod
+    def from_params(cls,  # type: ignore
+                    model: Model,
+                    serialization_dir: str,
+                    iterator: DataIterator,
+                    train_data: Iterable[Instance],
+                    validation_data: Optional[Iterable[Instance]],
+                    params: Params) -> 'ResumableTrainer':
+        # pylint: disable=arguments-differ
+        if isinstance(train_data, ResumableInstances):
+            check_iterator(iterator)
+        trainer = Trainer.from_params(model, serialization_dir, iterator, train_data, validation_data, params)
+        # ``Trainer.from_params`` constructs a ``Trainer`` rather than ``cls``.
+        trainer.__class__ = cls
+        return trainer
+
+
+def _latest_checkpoint(serialization_dir: Optional[str]) -> Optional[str]:
+    """ The epoch label of the checkpoint ``Trainer._restore_checkpoint`` loads, if any. """
+    if serialization_dir is None or not os.path.isdir(serialization_dir):
+        return None
+    found_epochs = [re.search(r"model_state_epoch_([0-9\.\-]+)\.th", name)
+                    for name in os.listdir(serialization_dir)]
+    int_epochs: List[Any] = []
+    for match in found_epochs:
+        if match is None:
+            continue
+        pieces = match.group(1).split('.')
+        int_epochs.append([int(pieces[0]), 0] if len(pieces) == 1 else [int(pieces[0]), pieces[1]])
+    if not int_epochs:
+        return None
+    epoch, timestamp = sorted(int_epochs, reverse=True)[0]
+    return str(epoch) if timestamp == 0 else '{0}.{1}'.format(epoch, timestamp)
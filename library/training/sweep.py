@@ -0,0 +1,196 @@
+"""
+Local hyperparameter sweeps: every combination of a parameter grid is trained as its own
+``allennlp train`` process, on data that is tokenized, and a vocabulary that is built, once.
+"""
+import copy
+import csv
+import glob
+import hashlib
+import itertools
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+from allennlp.common.checks import ConfigurationError
+
+from library.vocabulary.builder import build_vocabulary, count_corpus, tokenize_corpus
+from library.vocabulary.preparation import is_up_to_date, save_prepared_vocabulary
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+RESULTS_FILE = "sweep_results.json"
+TABLE_FILE = "sweep_results.tsv"
+
+
+def expand_grid(grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """
+    Every combination of the values in ``grid``, which maps dotted config paths (e.g.
+    ``"model.topic_dim"``) to the values to try.
+    """
+    paths = sorted(grid)
+    return [dict(zip(paths, values)) for values in itertools.product(*(grid[path] for path in paths))]
+
+
+def with_overrides(config: Dict[str, Any], overrides: Dict[str, Any]) -> Dict[str, Any]:
+    """ A copy of ``config`` with the values at the dotted paths of ``overrides`` replaced. """
+    config = copy.deepcopy(config)
+    for path, value in overrides.items():
+        *parents, key = path.split(".")
+        section = config
+        for parent in parents:
+            section = section.setdefault(parent, {})
+        section[key] = value
+    return config
+
+
+def run_name(overrides: Dict[str, Any]) -> str:
+    """ A directory name for a run, e.g. ``hidden_size=300,topic_dim=50``. """
+    return ",".join("{}={}".format(path.split(".")[-1], json.dumps(value).replace("/", "_").replace(" ", ""))
+                    for path, value in sorted(overrides.items()))
+
+
+def prepare_data(config: Dict[str, Any], data_dir: str, num_workers: int = None) -> Dict[str, Any]:
+    """
+    Returns ``config`` pointed at a tokenized copy of its training and validation data
+    (``library.vocabulary.builder.tokenize_corpus``) and, unless it loads its vocabulary from a
+    ``directory_path`` already, at a prepared vocabulary built from the training data's counts.
+
+    Everything is written to ``data_dir`` under names derived from its inputs (the data file,
+    the tokenizer and the vocabulary settings), so configs that agree on them share one copy
+    and existing copies are reused. The paths written into the config are absolute.
+    """
+    config = copy.deepcopy(config)
+    # Absolute, as the configs of the runs (and so their archives) keep the paths.
+    data_dir = os.path.abspath(data_dir)
+    tokenizer_config = config["dataset_reader"].get("tokenizer")
+    vocab_config = config.get("vocabulary", {})
+    build_vocab = "directory_path" not in vocab_config
+    os.makedirs(data_dir, exist_ok=True)
+
+    vocab_key = _cache_key(config["train_data_path"], tokenizer_config, vocab_config)
+    vocab_dir = os.path.join(data_dir, "vocabulary-" + vocab_key)
+    counts = None
+    for key in ("train_data_path", "validation_data_path"):
+        if key not in config:
+            continue
+        data_path = config[key]
+        if not os.path.isfile(data_path):
+            raise ConfigurationError("Sweeps need local data files; {} is not one.".format(data_path))
+        tokenized_path = os.path.join(data_dir, "tokens-{}.jsonl".format(_cache_key(data_path, tokenizer_config)))
+        needs_counts = key == "train_data_path" and build_vocab and not is_up_to_date(vocab_dir, vocab_key)
+        if not os.path.exists(tokenized_path):
+            file_counts = tokenize_corpus(data_path, tokenized_path, tokenizer_config, num_workers=num_workers)
+            counts = file_counts if needs_counts else counts
+        elif needs_counts:
+            counts = count_corpus(tokenized_path, num_workers=num_workers)
+        config[key] = tokenized_path
+
+    if build_vocab:
+        if counts is not None:
+            vocab = build_vocabulary(counts,
+                                     max_vocab_size=vocab_config.get("max_vocab_size"),
+                                     min_count=vocab_config.get("min_count"),
+                                     tokens_to_add=vocab_config.get("tokens_to_add"))
+            save_prepared_vocabulary(vocab, vocab_dir, vocab_key)
+        config["vocabulary"] = {"directory_path": vocab_dir}
+        config["model"]["prepared_vocabulary"] = vocab_dir
+    return config
+
+
+def run_sweep(config: Dict[str, Any],
+              grid: Dict[str, List[Any]],
+              serialization_dir: str,
+              num_parallel: int = None,
+              threads_per_run: int = 1,
+              preprocessing_workers: int = None,
+              include_package: str = "library") -> List[Dict[str, Any]]:
+    """
+    Trains ``config`` with every combination of ``grid`` (see ``expand_grid``) and returns,
+    and writes to ``sweep_results.json`` and ``sweep_results.tsv``, the final metrics of
+    every run.
+
+    The data is prepared once up front (``prepare_data``). Then ``num_parallel`` runs (by
+    default as many as fit ``threads_per_run`` threads each on the CPUs) train at a time, each
+    in its own ``allennlp train`` process limited to ``threads_per_run`` intra-op threads.
+    Run ``<name>`` is serialized to ``<serialization_dir>/runs/<name>`` with its output in
+    ``runs/<name>.log``. Runs that finished in an earlier sweep are not trained again and
+    interrupted ones are recovered.
+    """
+    data_dir = os.path.join(serialization_dir, "data")
+    runs_dir = os.path.join(serialization_dir, "runs")
+    os.makedirs(runs_dir, exist_ok=True)
+
+    runs = []
+    for overrides in expand_grid(grid):
+        run_config = prepare_data(with_overrides(config, overrides), data_dir, preprocessing_workers)
+        runs.append((os.path.join(runs_dir, run_name(overrides)), run_config, overrides))
+
+    num_parallel = num_parallel or max(1, (os.cpu_count() or 1) // threads_per_run)
+    logger.info("Training %d runs, %d at a time with %d threads each", len(runs), num_parallel, threads_per_run)
+    with ThreadPoolExecutor(num_parallel) as pool:
+        results = list(pool.map(lambda run: _train(run, threads_per_run, include_package), runs))
+
+    write_results(results, serialization_dir)
+    return results
+
+
+def write_results(results: List[Dict[str, Any]], serialization_dir: str) -> None:
+    """ Writes the results of ``run_sweep`` as JSON and as a table with a row per run. """
+    with open(os.path.join(serialization_dir, RESULTS_FILE), 'w') as results_file:
+        json.dump(results, results_file, indent=2)
+
+    paths = sorted({path for result in results for path in result["overrides"]})
+    metric_names = sorted({name for result in results for name, value in result["metrics"].items()
+                           if isinstance(value, (int, float))})
+    with open(os.path.join(serialization_dir, TABLE_FILE), 'w') as table_file:
+        writer = csv.writer(table_file, delimiter="\t", lineterminator="\n")
+        writer.writerow(["run", "status", "seconds"] + paths + metric_names)
+        for result in results:
+            writer.writerow([result["run"], result["status"], "{:.1f}".format(result["seconds"])] +
+                            [json.dumps(result["overrides"].get(path)) for path in paths] +
+                            [result["metrics"].get(name, "") for name in metric_names])
+
+
+def _train(run: Tuple[str, Dict[str, Any], Dict[str, Any]], threads: int, include_package: str) -> Dict[str, Any]:
+    run_dir, config, overrides = run
+    metrics_file = os.path.join(run_dir, "metrics.json")
+    start = time.perf_counter()
+    if os.path.exists(metrics_file):
+        status = "done"
+    else:
+        config_file = run_dir + ".json"
+        with open(config_file, 'w') as config_out:
+            json.dump(config, config_out, indent=2)
+        command = [sys.executable, "-m", "allennlp.run", "train", config_file, "-s", run_dir,
+                   "--include-package", include_package]
+        if glob.glob(os.path.join(run_dir, "training_state_epoch_*")):
+            command.append("--recover")
+        else:
+            # Interrupted before its first checkpoint: nothing to recover, and ``allennlp train``
+            # refuses to start over in a non-empty serialization directory.
+            shutil.rmtree(run_dir, ignore_errors=True)
+        env = dict(os.environ, OMP_NUM_THREADS=str(threads), MKL_NUM_THREADS=str(threads))
+        with open(run_dir + ".log", 'a') as log_file:
+            return_code = subprocess.call(command, stdout=log_file, stderr=subprocess.STDOUT, env=env)
+        status = "done" if return_code == 0 and os.path.exists(metrics_file) else "failed"
+        logger.info("%s %s after %.0fs", os.path.basename(run_dir), status, time.perf_counter() - start)
+
+    metrics: Dict[str, Any] = {}
+    if os.path.exists(metrics_file):
+        with open(metrics_file, 'r') as metrics_in:
+            metrics = json.load(metrics_in)
+    return {"run": os.path.basename(run_dir), "status": status, "seconds": time.perf_counter() - start,
+            "overrides": overrides, "metrics": metrics}
+
+
+def _cache_key(data_path: str, *configs: Any) -> str:
+    """ Identifies ``data_path`` (by path, size and modification time) together with ``configs``. """
+    stat = os.stat(data_path)
+    key = json.dumps([os.path.abspath(data_path), stat.st_size, stat.st_mtime, configs], sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
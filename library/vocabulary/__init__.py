@@ -0,0 +1 @@
+from library.vocabulary import builder, preparation
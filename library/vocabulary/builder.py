@@ -0,0 +1,222 @@
+import logging
+import multiprocessing
+import os
+import shutil
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Tuple, Union
+
+import ujson
+from allennlp.common import Params
+from allennlp.common.util import END_SYMBOL, START_SYMBOL
+from allennlp.data.tokenizers import Token, Tokenizer, WordTokenizer
+from allennlp.data.vocabulary import Vocabulary
+
+from library.dataset_readers.shuffling import line_aligned_ranges
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+# Each worker tokenizes this many reviews per call to ``batch_tokenize``.
+_TOKENIZER_BATCH_SIZE = 1000
+
+# Set in each worker process by ``_initialize_worker``.
+_WORKER_TOKENIZER = None
+
+
+class CorpusCounts:
+    """
+    Token and label counts of a corpus, mergeable across workers with ``update``.
+    """
+    def __init__(self) -> None:
+        self.tokens: Counter = Counter()
+        self.labels: Counter = Counter()
+        self.num_documents = 0
+
+    def update(self, other: 'CorpusCounts') -> 'CorpusCounts':
+        self.tokens.update(other.tokens)
+        self.labels.update(other.labels)
+        self.num_documents += other.num_documents
+        return self
+
+    @property
+    def num_tokens(self) -> int:
+        return sum(self.tokens.values())
+
+
+def build_tokenizer(tokenizer_config: Dict[str, Any] = None) -> Tokenizer:
+    """ The tokenizer ``IMDBReviewReader`` uses for the given ``tokenizer`` config. """
+    if tokenizer_config is None:
+        return WordTokenizer(start_tokens=[START_SYMBOL], end_tokens=[END_SYMBOL])
+    return Tokenizer.from_params(Params(dict(tokenizer_config)))
+
+
+def count_corpus(path: str,
+                 tokenizer_config: Dict[str, Any] = None,
+                 lowercase: bool = True,
+                 num_workers: int = None) -> CorpusCounts:
+    """
+    Counts every token of every review in a ``.jsonl`` corpus exactly once.
+
+    The file is split into line-aligned byte ranges that the workers stream and tokenize
+    independently, so reviews are never sent between processes; only the per-range counters
+    are, and they are merged as they arrive. With ``num_workers=1`` everything runs in-process.
+
+    Parameters
+    ----------
+    path : ``str``, required
+        A corpus in the format of ``scripts/generate_imdb_corpus.py``, or a copy of one
+        written by ``tokenize_corpus``.
+    tokenizer_config : ``Dict[str, Any]``, optional
+        The dataset reader's ``tokenizer`` config; by default the reader's own default.
+    lowercase : ``bool``, optional (default=``True``)
+        Whether tokens are lowercased, as by the readers' default token indexer.
+    num_workers : ``int``, optional
+        Defaults to the number of CPUs.
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    # More ranges than workers so that uneven ranges balance out.
+    ranges = line_aligned_ranges(path, num_workers * 4)
+    tasks = [(path, start, end, lowercase) for start, end in ranges]
+
+    counts = CorpusCounts()
+    if num_workers == 1:
+        _initialize_worker(tokenizer_config)
+        for task in tasks:
+            counts.update(_count_range(task))
+    else:
+        with multiprocessing.Pool(num_workers, initializer=_initialize_worker,
+                                  initargs=(tokenizer_config,)) as pool:
+            for range_counts in pool.imap_unordered(_count_range, tasks):
+                counts.update(range_counts)
+    logger.info("Counted %d tokens in %d documents of %s.", counts.num_tokens, counts.num_documents, path)
+    return counts
+
+
+def tokenize_corpus(path: str,
+                    output_path: str,
+                    tokenizer_config: Dict[str, Any] = None,
+                    lowercase: bool = True,
+                    num_workers: int = None) -> CorpusCounts:
+    """
+    Writes a copy of a ``.jsonl`` corpus to ``output_path`` in which every review's ``text`` is
+    replaced by its ``tokens``, which the readers then take as they are instead of tokenizing
+    again, and counts the corpus like ``count_corpus`` on the way.
+
+    The workers tokenize line-aligned ranges of the file as in ``count_corpus``, each writing
+    its own part file; the parts are then joined in order, so the copy keeps the reviews in
+    their original order.
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    ranges = line_aligned_ranges(path, num_workers * 4)
+    part_paths = ["{}.part{}".format(output_path, i) for i in range(len(ranges))]
+    tasks = [(path, start, end, lowercase, part_path) for (start, end), part_path in zip(ranges, part_paths)]
+
+    counts = CorpusCounts()
+    if num_workers == 1:
+        _initialize_worker(tokenizer_config)
+        for task in tasks:
+            counts.update(_tokenize_range(task))
+    else:
+        with multiprocessing.Pool(num_workers, initializer=_initialize_worker,
+                                  initargs=(tokenizer_config,)) as pool:
+            for range_counts in pool.imap_unordered(_tokenize_range, tasks):
+                counts.update(range_counts)
+
+    # Joined under a temporary name and renamed, so that a partial copy is never mistaken for
+    # a finished one.
+    with open(output_path + ".tmp", 'wb') as output_file:
+        for part_path in part_paths:
+            with open(part_path, 'rb') as part_file:
+                shutil.copyfileobj(part_file, output_file)
+            os.remove(part_path)
+    os.rename(output_path + ".tmp", output_path)
+    logger.info("Tokenized %d documents of %s into %s.", counts.num_documents, path, output_path)
+    return counts
+
+
+def build_vocabulary(counts: CorpusCounts,
+                     max_vocab_size: Union[int, Dict[str, int]] = None,
+                     min_count: Dict[str, int] = None,
+                     tokens_to_add: Dict[str, List[str]] = None) -> Vocabulary:
+    """
+    A ``Vocabulary`` over the "tokens" and "labels" namespaces of ``counts``, with the same
+    options as the ``vocabulary`` section of an experiment config. Ties in frequency are
+    broken alphabetically so the result does not depend on the number of workers.
+    """
+    counter = {
+            "tokens": _sorted_counts(counts.tokens),
+            "labels": _sorted_counts(counts.labels),
+    }
+    return Vocabulary(counter=counter,
+                      min_count=min_count,
+                      max_vocab_size=max_vocab_size,
+                      tokens_to_add=tokens_to_add)
+
+
+def _sorted_counts(counter: Counter) -> Dict[str, int]:
+    # ``Vocabulary`` sorts by count with a stable sort, so insertion order breaks ties.
+    return dict(sorted(counter.items(), key=lambda item: (-item[1], item[0])))
+
+
+def _initialize_worker(tokenizer_config: Dict[str, Any]) -> None:
+    global _WORKER_TOKENIZER  # pylint: disable=global-statement
+    _WORKER_TOKENIZER = build_tokenizer(tokenizer_config)
+
+
+def _count_range(task: Tuple[str, int, int, bool]) -> CorpusCounts:
+    """ Counts the reviews on the lines starting within ``[start, end)`` of ``path``. """
+    path, start, end, lowercase = task
+    counts = CorpusCounts()
+    for example, tokens in _tokenized_reviews(path, start, end):
+        _count_review(counts, example, tokens, lowercase)
+    return counts
+
+
+def _tokenize_range(task: Tuple[str, int, int, bool, str]) -> CorpusCounts:
+    """ Like ``_count_range``, also writing the tokenized reviews to ``output_path``. """
+    path, start, end, lowercase, output_path = task
+    counts = CorpusCounts()
+    with open(output_path, 'w') as output_file:
+        for example, tokens in _tokenized_reviews(path, start, end):
+            _count_review(counts, example, tokens, lowercase)
+            del example['text']
+            example['tokens'] = [token.text for token in tokens]
+            output_file.write(ujson.dumps(example, ensure_ascii=False) + "\n")
+    return counts
+
+
+def _count_review(counts: CorpusCounts, example: Dict[str, Any], tokens: List[Token], lowercase: bool) -> None:
+    counts.num_documents += 1
+    if 'sentiment' in example:
+        counts.labels["positive" if example['sentiment'] >= 5 else "negative"] += 1
+    if lowercase:
+        counts.tokens.update(token.text.lower() for token in tokens)
+    else:
+        counts.tokens.update(token.text for token in tokens)
+
+
+def _tokenized_reviews(path: str, start: int, end: int) -> Iterator[Tuple[Dict[str, Any], List[Token]]]:
+    """ The reviews on the lines starting within ``[start, end)`` of ``path``, with their tokens. """
+    examples: List[Dict[str, Any]] = []
+
+    def tokenize() -> Iterator[Tuple[Dict[str, Any], List[Token]]]:
+        # Reviews written by ``tokenize_corpus`` carry their tokens already.
+        tokenized = iter(_WORKER_TOKENIZER.batch_tokenize([example['text'] for example in examples
+                                                           if 'tokens' not in example]))
+        for example in examples:
+            if 'tokens' in example:
+                yield example, [Token(text) for text in example['tokens']]
+            else:
+                yield example, next(tokenized)
+
+    with open(path, 'rb') as data_file:
+        data_file.seek(start)
+        while data_file.tell() < end:
+            line = data_file.readline().strip()
+            if not line:
+                continue
+            examples.append(ujson.loads(line))
+            if len(examples) == _TOKENIZER_BATCH_SIZE:
+                yield from tokenize()
+                examples = []
+    if examples:
+        yield from tokenize()
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import logging
+import os
+from typing import NamedTuple
+
+import torch
+from allennlp.common.checks import ConfigurationError
+from allennlp.data.vocabulary import DEFAULT_OOV_TOKEN, DEFAULT_PADDING_TOKEN, Vocabulary
+
+from library.dataset_readers.util import STOP_WORDS
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+STOPLESS_NAMESPACE = "stopless"
+
+# Bump whenever the contents or layout of the artifact change.
+ARTIFACT_VERSION = 1
+METADATA_FILE = "topic_rnn_vocabulary.json"
+TENSORS_FILE = "topic_rnn_vocabulary.th"
+
+_STOP_WORD_SET = frozenset(STOP_WORDS)
+
+
+class VocabularyTensors(NamedTuple):
+    """
+    Index maps ``TopicRNN`` needs on top of its ``Vocabulary``, all over the "tokens" namespace.
+
+    full_to_stopless : ``torch.LongTensor``
+        The stopless index of every token; stop words (and padding) map to 0.
+    is_stop : ``torch.ByteTensor``
+        1 for stop words, 0 otherwise.
+    stop_indices : ``torch.LongTensor``
+        The indices of the stop words in the vocabulary.
+    """
+    full_to_stopless: torch.LongTensor
+    is_stop: torch.ByteTensor
+    stop_indices: torch.LongTensor
+
+
+def add_stopless_namespace(vocab: Vocabulary) -> Vocabulary:
+    """
+    Adds the "stopless" namespace (every non-stop word of "tokens", in index order) to ``vocab``
+    unless it already exists. Padding and OOV keep indices 0 and 1 in both namespaces.
+    """
+    if STOPLESS_NAMESPACE in vocab._token_to_index:  # pylint: disable=protected-access
+        return vocab
+    tokens_to_index = vocab.get_token_to_index_vocabulary("tokens")
+    assert tokens_to_index[DEFAULT_PADDING_TOKEN] == 0 and tokens_to_index[DEFAULT_OOV_TOKEN] == 1
+    for token in tokens_to_index:
+        if token not in _STOP_WORD_SET:
+            vocab.add_token_to_namespace(token, STOPLESS_NAMESPACE)
+    return vocab
+
+
+def compute_vocabulary_tensors(vocab: Vocabulary) -> VocabularyTensors:
+    """ Builds the ``VocabularyTensors`` of a vocabulary that has a "stopless" namespace. """
+    if STOPLESS_NAMESPACE not in vocab._token_to_index:  # pylint: disable=protected-access
+        raise ConfigurationError("The vocabulary has no \"stopless\" namespace; "
+                                 "prepare it with scripts/prepare_vocabulary.py.")
+    stopless_to_index = vocab.get_token_to_index_vocabulary(STOPLESS_NAMESPACE)
+    index_to_token = vocab.get_index_to_token_vocabulary("tokens")
+    tokens = [index_to_token[index] for index in range(len(index_to_token))]
+
+    full_to_stopless = torch.LongTensor([stopless_to_index.get(token, 0) for token in tokens])
+    is_stop = torch.ByteTensor([int(token in _STOP_WORD_SET) for token in tokens])
+    stop_indices = is_stop.nonzero().view(-1)
+    return VocabularyTensors(full_to_stopless, is_stop, stop_indices)
+
+
+def stop_words_digest() -> str:
+    return hashlib.sha1("\n".join(STOP_WORDS).encode()).hexdigest()
+
+
+def save_prepared_vocabulary(vocab: Vocabulary, directory: str, cache_key: str = None) -> VocabularyTensors:
+    """
+    Adds the stopless namespace to ``vocab`` and writes the vocabulary, its
+    ``VocabularyTensors`` and a versioned metadata file to ``directory``. The result can be used
+    as ``"vocabulary": {"directory_path": directory}`` and as ``TopicRNN``'s
+    ``prepared_vocabulary``.
+    """
+    add_stopless_namespace(vocab)
+    tensors = compute_vocabulary_tensors(vocab)
+    vocab.save_to_files(directory)
+    torch.save(tensors._asdict(), os.path.join(directory, TENSORS_FILE))
+    with open(os.path.join(directory, METADATA_FILE), 'w') as metadata_file:
+        json.dump({
+                "version": ARTIFACT_VERSION,
+                "cache_key": cache_key,
+                "stop_words": stop_words_digest(),
+                "tokens_size": vocab.get_vocab_size("tokens"),
+                "stopless_size": vocab.get_vocab_size(STOPLESS_NAMESPACE),
+        }, metadata_file, indent=2)
+    logger.info("Wrote prepared vocabulary to %s", directory)
+    return tensors
+
+
+def read_metadata(directory: str) -> dict:
+    """ The metadata of a prepared vocabulary, or ``{}`` if there is none. """
+    path = os.path.join(directory, METADATA_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as metadata_file:
+        return json.load(metadata_file)
+
+
+def is_up_to_date(directory: str, cache_key: str = None) -> bool:
+    """ Whether ``directory`` holds a prepared vocabulary of this version for ``cache_key``. """
+    metadata = read_metadata(directory)
+    return (metadata.get("version") == ARTIFACT_VERSION and
+            metadata.get("stop_words") == stop_words_digest() and
+            metadata.get("cache_key") == cache_key and
+            os.path.exists(os.path.join(directory, TENSORS_FILE)))
+
+
+def load_vocabulary_tensors(directory: str, vocab: Vocabulary) -> VocabularyTensors:
+    """
+    Loads the ``VocabularyTensors`` saved by ``save_prepared_vocabulary``, checking that they
+    were prepared by this version and match ``vocab``.
+    """
+    metadata = read_metadata(directory)
+    if not metadata:
+        raise ConfigurationError("No prepared vocabulary found in {}; "
+                                 "run scripts/prepare_vocabulary.py.".format(directory))
+    if metadata.get("version") != ARTIFACT_VERSION or metadata.get("stop_words") != stop_words_digest():
+        raise ConfigurationError("{} was prepared by a different version; "
+                                 "rerun scripts/prepare_vocabulary.py.".format(directory))
+    if metadata["tokens_size"] != vocab.get_vocab_size("tokens") or \
+            metadata["stopless_size"] != vocab.get_vocab_size(STOPLESS_NAMESPACE):
+        raise ConfigurationError("The prepared vocabulary in {} does not match the model's "
+                                 "vocabulary.".format(directory))
+    return VocabularyTensors(**torch.load(os.path.join(directory, TENSORS_FILE), map_location="cpu"))
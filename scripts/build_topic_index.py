@@ -0,0 +1,112 @@
+import argparse
+import logging
+
+import torch
+import ujson
+from allennlp.common.util import END_SYMBOL, START_SYMBOL
+from allennlp.data.dataset import Batch
+from allennlp.data.fields import TextField
+from allennlp.data.instance import Instance
+from allennlp.data.token_indexers import SingleIdTokenIndexer
+from allennlp.data.tokenizers import WordTokenizer
+from allennlp.models.archival import load_archive
+from tqdm import tqdm
+
+from library.index.topic_index import RandomProjectionIndex, TopicIndex
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+def main():
+    """
+    Bulk-infers the topic proportions ``mu`` of every review in a ``.jsonl`` corpus with a
+    trained TopicRNN archive and appends them to a ``TopicIndex``.
+
+    Running the script again against an existing index appends to it, so new documents can be
+    added as they arrive. With ``--approximate``, a random-projection LSH index is built instead
+    of the exact one.
+
+    Each line of the corpus is expected to be of the form produced by
+    ``scripts/generate_imdb_corpus.py``:
+    {
+      "id": The unique ID given to each review,
+      "text": The raw text of the review.
+      ...
+    }
+    """
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--archive-file", type=str, required=True,
+                        help="Path to a trained TopicRNN model.tar.gz.")
+    parser.add_argument("--data-path", type=str, required=True,
+                        help="Path to the .jsonl corpus to index.")
+    parser.add_argument("--index-dir", type=str, required=True,
+                        help="Directory of the index to create or append to.")
+    parser.add_argument("--batch-size", type=int, default=256,
+                        help="Number of reviews to infer per forward pass.")
+    parser.add_argument("--metric", type=str, default="cosine", choices=["cosine", "dot"],
+                        help="Similarity used when the index is first created.")
+    parser.add_argument("--approximate", action="store_true",
+                        help="Build a random-projection LSH index.")
+    parser.add_argument("--num-tables", type=int, default=8,
+                        help="Number of LSH tables (with --approximate).")
+    parser.add_argument("--num-bits", type=int, default=16,
+                        help="Number of hyperplanes per LSH table (with --approximate).")
+    args = parser.parse_args()
+
+    archive = load_archive(args.archive_file)
+    model = archive.model
+    model.eval()
+
+    if args.approximate:
+        index = RandomProjectionIndex(args.index_dir, model.topic_dim, args.metric,
+                                      num_tables=args.num_tables, num_bits=args.num_bits)
+    else:
+        index = TopicIndex(args.index_dir, model.topic_dim, args.metric)
+
+    num_before = len(index)
+    for ids, mu in infer_topic_proportions(model, args.data_path, args.batch_size):
+        index.add(ids, mu)
+    logger.info("Indexed %d documents (%d total).", len(index) - num_before, len(index))
+
+
+def infer_topic_proportions(model, data_path, batch_size):
+    """
+    Yields ``(ids, mu)`` for consecutive batches of reviews in ``data_path`` where ``mu`` is a
+    float32 array of shape ``(batch, topic_dim)``.
+    """
+    # Mirrors the defaults of the IMDB dataset readers.
+    tokenizer = WordTokenizer(start_tokens=[START_SYMBOL], end_tokens=[END_SYMBOL])
+    token_indexers = {"tokens": SingleIdTokenIndexer(namespace="tokens", lowercase_tokens=True)}
+
+    def flush(ids, instances):
+        batch = Batch(instances)
+        batch.index_instances(model.vocab)
+        tensor_dict = batch.as_tensor_dict()
+        with torch.no_grad():
+            _, mu, _ = model.compute_variational_parameters(tensor_dict['frequency_tokens'])
+        return ids, mu.cpu().numpy()
+
+    ids = []
+    instances = []
+    with open(data_path, 'r') as data_file:
+        for line in tqdm(data_file):
+            line = line.strip("\n")
+            if not line:
+                continue
+            example = ujson.loads(line)
+            tokens = tokenizer.tokenize(example['text'])
+            ids.append(example['id'])
+            instances.append(Instance({'frequency_tokens': TextField(tokens, token_indexers)}))
+            if len(instances) == batch_size:
+                yield flush(ids, instances)
+                ids = []
+                instances = []
+    if instances:
+        yield flush(ids, instances)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(name)s - %(message)s',
+                        level=logging.INFO)
+    main()
@@ -0,0 +1,57 @@
+import argparse
+import logging
+
+from allennlp.common import Params
+
+from library.vocabulary.builder import build_vocabulary, count_corpus
+from library.vocabulary.preparation import save_prepared_vocabulary
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+def main():
+    """
+    Builds the vocabulary of an experiment straight from its raw ``.jsonl`` training data,
+    reading the file once and tokenizing it in parallel.
+
+    Unlike building the vocabulary from the dataset reader's instances, where every BPTT chunk
+    of a review recounts the whole review through its ``frequency_tokens``, every token is
+    counted exactly once. The reader's ``tokenizer`` and the config's ``max_vocab_size``,
+    ``min_count`` and ``tokens_to_add`` are honored.
+
+    The output directory is a prepared vocabulary (see ``scripts/prepare_vocabulary.py``),
+    usable as ``"vocabulary": {"directory_path": <output dir>}`` and as the model's
+    ``prepared_vocabulary``.
+    """
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("config_file", type=str,
+                        help="The experiment JSON whose reader, training data and vocabulary settings to use.")
+    parser.add_argument("--output-dir", type=str, required=True,
+                        help="Where to write the vocabulary.")
+    parser.add_argument("--data-path", type=str, default=None,
+                        help="Corpus to count instead of the config's train_data_path.")
+    parser.add_argument("--num-workers", type=int, default=None,
+                        help="Tokenizing processes (defaults to the number of CPUs).")
+    args = parser.parse_args()
+
+    params = Params.from_file(args.config_file)
+    reader_config = params.pop("dataset_reader").as_dict(quiet=True)
+    vocab_config = params.pop("vocabulary", {}).as_dict(quiet=True)
+    data_path = args.data_path or params.pop("train_data_path")
+
+    counts = count_corpus(data_path,
+                          tokenizer_config=reader_config.get("tokenizer"),
+                          num_workers=args.num_workers)
+    vocab = build_vocabulary(counts,
+                             max_vocab_size=vocab_config.get("max_vocab_size"),
+                             min_count=vocab_config.get("min_count"),
+                             tokens_to_add=vocab_config.get("tokens_to_add"))
+    save_prepared_vocabulary(vocab, args.output_dir)
+    logger.info("Kept %d of %d distinct tokens.", vocab.get_vocab_size("tokens"), len(counts.tokens))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(name)s - %(message)s',
+                        level=logging.INFO)
+    main()
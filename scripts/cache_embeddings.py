@@ -0,0 +1,43 @@
+import argparse
+import logging
+
+from allennlp.data.vocabulary import Vocabulary
+
+from library.modules.pretrained_embeddings import DEFAULT_CACHE_DIRECTORY, convert_embeddings, read_embeddings
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+def main():
+    """
+    Converts a pretrained embedding file (GloVe or word2vec text, optionally gzipped) into the
+    cache the ``"cached_embedding"`` token embedder reads, ahead of training, so that parallel
+    runs such as those of a sweep do not all parse the file at once.
+
+    With ``--vocabulary``, the rows of that vocabulary are cached too.
+    """
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("embeddings_file", type=str,
+                        help="The pretrained embedding file.")
+    parser.add_argument("--embedding-dim", type=int, required=True,
+                        help="The dimension of the vectors.")
+    parser.add_argument("--cache-directory", type=str, default=DEFAULT_CACHE_DIRECTORY,
+                        help="Where converted files are kept.")
+    parser.add_argument("--vocabulary", type=str, default=None,
+                        help="A vocabulary directory whose rows to cache as well.")
+    parser.add_argument("--namespace", type=str, default="tokens",
+                        help="The namespace of --vocabulary the embedding is indexed by.")
+    args = parser.parse_args()
+
+    directory = convert_embeddings(args.embeddings_file, args.embedding_dim, args.cache_directory)
+    logger.info("%s is converted in %s", args.embeddings_file, directory)
+    if args.vocabulary:
+        vocab = Vocabulary.from_files(args.vocabulary)
+        read_embeddings(args.embeddings_file, args.embedding_dim, vocab, args.namespace, args.cache_directory)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(name)s - %(message)s',
+                        level=logging.INFO)
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import json
+import logging
+import math
+import time
+
+import torch
+from allennlp.commands.evaluate import evaluate
+from allennlp.data import DataIterator, DatasetReader
+from allennlp.models.archival import load_archive
+
+from library.inference.quantization import model_size_in_bytes, quantize_model
+
+
+def main():
+    """
+    Validates dynamic int8 quantization of a trained TopicRNN archive against its fp32 model.
+
+    Both models are evaluated on the same data with the same random seed (TopicRNN samples
+    topic proportions in ``forward``). The report, printed as JSON, contains the perplexity
+    and, for classification archives, sentiment accuracy of each model and their deltas, the
+    wall-clock evaluation time of each and the serialized model sizes.
+    """
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--archive-file", type=str, required=True,
+                        help="Path to a trained TopicRNN model.tar.gz.")
+    parser.add_argument("--data-path", type=str, default="tests/fixtures/smoke.jsonl",
+                        help="The .jsonl file to evaluate on.")
+    parser.add_argument("--seed", type=int, default=1337,
+                        help="Random seed used for both evaluations.")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="Number of intra-op threads to use.")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    archive = load_archive(args.archive_file)
+    config = archive.config
+
+    dataset_reader = DatasetReader.from_params(config.pop("dataset_reader"))
+    instances = dataset_reader.read(args.data_path)
+    iterator = DataIterator.from_params(config.pop("iterator"))
+
+    fp32_model = archive.model.cpu()
+    fp32_model.eval()
+    int8_model = quantize_model(fp32_model)
+    iterator.index_with(fp32_model.vocab)
+
+    report = {}
+    for name, model in [("fp32", fp32_model), ("int8", int8_model)]:
+        torch.manual_seed(args.seed)
+        start = time.perf_counter()
+        metrics = evaluate(model, instances, iterator, -1)
+        elapsed = time.perf_counter() - start
+        report[name] = {
+            "perplexity": math.exp(metrics["cross_entropy"]),
+            "sentiment_accuracy": metrics.get("sentiment"),
+            "seconds": elapsed,
+            "size_bytes": model_size_in_bytes(model),
+        }
+
+    report["delta"] = {
+        "perplexity": report["int8"]["perplexity"] - report["fp32"]["perplexity"],
+        "speedup": report["fp32"]["seconds"] / report["int8"]["seconds"],
+        "size_ratio": report["int8"]["size_bytes"] / report["fp32"]["size_bytes"],
+    }
+    if report["fp32"]["sentiment_accuracy"] is not None:
+        report["delta"]["sentiment_accuracy"] = (report["int8"]["sentiment_accuracy"] -
+                                                 report["fp32"]["sentiment_accuracy"])
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(name)s - %(message)s',
+                        level=logging.INFO)
+    main()
@@ -0,0 +1,34 @@
+import argparse
+import logging
+
+from allennlp.models.archival import load_archive
+
+from library.inference.torchscript import export
+
+
+def main():
+    """
+    Exports the inference path of a trained TopicRNN archive as a self-contained TorchScript
+    artifact.
+
+    The output directory will contain ``topic_rnn.pt``, loadable with plain ``torch.jit.load``,
+    and ``vocab.txt``, the "tokens" vocabulary with one token per line in index order.
+    See ``library.inference.torchscript.load_exported``.
+    """
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--archive-file", type=str, required=True,
+                        help="Path to a trained TopicRNN model.tar.gz.")
+    parser.add_argument("--output-dir", type=str, required=True,
+                        help="Directory to write the exported model and vocab to.")
+    args = parser.parse_args()
+
+    model = load_archive(args.archive_file).model
+    model.eval()
+    export(model, args.output_dir)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(name)s - %(message)s',
+                        level=logging.INFO)
+    main()
@@ -0,0 +1,65 @@
+import argparse
+import logging
+
+import torch
+from allennlp.data.tokenizers import WordTokenizer
+from allennlp.models.archival import load_archive
+
+from library.inference.generation import TopicRNNGenerator
+
+
+def main():
+    """
+    Samples text from a trained TopicRNN archive.
+
+    Each ``--seed`` is tokenized and continued ``--num-sequences`` times, conditioned on the
+    topic proportions inferred from it. Without seeds, topic proportions are drawn from the
+    prior.
+    """
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--archive-file", type=str, required=True,
+                        help="Path to a trained TopicRNN model.tar.gz.")
+    parser.add_argument("--seed", type=str, action="append", default=None,
+                        help="Seed text to continue; may be given multiple times.")
+    parser.add_argument("--num-sequences", type=int, default=1,
+                        help="Number of sequences to sample per seed.")
+    parser.add_argument("--max-length", type=int, default=50,
+                        help="Maximum number of tokens to generate.")
+    parser.add_argument("--strategy", type=str, default="nucleus",
+                        choices=["greedy", "top_k", "nucleus"],
+                        help="Decoding strategy.")
+    parser.add_argument("--top-k", type=int, default=10,
+                        help="Candidates kept with top_k sampling.")
+    parser.add_argument("--top-p", type=float, default=0.9,
+                        help="Probability mass kept with nucleus sampling.")
+    parser.add_argument("--temperature", type=float, default=1.0,
+                        help="Softmax temperature.")
+    parser.add_argument("--random-seed", type=int, default=1337,
+                        help="Random seed used when sampling.")
+    args = parser.parse_args()
+
+    torch.manual_seed(args.random_seed)
+    model = load_archive(args.archive_file).model
+    model.eval()
+
+    seeds = None
+    if args.seed:
+        tokenizer = WordTokenizer()
+        seeds = [[token.text for token in tokenizer.tokenize(text)] for text in args.seed]
+
+    generator = TopicRNNGenerator(model)
+    for tokens in generator.generate(seeds,
+                                     num_sequences=args.num_sequences,
+                                     max_length=args.max_length,
+                                     strategy=args.strategy,
+                                     top_k=args.top_k,
+                                     top_p=args.top_p,
+                                     temperature=args.temperature):
+        print(" ".join(tokens))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(name)s - %(message)s',
+                        level=logging.INFO)
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+
+from allennlp.common import Params
+from allennlp.common.util import ensure_list
+from allennlp.data import DatasetReader
+from allennlp.data.vocabulary import Vocabulary
+
+from library.dataset_readers import imdb_review_reader  # pylint: disable=unused-import
+from library.vocabulary.preparation import is_up_to_date, save_prepared_vocabulary
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+def main():
+    """
+    Builds the vocabulary of an experiment once, together with what ``TopicRNN`` derives from
+    it (the "stopless" namespace, the full-to-stopless index map and the stop word ids), and
+    writes it to ``--output-dir`` as a versioned artifact.
+
+    Point the experiment at the result with
+        "vocabulary": {"directory_path": <output dir>}
+    and, under "model",
+        "prepared_vocabulary": <output dir>
+
+    The artifact is keyed on the reader and vocabulary configuration and on the training data
+    file, so rerunning the script is a no-op unless one of them (or the stop word list) changed.
+    """
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("config_file", type=str,
+                        help="The experiment JSON whose reader, training data and vocabulary settings to use.")
+    parser.add_argument("--output-dir", type=str, required=True,
+                        help="Where to write the prepared vocabulary.")
+    parser.add_argument("--force", action="store_true",
+                        help="Rebuild even if an up-to-date artifact exists.")
+    args = parser.parse_args()
+
+    params = Params.from_file(args.config_file)
+    vocab_params = params.pop("vocabulary", {})
+    vocab_params.pop("directory_path", None)
+    train_data_path = params.pop("train_data_path")
+    reader_params = params.pop("dataset_reader")
+    cache_key = compute_cache_key(reader_params.as_dict(quiet=True), train_data_path,
+                                  vocab_params.as_dict(quiet=True))
+
+    if not args.force and is_up_to_date(args.output_dir, cache_key):
+        logger.info("%s is up to date.", args.output_dir)
+        return
+
+    reader = DatasetReader.from_params(reader_params)
+    instances = ensure_list(reader.read(train_data_path))
+    vocab = Vocabulary.from_params(vocab_params, instances)
+    save_prepared_vocabulary(vocab, args.output_dir, cache_key)
+
+
+def compute_cache_key(reader_config: dict, train_data_path: str, vocab_config: dict) -> str:
+    """ Identifies the inputs a vocabulary is built from. """
+    data_stamp = None
+    if os.path.exists(train_data_path):
+        stat = os.stat(train_data_path)
+        data_stamp = [stat.st_size, stat.st_mtime]
+    key = json.dumps([reader_config, train_data_path, data_stamp, vocab_config], sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(name)s - %(message)s',
+                        level=logging.INFO)
+    main()
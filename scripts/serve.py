@@ -0,0 +1,52 @@
+import argparse
+import logging
+
+import torch
+
+from library.inference.server import TopicRNNBatchPredictor, serve
+
+
+def main():
+    """
+    Serves topic proportions and sentiment probabilities of a trained TopicRNN archive over
+    HTTP, coalescing concurrent requests into micro-batches.
+
+    ``POST /predict`` takes ``{"text": "..."}`` or ``{"texts": [...]}``; ``GET /metrics``
+    reports latency percentiles and the batch-size histogram. With ``--processes``, the model
+    is loaded once into shared memory and that many forked processes serve the port. Keep
+    ``--processes * --num-workers * --threads`` at most the number of physical cores.
+    """
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--archive-file", type=str, required=True,
+                        help="Path to a trained TopicRNN model.tar.gz.")
+    parser.add_argument("--host", type=str, default="127.0.0.1",
+                        help="Interface to listen on.")
+    parser.add_argument("--port", type=int, default=8000,
+                        help="Port to listen on.")
+    parser.add_argument("--max-batch-size", type=int, default=32,
+                        help="The most reviews per forward pass.")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0,
+                        help="How long a batch waits for more requests after its first.")
+    parser.add_argument("--num-workers", type=int, default=1,
+                        help="Batches run concurrently per process.")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="Forked server processes sharing the model's weights.")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="Intra-op threads to use.")
+    parser.add_argument("--max-length", type=int, default=400,
+                        help="Reviews are truncated to this many tokens.")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    predictor = TopicRNNBatchPredictor.from_archive(args.archive_file, args.max_length,
+                                                    share_memory=args.processes > 1)
+    serve(predictor, args.host, args.port, args.max_batch_size, args.max_wait_ms, args.num_workers,
+          args.processes)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(name)s - %(message)s',
+                        level=logging.INFO)
+    main()
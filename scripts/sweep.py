@@ -0,0 +1,69 @@
+import argparse
+import json
+import logging
+import os
+import sys
+
+from allennlp.common import Params
+
+from library.training.sweep import TABLE_FILE, run_sweep
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+def main():
+    """
+    Trains an experiment with every combination of a parameter grid on the local machine.
+
+    The grid maps dotted config paths to the values to try, e.g.
+        {"model.topic_dim": [50, 100, 200], "dataset_reader.words_per_instance": [35, 70]}
+
+    The training and validation data are tokenized once, and the vocabulary is built once
+    (unless the config loads it from a ``directory_path``), into ``<serialization dir>/data``,
+    which all runs read. Runs then train in parallel in separate processes, each limited to
+    ``--threads-per-run`` threads; keep ``--parallel * --threads-per-run`` at most the number
+    of physical cores. The final metrics of all runs are collected into
+    ``<serialization dir>/sweep_results.tsv``. Rerunning the sweep skips finished runs.
+    """
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("config_file", type=str,
+                        help="The base experiment JSON.")
+    parser.add_argument("--grid", type=str, required=True,
+                        help="The parameter grid, as JSON or the path of a JSON file.")
+    parser.add_argument("-s", "--serialization-dir", type=str, required=True,
+                        help="Where to write the shared data, the runs and the results.")
+    parser.add_argument("--parallel", type=int, default=None,
+                        help="Runs to train at a time (defaults to the CPUs divided by --threads-per-run).")
+    parser.add_argument("--threads-per-run", type=int, default=1,
+                        help="Intra-op threads of each run.")
+    parser.add_argument("--preprocessing-workers", type=int, default=None,
+                        help="Tokenizing processes (defaults to the number of CPUs).")
+    parser.add_argument("--include-package", type=str, default="library",
+                        help="Package the runs import to register their components.")
+    args = parser.parse_args()
+
+    if os.path.exists(args.grid):
+        with open(args.grid, 'r') as grid_file:
+            grid = json.load(grid_file)
+    else:
+        grid = json.loads(args.grid)
+    config = Params.from_file(args.config_file).as_dict(quiet=True)
+
+    results = run_sweep(config, grid, args.serialization_dir,
+                        num_parallel=args.parallel,
+                        threads_per_run=args.threads_per_run,
+                        preprocessing_workers=args.preprocessing_workers,
+                        include_package=args.include_package)
+    with open(os.path.join(args.serialization_dir, TABLE_FILE), 'r') as table_file:
+        sys.stdout.write(table_file.read())
+    failed = [result["run"] for result in results if result["status"] != "done"]
+    if failed:
+        logger.error("%d runs failed: %s", len(failed), ", ".join(failed))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(name)s - %(message)s',
+                        level=logging.INFO)
+    main()
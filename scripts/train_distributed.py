@@ -0,0 +1,45 @@
+import argparse
+import logging
+
+import torch.multiprocessing as mp
+
+from library.training.distributed import train_worker
+
+
+def main():
+    """
+    Trains a TopicRNN experiment with local multi-process data parallelism over the ``gloo``
+    backend, for CPU-only machines where a single ``allennlp train`` process leaves most cores
+    idle.
+
+    The experiment config is the same one ``allennlp train`` takes; ``batch_size`` under
+    ``iterator`` is the global batch size and is split evenly across processes. Intra-op threads
+    are capped per process so that ``--num-processes * --threads-per-process`` should not exceed
+    the number of physical cores.
+    """
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("config_file", type=str,
+                        help="Path to the experiment's JSON configuration.")
+    parser.add_argument("-s", "--serialization-dir", type=str, required=True,
+                        help="Directory for the trained model, loss curve and metrics.")
+    parser.add_argument("--num-processes", type=int, default=4,
+                        help="Number of data-parallel processes.")
+    parser.add_argument("--threads-per-process", type=int, default=1,
+                        help="Intra-op threads per process.")
+    parser.add_argument("--port", type=int, default=29500,
+                        help="Local port for the process group rendezvous.")
+    parser.add_argument("--seed", type=int, default=1337,
+                        help="Random seed.")
+    args = parser.parse_args()
+
+    mp.spawn(train_worker,
+             args=(args.num_processes, args.config_file, args.serialization_dir,
+                   args.port, args.threads_per_process, args.seed),
+             nprocs=args.num_processes)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(name)s - %(message)s',
+                        level=logging.INFO)
+    main()
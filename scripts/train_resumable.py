@@ -0,0 +1,41 @@
+import argparse
+import logging
+
+from allennlp.commands import train
+from allennlp.common.util import import_submodules
+
+from library.training.resumable import ResumableTrainer
+
+
+def main():
+    """
+    ``allennlp train`` with a ``ResumableTrainer``: with a lazy dataset reader and
+    ``model_save_interval`` set under ``trainer``, mid-epoch checkpoints also record the
+    reading position, and ``--recover`` continues the interrupted epoch from the next unseen
+    batch without re-reading what was already trained on.
+    """
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("param_path", type=str,
+                        help="Path to the experiment's JSON configuration.")
+    parser.add_argument("-s", "--serialization-dir", type=str, required=True,
+                        help="Directory for the checkpoints and the trained model.")
+    parser.add_argument("-r", "--recover", action="store_true",
+                        help="Recover training from the state in --serialization-dir.")
+    parser.add_argument("-o", "--overrides", type=str, default="",
+                        help="A JSON structure used to override the experiment configuration.")
+    parser.add_argument("--file-friendly-logging", action="store_true",
+                        help="Outputs tqdm status on separate lines and slows tqdm refresh rate.")
+    args = parser.parse_args()
+
+    import_submodules("library")
+    # ``train_model`` builds its trainer with ``Trainer.from_params``.
+    train.Trainer = ResumableTrainer
+    train.train_model_from_file(args.param_path, args.serialization_dir, args.overrides,
+                                args.file_friendly_logging, args.recover)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(name)s - %(message)s',
+                        level=logging.INFO)
+    main()
@@ -0,0 +1,50 @@
+# pylint: disable=invalid-name
+import json
+import os
+import time
+
+from allennlp.common.testing import AllenNlpTestCase
+
+from library.common.profiling import StageProfiler
+
+
+class TestStageProfiler(AllenNlpTestCase):
+    def run_batches(self, profiler, num_batches):
+        for _ in range(num_batches):
+            profiler.step()
+            with profiler.stage("encoder"):
+                time.sleep(0.01)
+            with profiler.stage("loss"):
+                pass
+
+    def test_records_every_stage_of_every_batch(self):
+        trace_file = os.path.join(self.TEST_DIR, "trace.json")
+        profiler = StageProfiler(enabled=True, trace_file=trace_file, trace_start_batch=1, trace_num_batches=2)
+        self.run_batches(profiler, 4)
+
+        report = profiler.get_report()
+        assert list(report) == ["encoder", "loss"]
+        assert report["encoder"]["calls"] == 4
+        assert report["encoder"]["mean_ms"] >= 10
+        assert report["encoder"]["total_ms"] >= 40
+        assert report["loss"]["mean_ms"] < report["encoder"]["mean_ms"]
+
+        metrics = profiler.get_metrics(reset=True)
+        assert set(metrics) == {"profile_encoder_ms", "profile_loss_ms"}
+        assert metrics["profile_encoder_ms"] == report["encoder"]["mean_ms"]
+        assert profiler.get_report() == {}
+
+        # Batches 1 and 2, two stages each.
+        with open(trace_file, 'r') as trace:
+            events = json.load(trace)["traceEvents"]
+        assert [event["args"]["batch"] for event in events] == [1, 1, 2, 2]
+
+    def test_disabled_profiler_records_nothing(self):
+        trace_file = os.path.join(self.TEST_DIR, "trace.json")
+        profiler = StageProfiler(enabled=False, trace_file=trace_file, trace_start_batch=0, trace_num_batches=1)
+        self.run_batches(profiler, 3)
+
+        assert profiler.stage("encoder") is profiler.stage("loss")
+        assert profiler.get_report() == {}
+        assert profiler.get_metrics() == {}
+        assert not os.path.exists(trace_file)
@@ -0,0 +1,64 @@
+# pylint: disable=invalid-name
+import itertools
+import json
+import os
+
+from allennlp.common.testing import AllenNlpTestCase
+
+from library.dataset_readers.imdb_review_reader import IMDBReviewReader
+
+
+class TestShuffling(AllenNlpTestCase):
+    DATASET_PATH = 'tests/fixtures/smoke_labeled.jsonl'
+
+    def setUp(self):
+        super(TestShuffling, self).setUp()
+        # Labeled corpora are written all-positive then all-negative.
+        with open(self.DATASET_PATH, 'r') as data_file:
+            examples = [json.loads(line) for line in data_file if line.strip()]
+        examples.sort(key=lambda example: example['sentiment'] < 5)
+        self.sorted_path = os.path.join(self.TEST_DIR, "sorted.jsonl")
+        with open(self.sorted_path, 'w') as sorted_file:
+            for example in examples:
+                sorted_file.write(json.dumps(example) + "\n")
+
+    def positive_fractions(self, reader, batch_size=50):
+        labels = [instance.fields['sentiment'].label == "positive"
+                  for instance in reader.read(self.sorted_path)]
+        return [sum(labels[start:start + batch_size]) / len(labels[start:start + batch_size])
+                for start in range(0, len(labels), batch_size)]
+
+    def test_lazy_shuffling_balances_labels_per_batch(self):
+        in_order = IMDBReviewReader(lazy=True, words_per_instance=5, classification_mode=True)
+        assert self.positive_fractions(in_order)[0] == 1.0
+
+        shuffled = IMDBReviewReader(lazy=True, words_per_instance=5, classification_mode=True,
+                                    shuffle_buffer_size=200, num_shards=100, seed=1337)
+        for fraction in self.positive_fractions(shuffled):
+            assert 0.1 <= fraction <= 0.9
+
+        # Every read draws a new order over the same instances.
+        def texts():
+            return [" ".join(token.text for token in instance.fields['input_tokens'].tokens)
+                    for instance in shuffled.read(self.sorted_path)]
+        first, second = texts(), texts()
+        assert first != second
+        assert sorted(first) == sorted(second)
+
+    def test_resuming_continues_where_reading_stopped(self):
+        def reader():
+            return IMDBReviewReader(lazy=True, words_per_instance=20, shuffle_buffer_size=100,
+                                    num_shards=10, seed=1337)
+
+        def texts(instances):
+            return [" ".join(token.text for token in instance.fields['input_tokens'].tokens)
+                    for instance in instances]
+
+        expected = texts(reader().read(self.sorted_path))
+        interrupted = reader().read(self.sorted_path)
+        consumed = texts(itertools.islice(iter(interrupted), 123))
+        position = json.loads(json.dumps(interrupted.position()))
+
+        resumed = reader().read(self.sorted_path)
+        resumed.resume_from(position)
+        assert consumed + texts(resumed) == expected
@@ -0,0 +1,93 @@
+# pylint: disable=invalid-name
+import numpy as np
+import pytest
+from allennlp.common.testing import AllenNlpTestCase
+
+from library.index.topic_index import RandomProjectionIndex, TopicIndex
+
+
+class TestTopicIndex(AllenNlpTestCase):
+    def setUp(self):
+        super(TestTopicIndex, self).setUp()
+        rng = np.random.RandomState(0)
+        self.vectors = rng.randn(1000, 10).astype(np.float32)
+        self.ids = np.arange(1000) * 7
+
+    def brute_force(self, query, k):
+        normalized = self.vectors / np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        scores = normalized @ (query / np.linalg.norm(query))
+        return self.ids[np.argsort(-scores)[:k]]
+
+    def test_blocked_search_matches_brute_force(self):
+        index = TopicIndex(str(self.TEST_DIR / "exact"), dim=10)
+        index.add(self.ids, self.vectors)
+        ids, scores = index.search(self.vectors[:5], k=4, block_size=64)
+
+        assert ids.shape == (5, 4)
+        assert np.all(np.diff(scores, axis=1) <= 0)
+        for query, found in zip(self.vectors[:5], ids):
+            assert found.tolist() == self.brute_force(query, 4).tolist()
+
+    def test_incremental_appends_survive_reopening(self):
+        directory = str(self.TEST_DIR / "appended")
+        index = TopicIndex(directory, dim=10)
+        index.add(self.ids[:600], self.vectors[:600])
+        TopicIndex(directory).add(self.ids[600:], self.vectors[600:])
+
+        reopened = TopicIndex(directory)
+        assert len(reopened) == 1000
+        ids, _ = reopened.search(self.vectors[999], k=1)
+        assert ids[0, 0] == self.ids[999]
+
+    def test_approximate_index_finds_exact_duplicates(self):
+        index = RandomProjectionIndex(str(self.TEST_DIR / "lsh"), dim=10, num_tables=4, num_bits=8)
+        index.add(self.ids[:500], self.vectors[:500])
+        index.add(self.ids[500:], self.vectors[500:])
+        ids, _ = index.search(self.vectors[[3, 700]], k=1)
+        assert ids[:, 0].tolist() == [self.ids[3], self.ids[700]]
+
+    def test_approximate_search_scores_bucket_candidates_exactly(self):
+        index = RandomProjectionIndex(str(self.TEST_DIR / "buckets"), dim=10, num_tables=8, num_bits=2)
+        index.add(self.ids, self.vectors)
+        ids, scores = index.search(self.vectors[:20], k=5)
+
+        assert ids.shape == (20, 5)
+        assert np.all(np.diff(scores, axis=1) <= 0)
+        # Two bits per table put about a quarter of the rows in every bucket, so eight tables
+        # almost surely cover the true neighbors.
+        for query, found in zip(self.vectors[:20], ids):
+            assert found.tolist() == self.brute_force(query, 5).tolist()
+
+    def test_interrupted_append_is_cut_off(self):
+        directory = str(self.TEST_DIR / "interrupted")
+        index = RandomProjectionIndex(directory, dim=10, num_tables=4, num_bits=8)
+        index.add(self.ids[:500], self.vectors[:500])
+        # An append that wrote part of its data before crashing, without updating the metadata.
+        for name, row_bytes in (("vectors.f32", 40), ("ids.i64", 8), ("codes.u64", 32)):
+            with open(str(self.TEST_DIR / "interrupted" / name), 'ab') as data_file:
+                data_file.write(b"\x01" * row_bytes * 3)
+
+        RandomProjectionIndex(directory).add(self.ids[500:], self.vectors[500:])
+        reopened = RandomProjectionIndex(directory)
+        assert len(reopened) == 1000
+        assert np.asarray(reopened.ids).tolist() == self.ids.tolist()
+        ids, _ = reopened.search(self.vectors[[3, 700]], k=1)
+        assert ids[:, 0].tolist() == [self.ids[3], self.ids[700]]
+
+        with pytest.raises(ValueError):
+            TopicIndex(directory).add(self.ids[:1], self.vectors[:1])
+
+    def test_rejected_add_leaves_the_index_unchanged(self):
+        directory = str(self.TEST_DIR / "rejected")
+        index = RandomProjectionIndex(directory, dim=10, num_tables=4, num_bits=8)
+        index.add(self.ids[:500], self.vectors[:500])
+        with pytest.raises(ValueError):
+            index.add(self.ids[500:503], self.vectors[500:510])
+        ids, _ = index.search(self.vectors[[3]], k=1)
+        assert ids[:, 0].tolist() == [self.ids[3]]
+
+        index.add(self.ids[500:], self.vectors[500:])
+        for reopened in (index, RandomProjectionIndex(directory)):
+            assert len(reopened) == 1000
+            ids, _ = reopened.search(self.vectors[[3, 700]], k=1)
+            assert ids[:, 0].tolist() == [self.ids[3], self.ids[700]]
@@ -0,0 +1,51 @@
+# pylint: disable=invalid-name,protected-access
+import pytest
+import torch
+from allennlp.common.checks import ConfigurationError
+from allennlp.common.testing import AllenNlpTestCase
+from allennlp.common.util import END_SYMBOL, ensure_list
+from allennlp.data.vocabulary import Vocabulary
+from allennlp.modules.seq2seq_encoders import PytorchSeq2SeqWrapper
+from allennlp.modules.text_field_embedders import BasicTextFieldEmbedder
+from allennlp.modules.token_embedders import Embedding
+
+from library.dataset_readers.imdb_review_reader import IMDBReviewReader
+from library.inference.generation import TopicRNNGenerator
+from library.models.topic_rnn import TopicRNN
+from library.vocabulary.preparation import add_stopless_namespace
+
+
+class TestTopicRNNGenerator(AllenNlpTestCase):
+    def setUp(self):
+        super(TestTopicRNNGenerator, self).setUp()
+        torch.manual_seed(0)
+        instances = ensure_list(IMDBReviewReader(words_per_instance=20).read('tests/fixtures/smoke.jsonl'))[:16]
+        self.vocab = add_stopless_namespace(Vocabulary.from_instances(instances))
+        embedder = BasicTextFieldEmbedder({"tokens": Embedding(self.vocab.get_vocab_size("tokens"), 8)})
+        encoder = PytorchSeq2SeqWrapper(torch.nn.GRU(8, 6, batch_first=True))
+        self.model = TopicRNN(self.vocab, embedder, encoder, topic_dim=3).eval()
+        self.generator = TopicRNNGenerator(self.model)
+        self.end_bias = self.model.vocabulary_projection_layer._module.bias[self.vocab.get_token_index(END_SYMBOL)]
+
+    def test_sampling_is_seeded_and_bounded_by_max_length(self):
+        with torch.no_grad():
+            self.end_bias.fill_(-1e4)
+        samples = []
+        for _ in range(2):
+            torch.manual_seed(3)
+            samples.append(self.generator.generate(seeds=[["the", "movie"], ["a"]], num_sequences=2,
+                                                   max_length=7, strategy="top_k", top_k=5))
+        assert samples[0] == samples[1]
+        assert len(samples[0]) == 4
+        assert all(len(tokens) == 7 for tokens in samples[0])
+
+    def test_generation_stops_at_the_end_symbol(self):
+        with torch.no_grad():
+            self.end_bias.fill_(1e4)
+        assert self.generator.generate(theta=torch.zeros(2, 3), max_length=7) == [[], []]
+
+    def test_theta_must_match_the_topics_and_seeds(self):
+        with pytest.raises(ConfigurationError):
+            self.generator.generate(theta=torch.zeros(1, 4))
+        with pytest.raises(ConfigurationError):
+            self.generator.generate(seeds=[["the"], ["a"]], theta=torch.zeros(1, 3))
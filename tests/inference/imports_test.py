@@ -0,0 +1,14 @@
+# pylint: disable=invalid-name
+import subprocess
+import sys
+
+from allennlp.common.testing import AllenNlpTestCase
+
+
+class TestImports(AllenNlpTestCase):
+    def test_inference_package_imports_without_allennlp(self):
+        # A fresh interpreter in which importing anything from AllenNLP fails.
+        code = "import sys\nsys.modules['allennlp'] = None\nimport library.inference"
+        result = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, universal_newlines=True)
+        assert result.returncode == 0, result.stdout
@@ -0,0 +1,58 @@
+# pylint: disable=invalid-name
+import torch
+from allennlp.common.testing import AllenNlpTestCase
+from allennlp.common.util import ensure_list
+from allennlp.data.dataset import Batch
+from allennlp.data.vocabulary import Vocabulary
+from allennlp.modules.seq2seq_encoders import PytorchSeq2SeqWrapper
+from allennlp.modules.text_field_embedders import BasicTextFieldEmbedder
+from allennlp.modules.token_embedders import Embedding
+
+from library.dataset_readers.imdb_review_reader import IMDBReviewReader
+from library.inference.quantization import quantize_model
+from library.models.topic_rnn import TopicRNN
+from library.vocabulary.preparation import add_stopless_namespace
+
+
+def relative_error(actual, expected):
+    return ((actual - expected).norm() / expected.norm()).item()
+
+
+class TestQuantization(AllenNlpTestCase):
+    def setUp(self):
+        super(TestQuantization, self).setUp()
+        torch.manual_seed(0)
+        instances = ensure_list(IMDBReviewReader(words_per_instance=20).read('tests/fixtures/smoke.jsonl'))[:16]
+        vocab = add_stopless_namespace(Vocabulary.from_instances(instances))
+        embedder = BasicTextFieldEmbedder({"tokens": Embedding(vocab.get_vocab_size("tokens"), 8)})
+        encoder = PytorchSeq2SeqWrapper(torch.nn.LSTM(8, 6, batch_first=True))
+        self.model = TopicRNN(vocab, embedder, encoder, topic_dim=3).eval()
+        batch = Batch(instances)
+        batch.index_instances(vocab)
+        self.tensors = batch.as_tensor_dict()
+
+    def test_quantized_model_stays_close_to_fp32(self):
+        model, tensors = self.model, self.tensors
+        quantized = quantize_model(model)
+        assert not any(type(module) in (torch.nn.Linear, torch.nn.LSTM) for module in quantized.modules())
+        # The model itself is left as it was.
+        # pylint: disable=protected-access
+        assert type(model.vocabulary_projection_layer._module) is torch.nn.Linear
+
+        with torch.no_grad():
+            _, mu, _ = quantized.compute_variational_parameters(tensors["frequency_tokens"])
+            _, expected_mu, _ = model.compute_variational_parameters(tensors["frequency_tokens"])
+            torch.manual_seed(1)
+            loss = quantized(**tensors)["loss"]
+            torch.manual_seed(1)
+            expected_loss = model(**tensors)["loss"]
+        assert relative_error(mu, expected_mu) < 0.1
+        assert relative_error(loss, expected_loss) < 0.1
+
+    def test_quantized_model_with_sparse_term_frequencies_takes_the_dense_path(self):
+        self.model.sparse_term_frequencies = True
+        quantized = quantize_model(self.model)
+        with torch.no_grad():
+            _, mu, _ = quantized.compute_variational_parameters(self.tensors["frequency_tokens"])
+            _, expected_mu, _ = self.model.compute_variational_parameters(self.tensors["frequency_tokens"])
+        assert relative_error(mu, expected_mu) < 0.1
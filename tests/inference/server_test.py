@@ -0,0 +1,53 @@
+# pylint: disable=invalid-name
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from allennlp.common.testing import AllenNlpTestCase
+
+from library.inference.server import InferenceServer, MicroBatcher, request
+
+
+class TestInferenceServer(AllenNlpTestCase):
+    def setUp(self):
+        super(TestInferenceServer, self).setUp()
+        self.batches = []
+
+        def predict_batch(texts):
+            self.batches.append(len(texts))
+            time.sleep(0.01)
+            return [{"length": len(text)} for text in texts]
+
+        self.loop = asyncio.new_event_loop()
+        self.server = InferenceServer(MicroBatcher(predict_batch, max_batch_size=8, max_wait_ms=20), port=0)
+        self.loop.run_until_complete(self.server.start())
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        asyncio.run_coroutine_threadsafe(self.server.stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        super(TestInferenceServer, self).tearDown()
+
+    def test_concurrent_requests_are_batched(self):
+        def predict(length):
+            return request("127.0.0.1", self.server.port, "POST", "/predict", {"text": "x" * length})
+
+        with ThreadPoolExecutor(16) as pool:
+            responses = list(pool.map(predict, range(32)))
+        assert responses == [(200, {"length": length}) for length in range(32)]
+        assert max(self.batches) > 1
+        assert max(self.batches) <= 8
+
+        status, metrics = request("127.0.0.1", self.server.port, "GET", "/metrics")
+        assert status == 200
+        assert metrics["requests"] == 32
+        assert sum(size * count for size, count in
+                   ((int(size), count) for size, count in metrics["batch_sizes"].items())) == 32
+        assert metrics["latency_ms"]["p50"] <= metrics["latency_ms"]["p99"]
+
+        assert request("127.0.0.1", self.server.port, "POST", "/predict", {"texts": ["ab", "abc"]}) == \
+            (200, {"predictions": [{"length": 2}, {"length": 3}]})
+        assert request("127.0.0.1", self.server.port, "GET", "/unknown")[0] == 404
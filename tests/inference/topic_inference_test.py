@@ -0,0 +1,49 @@
+# pylint: disable=invalid-name
+import json
+import os
+
+import torch
+from allennlp.common.testing import AllenNlpTestCase
+from allennlp.common.util import ensure_list
+from allennlp.data.dataset import Batch
+from allennlp.data.vocabulary import Vocabulary
+from allennlp.models.archival import archive_model
+from allennlp.modules.seq2seq_encoders import PytorchSeq2SeqWrapper
+from allennlp.modules.text_field_embedders import BasicTextFieldEmbedder
+from allennlp.modules.token_embedders import Embedding
+
+from library.dataset_readers.imdb_review_reader import IMDBReviewReader
+from library.inference.topic_inference import TopicInferenceNetwork
+from library.models.topic_rnn import TopicRNN
+
+
+class TestTopicInferenceNetwork(AllenNlpTestCase):
+    def test_matches_the_inference_network_of_topic_rnn(self):
+        torch.manual_seed(0)
+        instances = ensure_list(IMDBReviewReader(words_per_instance=20).read('tests/fixtures/smoke.jsonl'))[:16]
+        vocab = Vocabulary.from_instances(instances)
+        serialization_dir = os.path.join(self.TEST_DIR, "model")
+        # Saved before the model adds the "stopless" namespace, as by ``allennlp train``.
+        vocab.save_to_files(os.path.join(serialization_dir, "vocabulary"))
+        assert not os.path.exists(os.path.join(serialization_dir, "vocabulary", "stopless.txt"))
+
+        embedder = BasicTextFieldEmbedder({"tokens": Embedding(vocab.get_vocab_size("tokens"), 8)})
+        encoder = PytorchSeq2SeqWrapper(torch.nn.RNN(8, 6, batch_first=True))
+        model = TopicRNN(vocab, embedder, encoder, topic_dim=3).eval()
+        with open(os.path.join(serialization_dir, "config.json"), 'w') as config_file:
+            json.dump({"model": {"type": "topic_rnn", "topic_dim": 3}}, config_file)
+        torch.save(model.state_dict(), os.path.join(serialization_dir, "weights.th"))
+        archive_model(serialization_dir, "weights.th")
+        network = TopicInferenceNetwork.from_archive(os.path.join(serialization_dir, "model.tar.gz"))
+
+        batch = Batch(instances)
+        batch.index_instances(vocab)
+        frequency_tokens = batch.as_tensor_dict()["frequency_tokens"]
+        documents = [[vocab.get_token_from_index(index) for index in row if index != 0]
+                     for row in frequency_tokens["tokens"].tolist()]
+        with torch.no_grad():
+            _, expected_mu, expected_log_sigma = model.compute_variational_parameters(frequency_tokens)
+        mu, sigma = network.infer(documents)
+
+        assert torch.allclose(mu, expected_mu, atol=1e-5)
+        assert torch.allclose(sigma, torch.exp(expected_log_sigma), atol=1e-5)
@@ -0,0 +1,69 @@
+# pylint: disable=invalid-name,protected-access
+import torch
+from allennlp.common.testing import AllenNlpTestCase
+from allennlp.data.vocabulary import Vocabulary
+from allennlp.modules.seq2seq_encoders import PytorchSeq2SeqWrapper
+from allennlp.modules.seq2vec_encoders import PytorchSeq2VecWrapper
+from allennlp.modules.text_field_embedders import BasicTextFieldEmbedder
+from allennlp.modules.token_embedders import Embedding
+from allennlp.nn import util
+
+from library.dataset_readers.util import STOP_WORDS
+from library.inference.torchscript import export, load_exported
+from library.models.topic_rnn import TopicRNN
+
+
+class TestTorchScriptExport(AllenNlpTestCase):
+    WORDS = ["the", "movie", "was", "a", "great", "film", "and", "i", "loved", "acting", "plot"]
+
+    def setUp(self):
+        super(TestTorchScriptExport, self).setUp()
+        torch.manual_seed(0)
+        vocab = Vocabulary()
+        for word in self.WORDS:
+            vocab.add_token_to_namespace(word, "tokens")
+        for token in vocab.get_token_to_index_vocabulary("tokens"):
+            if token not in STOP_WORDS:
+                vocab.add_token_to_namespace(token, "stopless")
+
+        embedder = BasicTextFieldEmbedder({"tokens": Embedding(vocab.get_vocab_size("tokens"), 8)})
+        encoder = PytorchSeq2SeqWrapper(torch.nn.RNN(8, 6, num_layers=2, batch_first=True))
+        self.model = TopicRNN(vocab, embedder, encoder, topic_dim=3)
+        self.model.eval()
+
+        # Second sequence is padded; "zzz" is unknown.
+        words = [["the", "movie", "was", "great", "zzz", "film"], ["i", "loved", "the", "plot"]]
+        ids = [[vocab.get_token_index(word) for word in sequence] for sequence in words]
+        self.tokens = torch.LongTensor([sequence + [0] * (6 - len(sequence)) for sequence in ids])
+
+    def test_exported_model_matches_original(self):
+        export(self.model, str(self.TEST_DIR / "export"))
+        module, token_to_index = load_exported(str(self.TEST_DIR / "export"))
+        assert token_to_index["movie"] == self.model.vocab.get_token_index("movie")
+
+        vocab_logits, mu, sigma, sentiment_probs = module(self.tokens)
+
+        model = self.model
+        tokens = {"tokens": self.tokens}
+        mask = util.get_text_field_mask(tokens)
+        with torch.no_grad():
+            mapped_term_frequencies, expected_mu, log_sigma = model.compute_variational_parameters(tokens)
+            encoded = model.text_encoder(model.text_field_embedder(tokens), mask)
+
+            topic_additions = torch.mm(expected_mu, model.beta)
+            topic_additions[:, :2] = 0
+            stopword_predictions = torch.argmax(model.stopword_projection_layer(encoded), dim=-1)
+            expected_logits = model.vocabulary_projection_layer(encoded) + \
+                (1 - stopword_predictions).unsqueeze(-1).float() * topic_additions.unsqueeze(1)
+
+            final_states = PytorchSeq2VecWrapper(model.text_encoder._module)(
+                    model.text_field_embedder(tokens), mask)
+            features = torch.cat([final_states, mapped_term_frequencies.view(2, -1)], dim=-1)
+            expected_sentiment = torch.softmax(model.sentiment_classifier(features), dim=-1)
+
+        assert torch.allclose(mu, expected_mu, atol=1e-5)
+        assert torch.allclose(sigma, torch.exp(log_sigma), atol=1e-5)
+        assert torch.allclose(sentiment_probs, expected_sentiment, atol=1e-5)
+        # Only valid time steps are comparable; the wrapper zeroes outputs at padding.
+        valid = mask.unsqueeze(-1).expand_as(vocab_logits) == 1
+        assert torch.allclose(vocab_logits.masked_select(valid), expected_logits.masked_select(valid), atol=1e-5)
@@ -0,0 +1,62 @@
+# pylint: disable=invalid-name
+from allennlp.common.testing import AllenNlpTestCase
+from allennlp.common.util import ensure_list
+from allennlp.data.vocabulary import Vocabulary
+
+from library.dataset_readers.imdb_review_reader import IMDBReviewReader
+from library.iterators.document_iterator import DocumentIterator, group_documents
+
+
+class TestDocumentIterator(AllenNlpTestCase):
+    DATASET_PATH = 'tests/fixtures/smoke.jsonl'
+
+    def setUp(self):
+        super(TestDocumentIterator, self).setUp()
+        self.instances = ensure_list(IMDBReviewReader(words_per_instance=20).read(self.DATASET_PATH))
+        self.vocab = Vocabulary.from_instances(self.instances)
+
+    def test_chunks_of_a_review_share_a_batch(self):
+        batch_size = 8
+        documents = list(group_documents(self.instances))
+        assert sum(len(document) for document in documents) == len(self.instances)
+
+        iterator = DocumentIterator(batch_size=batch_size)
+        iterator.index_with(self.vocab)
+        batches = list(iterator._create_batches(self.instances, shuffle=True))  # pylint: disable=protected-access
+        assert len(batches) == iterator.get_num_batches(self.instances)
+        assert sum(len(batch.instances) for batch in batches) == len(self.instances)
+
+        batch_of = {id(instance): i for i, batch in enumerate(batches) for instance in batch.instances}
+        for document in documents:
+            document_batches = {batch_of[id(instance)] for instance in document}
+            # Only reviews longer than a batch may be split, over consecutive batches.
+            assert len(document_batches) <= -(-len(document) // batch_size) + 1
+            if len(document) <= batch_size:
+                assert len(document_batches) == 1
+
+    def test_lazy_instances_are_not_counted(self):
+        lazy_instances = IMDBReviewReader(lazy=True, words_per_instance=20).read(self.DATASET_PATH)
+        assert DocumentIterator(batch_size=8).get_num_batches(lazy_instances) == 1
+
+    def test_reviews_are_read_in_bounded_pools(self):
+        consumed = []
+
+        def instances():
+            for instance in self.instances:
+                consumed.append(instance)
+                yield instance
+
+        longest = max(len(document) for document in group_documents(self.instances))
+        iterator = DocumentIterator(batch_size=8, max_instances_in_memory=32)
+        batch_of = {}
+        num_yielded = 0
+        batches = iterator._create_batches(instances(), shuffle=True)  # pylint: disable=protected-access
+        for i, batch in enumerate(batches):
+            batch_of.update((id(instance), i) for instance in batch.instances)
+            num_yielded += len(batch.instances)
+            # A pool, the review that did not fit in it and the first chunk of the next.
+            assert len(consumed) - num_yielded <= 32 + longest + 1
+        assert num_yielded == len(self.instances)
+        for document in group_documents(self.instances):
+            if len(document) <= 8:
+                assert len({batch_of[id(instance)] for instance in document}) == 1
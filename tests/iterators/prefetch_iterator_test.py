@@ -0,0 +1,28 @@
+# pylint: disable=invalid-name
+import random
+
+from allennlp.common.testing import AllenNlpTestCase
+from allennlp.data.iterators import BasicIterator
+from allennlp.data.vocabulary import Vocabulary
+
+from library.dataset_readers.imdb_review_reader import IMDBReviewReader
+from library.iterators.prefetch_iterator import PrefetchIterator
+
+
+class TestPrefetchIterator(AllenNlpTestCase):
+    DATASET_PATH = 'tests/fixtures/smoke.jsonl'
+
+    def test_yields_the_wrapped_iterators_batches_in_order(self):
+        reader = IMDBReviewReader(words_per_instance=20, lazy=True)
+        instances = reader.read(self.DATASET_PATH)
+        vocab = Vocabulary.from_instances(instances)
+
+        def token_batches(iterator):
+            iterator.index_with(vocab)
+            random.seed(1337)
+            return [batch['input_tokens']['tokens'].tolist()
+                    for batch in iterator(instances, num_epochs=2, shuffle=True)]
+
+        expected = token_batches(BasicIterator(batch_size=4))
+        prefetched = token_batches(PrefetchIterator(BasicIterator(batch_size=4), num_workers=3, queue_size=2))
+        assert prefetched == expected
@@ -0,0 +1,186 @@
+# pylint: disable=invalid-name
+import json
+import os
+import shutil
+
+import torch
+from allennlp.common.testing import AllenNlpTestCase
+from allennlp.common.util import ensure_list
+from allennlp.data.dataset import Batch
+from allennlp.data.vocabulary import Vocabulary
+from allennlp.models.archival import archive_model
+from allennlp.modules.seq2seq_encoders import PytorchSeq2SeqWrapper
+from allennlp.modules.text_field_embedders import BasicTextFieldEmbedder
+from allennlp.modules.token_embedders import Embedding
+
+from library.common.archives import BASE_ARCHIVE_KEY
+from library.dataset_readers.imdb_review_reader import IMDBReviewReader
+from library.dataset_readers.util import STOP_WORDS
+from library.inference.loading import load_model
+from library.models.topic_rnn import TopicRNN
+from library.vocabulary.preparation import save_prepared_vocabulary
+
+
+class TestTopicRNN(AllenNlpTestCase):
+    DATASET_PATH = 'tests/fixtures/smoke.jsonl'
+
+    def setUp(self):
+        super(TestTopicRNN, self).setUp()
+        torch.manual_seed(0)
+        instances = ensure_list(IMDBReviewReader(words_per_instance=20).read(self.DATASET_PATH))[:16]
+        vocab = Vocabulary.from_instances(instances)
+        for token in vocab.get_token_to_index_vocabulary("tokens"):
+            if token not in STOP_WORDS:
+                vocab.add_token_to_namespace(token, "stopless")
+
+        self.vocab = vocab
+        self.model = self.build_model()
+        self.model.num_samples = 2
+
+        batch = Batch(instances)
+        batch.index_instances(vocab)
+        self.batch = batch.as_tensor_dict()
+
+    def build_model(self, **kwargs):
+        embedder = BasicTextFieldEmbedder({"tokens": Embedding(self.vocab.get_vocab_size("tokens"), 8)})
+        encoder = PytorchSeq2SeqWrapper(torch.nn.RNN(8, 6, num_layers=2, batch_first=True))
+        return TopicRNN(self.vocab, embedder, encoder, topic_dim=3, **kwargs)
+
+    def loss_and_gradients(self):
+        self.model.zero_grad()
+        torch.manual_seed(1)
+        loss = self.model(**self.batch)['loss']
+        loss.backward()
+        gradients = [parameter.grad.clone() for parameter in self.model.parameters()
+                     if parameter.grad is not None]
+        return loss.item(), gradients
+
+    def baseline_loss_and_gradients(self):
+        self.model.checkpoint_activations = False
+        self.model.loss_chunk_size = None
+        return self.loss_and_gradients()
+
+    def test_chunked_loss_matches_full_loss(self):
+        self.model.train()
+        expected_loss, expected_gradients = self.baseline_loss_and_gradients()
+
+        self.model.loss_chunk_size = 7
+        loss, gradients = self.loss_and_gradients()
+
+        assert abs(loss - expected_loss) < 1e-5
+        for gradient, expected in zip(gradients, expected_gradients):
+            assert torch.allclose(gradient, expected, atol=1e-5)
+
+    def test_checkpointed_loss_matches_full_loss(self):
+        self.model.train()
+        expected_loss, expected_gradients = self.baseline_loss_and_gradients()
+
+        self.model.checkpoint_activations = True
+        loss, gradients = self.loss_and_gradients()
+
+        assert abs(loss - expected_loss) < 1e-5
+        for gradient, expected in zip(gradients, expected_gradients):
+            assert torch.allclose(gradient, expected, atol=1e-5)
+
+    def test_sparse_term_frequencies_match_dense(self):
+        self.model.eval()
+        frequency_tokens = self.batch['frequency_tokens']
+        expected = self.model.compute_variational_parameters(frequency_tokens)
+
+        self.model.sparse_term_frequencies = True
+        actual = self.model.compute_variational_parameters(frequency_tokens)
+
+        for tensor, expected_tensor in zip(actual, expected):
+            assert torch.allclose(tensor, expected_tensor, atol=1e-5)
+
+    def test_profiled_stages_are_reported_as_metrics(self):
+        self.model.eval()
+        self.model(**self.batch)
+        assert not any(name.startswith("profile_") for name in self.model.get_metrics())
+
+        profiled = self.build_model(profile=True)
+        profiled.eval()
+        profiled(**self.batch)
+        metrics = profiled.get_metrics(reset=True)
+        for stage in ("embedder", "text_encoder", "vocabulary_projection", "word_frequency_vector",
+                      "inference_network", "sampling_loop", "stopword_mask"):
+            assert metrics["profile_{}_ms".format(stage)] >= 0
+        assert not any(name.startswith("profile_") for name in profiled.get_metrics())
+
+    MODEL_CONFIG = {
+            "type": "topic_rnn",
+            "text_field_embedder": {"tokens": {"type": "embedding", "embedding_dim": 8}},
+            "text_encoder": {"type": "rnn", "input_size": 8, "hidden_size": 6, "num_layers": 2},
+            "topic_dim": 3
+    }
+
+    def write_archive(self, name, model, **model_config):
+        serialization_dir = os.path.join(self.TEST_DIR, name)
+        os.makedirs(serialization_dir)
+        with open(os.path.join(serialization_dir, "config.json"), 'w') as config_file:
+            json.dump({"model": dict(self.MODEL_CONFIG, **model_config)}, config_file)
+        self.vocab.save_to_files(os.path.join(serialization_dir, "vocabulary"))
+        torch.save(model.state_dict(), os.path.join(serialization_dir, "weights.th"))
+        archive_model(serialization_dir, "weights.th")
+        return os.path.join(serialization_dir, "model.tar.gz")
+
+    def assert_same_classification(self, model, expected_model):
+        model.eval()
+        expected_model.eval()
+        with torch.no_grad():
+            torch.manual_seed(1)
+            expected_loss = expected_model(**self.batch)['loss']
+            torch.manual_seed(1)
+            loss = model(**self.batch)['loss']
+        assert torch.allclose(loss, expected_loss, atol=1e-6)
+        assert model.get_metrics(reset=True)['sentiment'] == expected_model.get_metrics(reset=True)['sentiment']
+
+    def test_classifier_archive_loads_with_load_model(self):
+        pretrained_file = self.write_archive("pretrained", self.model)
+        classifier = self.build_model(classification_mode=True, freeze_feature_extraction=True,
+                                      pretrained_file=pretrained_file)
+        classifier.num_samples = 2
+        archive_file = self.write_archive("classifier", classifier, classification_mode=True,
+                                          freeze_feature_extraction=True, pretrained_file=pretrained_file,
+                                          num_samples=2)
+
+        # ``load_model`` builds the classifier without its ``pretrained_file``.
+        loaded = load_model(archive_file)
+        assert sorted(loaded.state_dict()) == sorted(classifier.state_dict())
+        self.assert_same_classification(loaded, classifier)
+
+    def test_delta_checkpoints_hold_the_classifier_only(self):
+        pretrained_file = self.write_archive("pretrained", self.model)
+        classifier = self.build_model(classification_mode=True, freeze_feature_extraction=True,
+                                      pretrained_file=pretrained_file, delta_checkpoints=True)
+        classifier.num_samples = 2
+        with torch.no_grad():
+            for parameter in classifier.sentiment_classifier.parameters():
+                parameter.add_(1)
+        delta = classifier.state_dict()
+        assert all(name.startswith("sentiment_classifier.") for name in delta if name != BASE_ARCHIVE_KEY)
+
+        # Built without ``pretrained_file``, as by ``load_model``: the frozen weights are read
+        # from the referenced archive.
+        loaded = self.build_model(classification_mode=True, freeze_feature_extraction=True, delta_checkpoints=True)
+        loaded.load_state_dict(delta)
+        expected = dict(torch.nn.Module.state_dict(classifier))
+        for name, tensor in torch.nn.Module.state_dict(loaded).items():
+            assert torch.equal(tensor, expected[name])
+        assert loaded.state_dict()[BASE_ARCHIVE_KEY] == delta[BASE_ARCHIVE_KEY]
+
+        archive_file = self.write_archive("classifier", classifier, classification_mode=True,
+                                          freeze_feature_extraction=True, pretrained_file=pretrained_file,
+                                          delta_checkpoints=True, num_samples=2)
+        self.assert_same_classification(load_model(archive_file), classifier)
+
+    def test_archive_loads_without_its_prepared_vocabulary(self):
+        prepared_vocabulary = os.path.join(self.TEST_DIR, "prepared")
+        save_prepared_vocabulary(self.vocab, prepared_vocabulary)
+        model = self.build_model(prepared_vocabulary=prepared_vocabulary)
+        archive_file = self.write_archive("prepared_model", model, prepared_vocabulary=prepared_vocabulary)
+        shutil.rmtree(prepared_vocabulary)
+
+        loaded = load_model(archive_file)
+        for name in ("full_to_stopless", "is_stop", "stop_indices"):
+            assert torch.equal(getattr(loaded.vocabulary_tensors, name), getattr(model.vocabulary_tensors, name))
@@ -0,0 +1,54 @@
+# pylint: disable=invalid-name
+import gzip
+import os
+
+import torch
+from allennlp.common import Params
+from allennlp.common.testing import AllenNlpTestCase
+from allennlp.data.vocabulary import Vocabulary
+from allennlp.modules.token_embedders import Embedding
+
+from library.modules.pretrained_embeddings import CachedEmbedding, read_embeddings
+
+
+class TestPretrainedEmbeddings(AllenNlpTestCase):
+    def setUp(self):
+        super(TestPretrainedEmbeddings, self).setUp()
+        self.embeddings_file = os.path.join(self.TEST_DIR, "embeddings.txt.gz")
+        self.cache_directory = os.path.join(self.TEST_DIR, "cache")
+        self.write_embeddings({"movie": [1.0, 2.0, 3.0], "film": [0.5, -0.5, 0.25], "great": [4.0, 4.0, 4.0]})
+        self.vocab = Vocabulary()
+        for word in ("movie", "was", "great"):
+            self.vocab.add_token_to_namespace(word, "tokens")
+
+    def write_embeddings(self, vectors):
+        with gzip.open(self.embeddings_file, 'wt') as embeddings_out:
+            # A word2vec header, which is skipped.
+            embeddings_out.write("{} 3\n".format(len(vectors)))
+            for word, vector in vectors.items():
+                embeddings_out.write("{} {}\n".format(word, " ".join(str(value) for value in vector)))
+
+    def test_cached_embedding_starts_like_embedding(self):
+        for _ in range(2):
+            torch.manual_seed(1)
+            cached = CachedEmbedding.from_params(self.vocab, Params({"embedding_dim": 3,
+                                                                     "pretrained_file": self.embeddings_file,
+                                                                     "cache_directory": self.cache_directory}))
+            torch.manual_seed(1)
+            embedding = Embedding.from_params(self.vocab, Params({"embedding_dim": 3,
+                                                                  "pretrained_file": self.embeddings_file}))
+            assert torch.equal(cached.weight.data, embedding.weight.data)
+        assert cached.weight.data[self.vocab.get_token_index("movie")].tolist() == [1.0, 2.0, 3.0]
+
+    def test_changed_file_or_vocabulary_is_read_again(self):
+        read_embeddings(self.embeddings_file, 3, self.vocab, cache_directory=self.cache_directory)
+        self.write_embeddings({"movie": [-1.0, -2.0, -3.0], "was": [0.0, 1.0, 0.0]})
+        # Sets the modification time explicitly, as the rewrite may fall within its resolution.
+        os.utime(self.embeddings_file, (0, 0))
+        self.vocab.add_token_to_namespace("film", "tokens")
+
+        weight = read_embeddings(self.embeddings_file, 3, self.vocab, cache_directory=self.cache_directory)
+        assert weight.size() == (self.vocab.get_vocab_size("tokens"), 3)
+        assert weight[self.vocab.get_token_index("movie")].tolist() == [-1.0, -2.0, -3.0]
+        assert weight[self.vocab.get_token_index("was")].tolist() == [0.0, 1.0, 0.0]
+        assert len(os.listdir(self.cache_directory)) == 2
@@ -0,0 +1,41 @@
+# pylint: disable=invalid-name
+import json
+import os
+import socket
+
+import torch.multiprocessing as mp
+from allennlp.common.testing import AllenNlpTestCase
+
+from library.training.distributed import train_worker
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TestDistributedTraining(AllenNlpTestCase):
+    def test_two_gloo_processes_train_the_smoke_experiment(self):
+        with open('tests/fixtures/smoke_imdb_unsupervised_training.json') as config_file:
+            config = json.load(config_file)
+        config["model"]["text_field_embedder"]["tokens"]["embedding_dim"] = 8
+        config["model"]["text_encoder"].update({"input_size": 8, "hidden_size": 6})
+        config["model"]["topic_dim"] = 3
+        # The number of batches of the "document" iterator differs between the ranks' parts.
+        config["iterator"] = {"type": "document", "batch_size": 16}
+        config_path = os.path.join(self.TEST_DIR, "experiment.json")
+        with open(config_path, 'w') as config_file:
+            json.dump(config, config_file)
+        serialization_dir = os.path.join(self.TEST_DIR, "distributed")
+
+        mp.spawn(train_worker, args=(2, config_path, serialization_dir, free_port(), 1, 1337), nprocs=2)
+
+        with open(os.path.join(serialization_dir, "loss_curve.json")) as curve_file:
+            loss_curve = json.load(curve_file)
+        with open(os.path.join(serialization_dir, "metrics.json")) as metrics_file:
+            metrics = json.load(metrics_file)
+        assert metrics["world_size"] == 2
+        assert len(loss_curve) == sum(epoch["steps"] for epoch in metrics["epochs"]) > 0
+        assert os.path.exists(os.path.join(serialization_dir, "model.tar.gz"))
+        assert os.path.exists(os.path.join(serialization_dir, "vocabulary", "stopless.txt"))
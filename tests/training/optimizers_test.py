@@ -0,0 +1,50 @@
+# pylint: disable=invalid-name
+import torch
+from allennlp.common import Params
+from allennlp.common.testing import AllenNlpTestCase
+from allennlp.training.optimizers import Optimizer
+
+from library.training.optimizers import DenseSparseAdam
+
+
+class TestDenseSparseAdam(AllenNlpTestCase):
+    def test_matches_adam_and_sparse_adam(self):
+        torch.manual_seed(0)
+        dense = torch.nn.Linear(4, 3)
+        sparse = torch.nn.Embedding(50, 4, sparse=True)
+        reference_dense = torch.nn.Linear(4, 3)
+        reference_sparse = torch.nn.Embedding(50, 4, sparse=True)
+        reference_dense.load_state_dict(dense.state_dict())
+        reference_sparse.load_state_dict(sparse.state_dict())
+
+        optimizer = DenseSparseAdam(list(dense.parameters()) + list(sparse.parameters()), lr=0.1)
+        references = [torch.optim.Adam(reference_dense.parameters(), lr=0.1),
+                      torch.optim.SparseAdam(list(reference_sparse.parameters()), lr=0.1)]
+        for _ in range(5):
+            token_ids = torch.randint(0, 50, (8,))
+            optimizer.zero_grad()
+            dense(sparse(token_ids)).pow(2).sum().backward()
+            optimizer.step()
+            for reference in references:
+                reference.zero_grad()
+            reference_dense(reference_sparse(token_ids)).pow(2).sum().backward()
+            for reference in references:
+                reference.step()
+
+        assert torch.allclose(dense.weight, reference_dense.weight, atol=1e-5)
+        assert torch.allclose(sparse.weight, reference_sparse.weight, atol=1e-5)
+
+    def test_untouched_rows_are_not_updated(self):
+        embedding = torch.nn.Embedding(50, 4, sparse=True)
+        initial = embedding.weight.detach().clone()
+        optimizer = DenseSparseAdam(embedding.parameters(), lr=0.1)
+        embedding(torch.LongTensor([3, 7])).sum().backward()
+        optimizer.step()
+
+        changed = (embedding.weight.detach() != initial).any(dim=1).nonzero().view(-1).tolist()
+        assert changed == [3, 7]
+
+    def test_is_registered(self):
+        parameters = [["weight", torch.nn.Parameter(torch.zeros(2))]]
+        optimizer = Optimizer.from_params(parameters, Params({"type": "dense_sparse_adam", "lr": 0.01}))
+        assert isinstance(optimizer, DenseSparseAdam)
@@ -0,0 +1,76 @@
+# pylint: disable=invalid-name
+import os
+
+import pytest
+import torch
+from allennlp.common.checks import ConfigurationError
+from allennlp.common.testing import AllenNlpTestCase
+from allennlp.data.iterators import BasicIterator
+from allennlp.data.vocabulary import Vocabulary
+from allennlp.models.model import Model
+
+from library.dataset_readers.imdb_review_reader import IMDBReviewReader
+from library.iterators.document_iterator import DocumentIterator
+from library.iterators.prefetch_iterator import PrefetchIterator
+from library.training.resumable import ResumableTrainer, reading_position
+
+
+class Interrupted(Exception):
+    pass
+
+
+class BatchRecorder(Model):
+    """ Records the chunks of every batch it is trained on, and is interrupted after ``num_batches``. """
+    def __init__(self, vocab: Vocabulary, num_batches: int) -> None:
+        super(BatchRecorder, self).__init__(vocab)
+        self.weight = torch.nn.Parameter(torch.zeros(1))
+        self.num_batches = num_batches
+        self.batches = []
+
+    def forward(self, input_tokens, **kwargs):  # pylint: disable=arguments-differ
+        if len(self.batches) == self.num_batches:
+            raise Interrupted()
+        self.batches.append(sorted(tuple(row) for row in input_tokens["tokens"].tolist()))
+        return {"loss": (self.weight * input_tokens["tokens"].float().mean()).sum()}
+
+
+class TestResumableTrainer(AllenNlpTestCase):
+    def setUp(self):
+        super(TestResumableTrainer, self).setUp()
+        self.dataset_path = os.path.join(self.TEST_DIR, "reviews.jsonl")
+        with open('tests/fixtures/smoke.jsonl', 'r') as data_file, open(self.dataset_path, 'w') as reviews_file:
+            reviews_file.writelines(line for _, line in zip(range(20), data_file))
+        self.vocab = Vocabulary.from_instances(self.read())
+
+    def read(self):
+        reader = IMDBReviewReader(lazy=True, words_per_instance=20, shuffle_buffer_size=16, seed=1)
+        return reader.read(self.dataset_path)
+
+    def train(self, num_batches, serialization_dir=None):
+        model = BatchRecorder(self.vocab, num_batches)
+        iterator = BasicIterator(batch_size=4)
+        iterator.index_with(self.vocab)
+        trainer = ResumableTrainer(model, torch.optim.SGD(model.parameters(), lr=0.1), iterator, self.read(),
+                                   num_epochs=1, serialization_dir=serialization_dir, model_save_interval=0)
+        with pytest.raises(Interrupted):
+            trainer.train()
+        return model.batches
+
+    def test_recovered_training_continues_from_the_next_unseen_batch(self):
+        expected = self.train(num_batches=4)
+
+        serialization_dir = os.path.join(self.TEST_DIR, "run")
+        assert self.train(num_batches=3, serialization_dir=serialization_dir) == expected[:3]
+        assert any(name.startswith("data_position_epoch_0.") for name in os.listdir(serialization_dir))
+        # Recovers from the checkpoint saved after the third batch.
+        assert self.train(num_batches=1, serialization_dir=serialization_dir) == expected[3:]
+
+    def test_iterators_that_read_ahead_are_rejected(self):
+        instances = self.read()
+        for iterator in (BasicIterator(batch_size=4), PrefetchIterator(BasicIterator(batch_size=4))):
+            # No pass has started yet.
+            assert reading_position(instances, iterator) is None
+        for iterator in (DocumentIterator(batch_size=4), PrefetchIterator(DocumentIterator(batch_size=4)),
+                         BasicIterator(batch_size=4, max_instances_in_memory=16)):
+            with pytest.raises(ConfigurationError):
+                reading_position(instances, iterator)
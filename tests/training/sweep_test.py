@@ -0,0 +1,90 @@
+# pylint: disable=invalid-name
+import json
+import os
+
+import torch
+from allennlp.common import Params
+from allennlp.common.testing import AllenNlpTestCase
+from allennlp.data.vocabulary import Vocabulary
+from allennlp.models.archival import archive_model
+from allennlp.models.model import Model
+
+import library.models  # pylint: disable=unused-import
+from library.inference.loading import load_model
+from library.training.sweep import expand_grid, prepare_data, run_name, with_overrides
+
+
+class TestSweep(AllenNlpTestCase):
+    def test_grid_expands_into_overridden_configs(self):
+        grid = {"model.topic_dim": [10, 50], "model.text_encoder.hidden_size": [100, 300], "seed": [1]}
+        combinations = expand_grid(grid)
+        assert len(combinations) == 4
+        assert {(overrides["model.topic_dim"], overrides["model.text_encoder.hidden_size"])
+                for overrides in combinations} == {(10, 100), (10, 300), (50, 100), (50, 300)}
+
+        config = {"model": {"topic_dim": 20, "text_encoder": {"type": "rnn", "hidden_size": 128}}}
+        overridden = with_overrides(config, combinations[0])
+        assert overridden == {"model": {"topic_dim": 10, "text_encoder": {"type": "rnn", "hidden_size": 100}},
+                              "seed": 1}
+        assert config["model"] == {"topic_dim": 20, "text_encoder": {"type": "rnn", "hidden_size": 128}}
+
+        assert run_name(combinations[0]) == "hidden_size=100,topic_dim=10,seed=1"
+        assert run_name({"trainer.optimizer": {"type": "adam"}, "train_data_path": "a/b c"}) == \
+                'train_data_path="a_bc",optimizer={"type":"adam"}'
+        assert len({run_name(overrides) for overrides in combinations}) == 4
+
+    def smoke_config(self):
+        data_path = os.path.join(self.TEST_DIR, "reviews.jsonl")
+        with open('tests/fixtures/smoke.jsonl', 'r') as data_file, open(data_path, 'w') as reviews_file:
+            reviews_file.writelines(line for _, line in zip(range(20), data_file))
+        with open('tests/fixtures/smoke_imdb_unsupervised_training.json', 'r') as config_file:
+            config = json.load(config_file)
+        config["train_data_path"] = config["validation_data_path"] = data_path
+        return config
+
+    def test_prepared_data_is_reused(self):
+        config = self.smoke_config()
+        data_dir = os.path.join(self.TEST_DIR, "data")
+
+        prepared = prepare_data(config, data_dir)
+        assert prepared["train_data_path"] == prepared["validation_data_path"] != data_path
+        vocab_dir = prepared["vocabulary"]["directory_path"]
+        assert prepared["model"]["prepared_vocabulary"] == vocab_dir
+        assert Vocabulary.from_files(vocab_dir).get_vocab_size("stopless") > 0
+
+        # Files the second call rewrote would get a new modification time.
+        written = [os.path.join(root, name) for root, _, names in os.walk(data_dir) for name in names]
+        for path in written:
+            os.utime(path, (0, 0))
+        assert prepare_data(config, data_dir) == prepared
+        assert sorted(os.path.join(root, name) for root, _, names in os.walk(data_dir) for name in names) == \
+                sorted(written)
+        assert all(os.path.getmtime(path) == 0 for path in written)
+
+    def test_archives_of_prepared_configs_load_from_another_directory(self):
+        config = self.smoke_config()
+        serialization_dir = os.path.join(self.TEST_DIR, "run")
+        working_dir = os.getcwd()
+        try:
+            os.chdir(str(self.TEST_DIR))
+            # A relative data directory, as given on the command line.
+            prepared = prepare_data(config, "data")
+            assert os.path.isabs(prepared["model"]["prepared_vocabulary"])
+
+            # What ``allennlp train`` archives for the run.
+            vocab = Vocabulary.from_files(prepared["vocabulary"]["directory_path"])
+            model = Model.from_params(vocab=vocab, params=Params(json.loads(json.dumps(prepared["model"]))))
+            os.makedirs(serialization_dir)
+            with open(os.path.join(serialization_dir, "config.json"), 'w') as config_file:
+                json.dump(prepared, config_file)
+            vocab.save_to_files(os.path.join(serialization_dir, "vocabulary"))
+            torch.save(model.state_dict(), os.path.join(serialization_dir, "weights.th"))
+            archive_model(serialization_dir, "weights.th")
+
+            os.makedirs("elsewhere")
+            os.chdir("elsewhere")
+            loaded = load_model(os.path.join(serialization_dir, "model.tar.gz"))
+        finally:
+            os.chdir(working_dir)
+        for name in ("full_to_stopless", "is_stop", "stop_indices"):
+            assert torch.equal(getattr(loaded.vocabulary_tensors, name), getattr(model.vocabulary_tensors, name))
@@ -0,0 +1,48 @@
+# pylint: disable=invalid-name
+import json
+import os
+from collections import Counter
+
+from allennlp.common.testing import AllenNlpTestCase
+
+from library.dataset_readers.imdb_review_reader import IMDBReviewReader
+from library.vocabulary.builder import build_tokenizer, build_vocabulary, count_corpus, tokenize_corpus
+
+
+class TestVocabularyBuilder(AllenNlpTestCase):
+    DATASET_PATH = 'tests/fixtures/smoke.jsonl'
+
+    def test_counts_every_token_once_regardless_of_workers(self):
+        tokenizer = build_tokenizer()
+        expected = Counter()
+        with open(self.DATASET_PATH, 'r') as data_file:
+            for line in data_file:
+                if line.strip():
+                    expected.update(token.text.lower() for token in tokenizer.tokenize(json.loads(line)["text"]))
+
+        for num_workers in (1, 3):
+            counts = count_corpus(self.DATASET_PATH, num_workers=num_workers)
+            assert counts.tokens == expected
+
+    def test_vocabulary_respects_max_vocab_size_and_tokens_to_add(self):
+        counts = count_corpus(self.DATASET_PATH, num_workers=1)
+        vocab = build_vocabulary(counts, max_vocab_size=50,
+                                 tokens_to_add={"labels": ["positive", "negative"]})
+
+        # Padding and OOV come on top of the 50 most frequent tokens.
+        assert vocab.get_vocab_size("tokens") == 52
+        most_common = counts.tokens.most_common(1)[0][0]
+        assert vocab.get_token_index(most_common) == 2
+        assert set(vocab.get_token_to_index_vocabulary("labels")) == {"positive", "negative"}
+
+    def test_tokenized_copy_reads_like_the_original(self):
+        tokenized_path = os.path.join(self.TEST_DIR, "tokenized.jsonl")
+        counts = tokenize_corpus(self.DATASET_PATH, tokenized_path, num_workers=3)
+        assert counts.tokens == count_corpus(self.DATASET_PATH, num_workers=1).tokens
+        assert count_corpus(tokenized_path, num_workers=1).tokens == counts.tokens
+
+        def texts(path):
+            return [[token.text for token in instance.fields["input_tokens"].tokens]
+                    for instance in IMDBReviewReader(words_per_instance=20).read(path)]
+
+        assert texts(tokenized_path) == texts(self.DATASET_PATH)
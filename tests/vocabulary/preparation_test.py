@@ -0,0 +1,52 @@
+# pylint: disable=invalid-name
+import pytest
+import torch
+from allennlp.common.checks import ConfigurationError
+from allennlp.common.testing import AllenNlpTestCase
+from allennlp.data.vocabulary import Vocabulary
+
+from library.vocabulary.preparation import (add_stopless_namespace, load_vocabulary_tensors,
+                                            save_prepared_vocabulary)
+
+
+class TestVocabularyPreparation(AllenNlpTestCase):
+    WORDS = ["the", "movie", "was", "a", "great", "film"]
+
+    def setUp(self):
+        super(TestVocabularyPreparation, self).setUp()
+        self.vocab = Vocabulary()
+        for word in self.WORDS:
+            self.vocab.add_token_to_namespace(word, "tokens")
+
+    def test_prepared_vocabulary_round_trip(self):
+        directory = str(self.TEST_DIR / "vocabulary")
+        tensors = save_prepared_vocabulary(self.vocab, directory)
+
+        vocab = Vocabulary.from_files(directory)
+        assert vocab.get_token_to_index_vocabulary("stopless") == \
+            self.vocab.get_token_to_index_vocabulary("stopless")
+        loaded = load_vocabulary_tensors(directory, vocab)
+        for name in ("full_to_stopless", "is_stop", "stop_indices"):
+            assert torch.equal(getattr(loaded, name), getattr(tensors, name))
+
+        # "the", "was" and "a" are stop words; "movie" keeps a stopless index.
+        the, movie = vocab.get_token_index("the"), vocab.get_token_index("movie")
+        assert loaded.is_stop[the] == 1 and loaded.full_to_stopless[the] == 0
+        assert loaded.is_stop[movie] == 0
+        assert loaded.full_to_stopless[movie] == vocab.get_token_index("movie", "stopless")
+        assert sorted(loaded.stop_indices.tolist()) == sorted(vocab.get_token_index(word)
+                                                               for word in ("the", "was", "a"))
+
+    def test_mismatched_vocabulary_is_rejected(self):
+        directory = str(self.TEST_DIR / "vocabulary")
+        save_prepared_vocabulary(self.vocab, directory)
+
+        other = Vocabulary()
+        other.add_token_to_namespace("movie", "tokens")
+        add_stopless_namespace(other)
+        with pytest.raises(ConfigurationError):
+            load_vocabulary_tensors(directory, other)
+
+    def test_missing_directory_is_reported_as_missing(self):
+        with pytest.raises(ConfigurationError, match="No prepared vocabulary"):
+            load_vocabulary_tensors(str(self.TEST_DIR / "missing"), add_stopless_namespace(self.vocab))